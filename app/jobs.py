@@ -0,0 +1,152 @@
+"""Coda persistente dei job di analisi asincroni (SQLite sotto ``DATA_DIR``)."""
+
+import json
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id          TEXT PRIMARY KEY,
+    status      TEXT NOT NULL,
+    payload     TEXT NOT NULL,
+    report      TEXT,
+    error       TEXT,
+    created_at  REAL NOT NULL,
+    started_at  REAL,
+    finished_at REAL,
+    owner       TEXT,
+    heartbeat_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs(status, created_at);
+"""
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class JobQueue:
+    """Coda FIFO di job persistita su SQLite.
+
+    Ogni job conserva il ``payload`` (campi del form + path dell'upload) per
+    poter essere rieseguito dopo un riavvio. Chi prende un job ne diventa
+    ``owner`` e rinnova ``heartbeat_at`` mentre lavora: solo i job ``running``
+    senza heartbeat da più di ``lease_s`` secondi (processo morto) tornano in
+    coda, così più processi API possono condividere la stessa coda.
+    """
+
+    def __init__(
+        self,
+        db_path: Path,
+        lease_s: float = 60.0,
+        owner: Optional[str] = None,
+        journal_mode: str = "WAL",
+    ):
+        self.db_path = Path(db_path)
+        self.journal_mode = journal_mode
+        self.lease_s = float(lease_s)
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._conn() as c:
+            c.executescript(_SCHEMA)
+            cols = {r["name"] for r in c.execute("PRAGMA table_info(jobs)")}
+            for col, typ in (("owner", "TEXT"), ("heartbeat_at", "REAL")):
+                if col not in cols:  # db creato da una versione precedente
+                    c.execute(f"ALTER TABLE jobs ADD COLUMN {col} {typ}")
+
+    @contextmanager
+    def _conn(self):
+        conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None)
+        try:
+            conn.execute(f"PRAGMA journal_mode={self.journal_mode}")
+            conn.row_factory = sqlite3.Row
+            yield conn
+        finally:
+            conn.close()
+
+    def submit(self, payload: Dict[str, Any], job_id: Optional[str] = None) -> str:
+        job_id = job_id or str(uuid.uuid4())
+        with self._conn() as c:
+            c.execute(
+                "INSERT INTO jobs(id, status, payload, created_at) VALUES (?, ?, ?, ?)",
+                (job_id, QUEUED, json.dumps(payload), time.time()),
+            )
+        return job_id
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """Prende in carico il job in coda più vecchio (atomico tra processi).
+
+        Prima rimette in coda i job il cui lease è scaduto.
+        """
+        now = time.time()
+        with self._conn() as c:
+            c.execute("BEGIN IMMEDIATE")
+            c.execute(
+                "UPDATE jobs SET status=?, owner=NULL, started_at=NULL, heartbeat_at=NULL "
+                "WHERE status=? AND COALESCE(heartbeat_at, started_at, 0) < ?",
+                (QUEUED, RUNNING, now - self.lease_s),
+            )
+            row = c.execute(
+                "SELECT id, payload FROM jobs WHERE status=? ORDER BY created_at LIMIT 1", (QUEUED,)
+            ).fetchone()
+            if row is None:
+                c.execute("COMMIT")
+                return None
+            c.execute(
+                "UPDATE jobs SET status=?, started_at=?, heartbeat_at=?, owner=? WHERE id=?",
+                (RUNNING, now, now, self.owner, row["id"]),
+            )
+            c.execute("COMMIT")
+        return {"id": row["id"], "payload": json.loads(row["payload"])}
+
+    def heartbeat(self, job_id: str) -> None:
+        """Rinnova il lease di un job in esecuzione da questo processo."""
+        with self._conn() as c:
+            c.execute(
+                "UPDATE jobs SET heartbeat_at=? WHERE id=? AND status=? AND owner=?",
+                (time.time(), job_id, RUNNING, self.owner),
+            )
+
+    def active_ids(self):
+        """Id dei job non ancora terminati (in coda o in esecuzione)."""
+        with self._conn() as c:
+            rows = c.execute("SELECT id FROM jobs WHERE status IN (?, ?)", (QUEUED, RUNNING)).fetchall()
+        return {r["id"] for r in rows}
+
+    def complete(self, job_id: str, report: Dict[str, Any]) -> None:
+        with self._conn() as c:
+            c.execute(
+                "UPDATE jobs SET status=?, report=?, finished_at=? WHERE id=?",
+                (DONE, json.dumps(report, ensure_ascii=False), time.time(), job_id),
+            )
+
+    def fail(self, job_id: str, error: str) -> None:
+        with self._conn() as c:
+            c.execute(
+                "UPDATE jobs SET status=?, error=?, finished_at=? WHERE id=?",
+                (FAILED, error, time.time(), job_id),
+            )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._conn() as c:
+            row = c.execute("SELECT * FROM jobs WHERE id=?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            "job_id": row["id"],
+            "status": row["status"],
+            "created_at": row["created_at"],
+            "started_at": row["started_at"],
+            "finished_at": row["finished_at"],
+            "report": json.loads(row["report"]) if row["report"] else None,
+            "error": row["error"],
+        }
+
+    def counts(self) -> Dict[str, int]:
+        with self._conn() as c:
+            rows = c.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {r["status"]: r["n"] for r in rows}
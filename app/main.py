@@ -1,15 +1,48 @@
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Depends, Request
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, Response
+from starlette.exceptions import HTTPException as StarletteHTTPException
 from fastapi.security.api_key import APIKeyHeader
 from pydantic import BaseModel
-import os, uuid, json, logging, time
+import os, io, uuid, json, logging, time, threading, asyncio, zipfile, functools, shutil
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from starlette.staticfiles import StaticFiles
 
+from prometheus_client import Counter, Gauge, REGISTRY
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
 from prometheus_fastapi_instrumentator import Instrumentator
-from idtamper.pipeline import analyze_image, AnalyzerConfig
-from idtamper.profiles import load_profile
+from idtamper.pipeline import (
+    analyze_image,
+    analyze_image_bytes,
+    create_image_pool,
+    iter_analyze_images,
+    AnalyzerConfig,
+    ARTIFACTS_FULL,
+    ARTIFACTS_NONE,
+    HEATMAPS_NPZ,
+    CONFIDENCE_CHECKS,
+)
+from idtamper.execution import (
+    ParallelConfig,
+    BoundedExecutor,
+    PoolSaturated,
+    available_cpus,
+    set_process_batching,
+    set_process_share,
+)
+from idtamper.profiles import (
+    CompiledProfile,
+    ModelNotFoundError,
+    get_compiled_profile,
+    resolve_model_path,
+)
+from idtamper import sessions as ort_sessions
+from idtamper.visualize import MAPS_FILE, render_artifact
+from idtamper.cache import ResultCache, cache_key, config_digest, image_digest
+from app.jobs import JobQueue
+from app.telemetry import observe_report
+from app.retention import RunRetention
 
 API_KEY_NAME = "x-api-key"
 api_key_header = APIKeyHeader(name=API_KEY_NAME, auto_error=False)
@@ -38,8 +71,45 @@ app = FastAPI(
     contact={"name": "Maintainers", "url": "https://github.com/mapo80/id-integrity-shield"},
 )
 
+# --- heatmap/overlay renderizzati alla prima richiesta da maps.npz, poi in LRU ---
+#   IDS_HEATMAP_FORMAT  "npz" (lazy) | "png" (codifica PNG durante l'analisi)
+#   IDS_RENDER_CACHE    PNG renderizzati tenuti in memoria
+HEATMAP_FORMAT = os.getenv("IDS_HEATMAP_FORMAT", HEATMAPS_NPZ)
+
+# IDS_CASCADE=1: check economici prima, gli altri saltati se il verdetto è già deciso
+CASCADE = os.getenv("IDS_CASCADE", "0") == "1"
+# i check a peso zero non vengono eseguiti; IDS_FULL_CONFIDENCE=1 forza quelli usati dalla confidence
+FULL_CONFIDENCE = os.getenv("IDS_FULL_CONFIDENCE", "0") == "1"
+
+@functools.lru_cache(maxsize=int(os.getenv("IDS_RENDER_CACHE", "64")))
+def _render_cached(run_dir: str, filename: str, mtime_ns: int) -> Optional[bytes]:
+    return render_artifact(run_dir, filename)
+
+def _render_lazy(p: Path) -> Optional[Response]:
+    npz = p.parent / MAPS_FILE
+    try:
+        mtime_ns = npz.stat().st_mtime_ns
+    except OSError:
+        return None
+    data = _render_cached(str(p.parent), p.name, mtime_ns)
+    return Response(content=data, media_type="image/png") if data is not None else None
+
+class _RunsFiles(StaticFiles):
+    """Static dei run con fallback al rendering lazy dei PNG mancanti."""
+
+    async def get_response(self, path: str, scope):
+        try:
+            return await super().get_response(path, scope)
+        except StarletteHTTPException as e:
+            if e.status_code != 404 or ".." in Path(path).parts:
+                raise
+            resp = await asyncio.to_thread(_render_lazy, RUNS_DIR / path)
+            if resp is None:
+                raise
+            return resp
+
 # expose analysis artifacts via static paths
-app.mount("/runs", StaticFiles(directory=RUNS_DIR), name="runs")
+app.mount("/runs", _RunsFiles(directory=RUNS_DIR), name="runs")
 
 logger = logging.getLogger("idshield")
 handler = logging.StreamHandler()
@@ -72,6 +142,10 @@ Instrumentator().instrument(app).expose(app, endpoint="/metrics")
 
 @app.get("/healthz")
 def healthz():
+    # non pronto finché le sessioni ONNX dei profili abilitati non sono calde
+    state = _WARMUP["state"]
+    if state in ("warming", "failed"):
+        return JSONResponse({"status": state, "error": _WARMUP["error"]}, status_code=503)
     return {"status": "ok"}
 
 @app.get("/version")
@@ -107,85 +181,206 @@ DEFAULT_MODEL_REGISTRY = {
     "noiseprintpp":os.getenv("IDS_NOISEPRINT_MODEL",  str(MODELS_DIR / "noiseprint_pp.onnx")),
 }
 
-def _resolve_model_path(model_path: Optional[str]) -> Optional[str]:
-    if not model_path:
-        return None
-    p = Path(model_path)
-    return str(p if p.is_absolute() else MODELS_DIR / p)
+def _compiled(profile: str) -> CompiledProfile:
+    """Profilo compilato e cache-ato (ricompilato solo se il file cambia)."""
+    return get_compiled_profile(profile, DEFAULT_MODEL_REGISTRY, MODELS_DIR)
+
+# --- warm-up delle sessioni ONNX all'avvio ---
+# profili da pre-caricare (separati da virgola); IDS_WARMUP=0 disabilita
+WARM_PROFILES = [p.strip() for p in os.getenv("IDS_WARM_PROFILES", "recapture-id@2").split(",") if p.strip()]
+_WARMUP: Dict[str, Any] = {"state": "idle", "models": {}, "error": None}
+
+def _profile_model_paths(profile_names) -> Dict[str, str]:
+    paths: Dict[str, str] = {}
+    for name in profile_names:
+        paths.update(_compiled(name).model_paths)
+    return paths
+
+def _warm_sessions(profile_names) -> None:
+    _WARMUP["state"] = "warming"
+    try:
+        paths = _profile_model_paths(profile_names)
+        # stesse SessionOptions usate da analyze_image (ParallelConfig di default)
+        loaded = ort_sessions.preload(paths, ParallelConfig())
+        _WARMUP["models"] = {k: paths[k] for k, v in loaded.items() if v is not None}
+        missing = sorted(k for k, v in loaded.items() if v is None)
+        if missing:
+            _WARMUP["error"] = f"models not loaded: {missing}"
+            _WARMUP["state"] = "failed"
+        else:
+            _WARMUP["state"] = "ready"
+    except Exception as e:
+        _WARMUP["error"] = str(e)
+        _WARMUP["state"] = "failed"
+
+@app.on_event("startup")
+def _start_warmup():
+    # profilo o modello non valido: l'app non parte (fail fast, non alla prima richiesta)
+    for name in WARM_PROFILES:
+        _compiled(name)
+    if os.getenv("IDS_WARMUP", "1") == "0":
+        return
+    # non pronto già prima che il thread parta: nessuna finestra "idle" con 200
+    _WARMUP["state"] = "warming"
+    threading.Thread(target=_warm_sessions, args=(WARM_PROFILES,), name="ort-warmup", daemon=True).start()
+
+# --- pool dedicato alle analisi: l'event loop non esegue mai lavoro CPU ---
+#   IDS_API_WORKERS  analisi concorrenti
+#   IDS_API_QUEUE    richieste in attesa oltre le quali si risponde 503
+#   IDS_API_POOL     "thread" | "process"
+#   IDS_RETRY_AFTER  secondi suggeriti nel Retry-After
+#   IDS_CPU_BUDGET   thread CPU totali del servizio (0 = CPU disponibili)
+#   IDS_BATCH_WORKERS  processi del pool batch (sessioni ONNX scaldate all'avvio del worker)
+#   IDS_ONNX_BATCH   micro-batch ManTraNet tra analisi concorrenti del pool thread (1 = off)
+API_PARALLEL = ParallelConfig(
+    max_parallel_images=int(os.getenv("IDS_API_WORKERS", "2")),
+    pool_kind=os.getenv("IDS_API_POOL", "thread"),
+    max_queue=int(os.getenv("IDS_API_QUEUE", "8")),
+)
+BATCH_WORKERS = int(os.getenv("IDS_BATCH_WORKERS", "2"))
+
+# un solo budget CPU per tutto il servizio: una quota per ogni processo che analizza
+# (questo processo col pool thread + job, oppure i worker del pool process, + i worker batch)
+CPU_BUDGET = int(os.getenv("IDS_CPU_BUDGET", "0")) or available_cpus()
+CPU_SHARES = (API_PARALLEL.max_parallel_images if API_PARALLEL.pool_kind == "process" else 1) + BATCH_WORKERS
+CPU_PER_PROCESS = max(1, CPU_BUDGET // CPU_SHARES)
+
+def _init_api_worker(profile_names, cpu_tokens: int):
+    set_process_share(1, cpu_tokens)
+    _warm_sessions(profile_names)
+
+if API_PARALLEL.pool_kind == "thread":
+    # le analisi in thread (e i job) condividono i token CPU di questo processo
+    set_process_share(1, CPU_PER_PROCESS)
+    # ... e le sessioni ONNX: input di dimensione fissa uniti in un solo session.run
+    set_process_batching(int(os.getenv("IDS_ONNX_BATCH", "1")))
+
+RETRY_AFTER_S = int(os.getenv("IDS_RETRY_AFTER", "2"))
+ANALYZE_POOL = BoundedExecutor(
+    API_PARALLEL,
+    # nei processi worker le sessioni vanno scaldate localmente
+    initializer=_init_api_worker if API_PARALLEL.pool_kind == "process" else None,
+    initargs=(WARM_PROFILES, CPU_PER_PROCESS) if API_PARALLEL.pool_kind == "process" else (),
+)
 
-@app.post("/v1/analyze", response_model=AnalyzeResponse)
-async def analyze_endpoint(
-    file: UploadFile = File(...),
-    profile: str = Form("recapture-id@2"),
-    out_dir: Optional[str] = Form(None),
-    params_json: Optional[str] = Form(None),
-    thresholds_json: Optional[str] = Form(None),
-    save_artifacts: bool = Form(True),
-    _api_key: str = Depends(get_api_key)
-):
-    # --- salva upload in directory run dedicata ---
-    run_id = str(uuid.uuid4())
-    out = Path(out_dir) if out_dir else RUNS_DIR / run_id
-    out.mkdir(parents=True, exist_ok=True)
-    ext = os.path.splitext(file.filename or "")[1] or ".bin"
-    img_path = out / f"original{ext}"
-    with img_path.open("wb") as f:
-        f.write(await file.read())
+ANALYZE_QUEUE_DEPTH = Gauge("idshield_analyze_queue_depth", "Analyses waiting for a worker")
+ANALYZE_QUEUE_DEPTH.set_function(lambda: ANALYZE_POOL.queue_depth)
+ANALYZE_IN_FLIGHT = Gauge("idshield_analyze_in_flight", "Analyses currently running")
+ANALYZE_IN_FLIGHT.set_function(lambda: ANALYZE_POOL.in_flight)
+ANALYZE_REJECTED = Counter("idshield_analyze_rejected_total", "Analyses rejected because the queue was full")
+
+# --- cache dei risultati per contenuto (sha256 immagine + hash profilo risolto) ---
+#   IDS_RESULT_CACHE_SIZE  voci nella LRU in memoria (0 = cache disattivata)
+#   IDS_RESULT_CACHE_DISK  1 = anche tier su disco in DATA_DIR/cache
+_CACHE_SIZE = int(os.getenv("IDS_RESULT_CACHE_SIZE", "0"))
+_CACHE_DISK = os.getenv("IDS_RESULT_CACHE_DISK", "0") == "1"
+RESULT_CACHE = (
+    ResultCache(max_entries=_CACHE_SIZE, disk_dir=str(DATA_DIR / "cache") if _CACHE_DISK else None)
+    if (_CACHE_SIZE > 0 or _CACHE_DISK) else None
+)
+
+class _ResultCacheCollector:
+    def collect(self):
+        fam = CounterMetricFamily("idshield_result_cache_lookups", "Result cache lookups by outcome", labels=["result"])
+        st = RESULT_CACHE.stats if RESULT_CACHE is not None else {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        fam.add_metric(["hit_memory"], st["memory_hits"])
+        fam.add_metric(["hit_disk"], st["disk_hits"])
+        fam.add_metric(["miss"], st["misses"])
+        yield fam
+
+REGISTRY.register(_ResultCacheCollector())
+
+# --- retention dei run: età massima, budget su disco, solo report.json dopo N ore ---
+#   IDS_RUNS_MAX_AGE_H        ore dopo cui un run viene eliminato (0 = mai)
+#   IDS_RUNS_MAX_BYTES        budget totale di RUNS_DIR in byte (0 = illimitato)
+#   IDS_RUNS_STRIP_AFTER_H    ore dopo cui si conserva solo report.json (0 = mai)
+#   IDS_RETENTION_INTERVAL_S  intervallo tra due sweep
+#   IDS_RUNS_INDEX            path dell'indice SQLite (default DATA_DIR/runs_index.sqlite3)
+#   IDS_SQLITE_JOURNAL        journal mode degli SQLite (WAL; DELETE su volumi di rete)
+SQLITE_JOURNAL = os.getenv("IDS_SQLITE_JOURNAL", "WAL")
+RETENTION = RunRetention(
+    RUNS_DIR,
+    Path(os.getenv("IDS_RUNS_INDEX", str(DATA_DIR / "runs_index.sqlite3"))),
+    max_age_s=float(os.getenv("IDS_RUNS_MAX_AGE_H", "0")) * 3600,
+    max_bytes=int(os.getenv("IDS_RUNS_MAX_BYTES", "0")),
+    strip_after_s=float(os.getenv("IDS_RUNS_STRIP_AFTER_H", "0")) * 3600,
+    journal_mode=SQLITE_JOURNAL,
+)
+RETENTION_INTERVAL_S = float(os.getenv("IDS_RETENTION_INTERVAL_S", "300"))
+
+class _RetentionCollector:
+    def collect(self):
+        usage = RETENTION.usage() if RETENTION.enabled else {"runs": 0, "bytes": 0}
+        yield GaugeMetricFamily("idshield_runs_stored", "Run directories tracked under RUNS_DIR", value=usage["runs"])
+        yield GaugeMetricFamily("idshield_runs_bytes", "Bytes used by tracked run directories", value=usage["bytes"])
+        st = RETENTION.stats
+        yield CounterMetricFamily("idshield_runs_evicted", "Run directories deleted by retention", value=st["evicted"])
+        yield CounterMetricFamily("idshield_runs_stripped", "Runs reduced to report.json", value=st["stripped"])
+        yield CounterMetricFamily("idshield_runs_freed_bytes", "Bytes freed by retention", value=st["bytes_freed"])
+
+REGISTRY.register(_RetentionCollector())
+
+def _retention_loop():
+    try:
+        # primo avvio: indicizza i run esistenti, esclusi i job non ancora terminati
+        if RETENTION.needs_rebuild():
+            RETENTION.rebuild(exclude=JOBS.active_ids())
+    except Exception:
+        logger.exception("retention index rebuild failed")
+    while True:
+        try:
+            RETENTION.sweep()
+        except Exception:
+            logger.exception("retention sweep failed")
+        time.sleep(RETENTION_INTERVAL_S)
+
+@app.on_event("startup")
+def _start_retention():
+    if RETENTION.enabled:
+        threading.Thread(target=_retention_loop, name="runs-retention", daemon=True).start()
+
+async def _run_in_pool(fn, *args, **kwargs):
+    try:
+        fut = ANALYZE_POOL.submit(fn, *args, **kwargs)
+    except PoolSaturated:
+        ANALYZE_REJECTED.inc()
+        raise HTTPException(
+            status_code=503,
+            detail="Analysis queue is full, retry later.",
+            headers={"Retry-After": str(RETRY_AFTER_S)},
+        )
+    return await asyncio.wrap_future(fut)
 
-    prof = load_profile(profile)
+def _build_config(profile: str, params_json: Optional[str], thresholds_json: Optional[str], save_artifacts: bool = True):
+    """Risolve profilo + override del form in ``(profilo, AnalyzerConfig)``.
+
+    Il profilo arriva già compilato; qui si applicano solo gli override.
+    Senza ``save_artifacts`` la pipeline non produce PNG, overlay né report.json.
+    """
+    try:
+        comp = _compiled(profile)
+    except ModelNotFoundError as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
     # ----- Params: base profilo + override da form -----
-    params: Dict[str, Any] = dict(prof.get("params", {}))
-    if params_json:
-        user_params = json.loads(params_json)
-        for k, v in user_params.items():
-            params[k] = {**params.get(k, {}), **v} if isinstance(v, dict) else v
-
-    # ----- Checks dal profilo -----
-    checks = prof.get("checks", {})
-
-    # ----- Inietta i path dei modelli (se mancanti) per i check abilitati -----
-    for check_name, default_path in DEFAULT_MODEL_REGISTRY.items():
-        chk_cfg = checks.get(check_name)
-        if not (isinstance(chk_cfg, dict) and chk_cfg.get("enabled")):
-            continue
-        params.setdefault(check_name, {})
-        params[check_name].setdefault("model_path", default_path)
-        params[check_name]["model_path"] = _resolve_model_path(params[check_name]["model_path"])
-        mp = Path(params[check_name]["model_path"])
-        if not mp.exists():
-            raise HTTPException(
-                status_code=500,
-                detail=f"Model for '{check_name}' not found at {mp}. "
-                       f"Configure env IDS_MODELS_DIR or IDS_*_MODEL, or mount the file."
-            )
+    params = comp.merged_params(json.loads(params_json) if params_json else None)
 
-    # ----- Thresholds: se mancano nel profilo, derivali dai checks -----
-    if "thresholds" in prof and isinstance(prof["thresholds"], dict):
-        thresholds: Dict[str, float] = dict(prof["thresholds"])
-    else:
-        thresholds = {
-            name: (cfg.get("threshold", 0.5) if isinstance(cfg, dict) else 0.5)
-            for name, cfg in checks.items() if isinstance(cfg, dict)
-        }
-    if thresholds_json:
-        thr_user = json.loads(thresholds_json)
-        thresholds.update(thr_user)
-
-    # ----- Threshold globale: supporta prof.decision.threshold o prof.threshold (legacy) -----
-    decision = prof.get("decision") or {}
-    global_threshold = decision.get("threshold", prof.get("threshold", 0.5))
-
-    # ----- Pesi dei check per l'aggregazione -----
-    weights = {
-        name: (cfg.get("weight", 0.0) if isinstance(cfg, dict) else 0.0)
-        for name, cfg in checks.items() if isinstance(cfg, dict)
-    }
+    # ----- Path dei modelli sovrascritti dal form: risolvi e verifica -----
+    for check_name, model_path in comp.model_paths.items():
+        mp = params.get(check_name, {}).get("model_path") if isinstance(params.get(check_name), dict) else None
+        if mp and mp != model_path:
+            mp = resolve_model_path(mp, MODELS_DIR)
+            if not Path(mp).exists():
+                raise HTTPException(status_code=500, detail=str(ModelNotFoundError(check_name, mp)))
+            params[check_name]["model_path"] = mp
+
+    # ----- Thresholds: profilo (o derivati dai checks) + override da form -----
+    thresholds = comp.merged_thresholds(json.loads(thresholds_json) if thresholds_json else None)
 
     # ----- Verifica che almeno un modello ONNX principale sia abilitato -----
     main_model = None
     for cand in ("mantranet", "noiseprintpp"):
-        if cand in checks and checks[cand].get("enabled"):
+        if cand in comp.enabled_checks:
             main_model = params.get(cand, {}).get("model_path")
             if main_model:
                 break
@@ -196,13 +391,41 @@ async def analyze_endpoint(
         )
 
     cfg = AnalyzerConfig(
-        weights=weights,
-        threshold=global_threshold,
+        weights=dict(comp.weights),
+        threshold=comp.threshold,
         check_params=params,
-        check_thresholds=thresholds
+        check_thresholds=thresholds,
+        artifacts=ARTIFACTS_FULL if save_artifacts else ARTIFACTS_NONE,
+        heatmap_format=HEATMAP_FORMAT,
+        cascade=CASCADE,
+        disabled_checks=list(comp.disabled_checks),
+        force_checks=list(CONFIDENCE_CHECKS) if FULL_CONFIDENCE else None,
     )
-
-    rep = analyze_image(str(img_path), str(out), cfg)
+    return comp.profile, cfg
+
+def _artifact_url(v: str, run_path: str) -> str:
+    """Path relativo al run -> URL ``/runs``; path assoluti sotto RUNS_DIR (es. da cache) idem."""
+    p = Path(v)
+    if not p.is_absolute():
+        return f"/runs/{run_path}/{v}"
+    try:
+        return f"/runs/{p.relative_to(RUNS_DIR.resolve()).as_posix()}"
+    except ValueError:
+        return str(p)
+
+def _finalize_report(
+    rep: Dict[str, Any],
+    prof: Dict[str, Any],
+    profile: str,
+    run_id: str,
+    save_artifacts: bool,
+    run_path: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Arricchisce il report della pipeline per il frontend.
+
+    ``run_path`` è la directory sotto ``/runs`` con gli artifact (default ``run_id``).
+    """
+    run_path = run_path or run_id
     # enrich report for frontend
     rep["profile_id"] = profile
     rep["checks"] = rep.get("per_check", {})
@@ -238,8 +461,7 @@ async def analyze_endpoint(
         if rep.get("artifacts"):
             new_art = {}
             for k, v in rep["artifacts"].items():
-                p = Path(v)
-                new_art[k] = str(p) if p.is_absolute() else f"/runs/{run_id}/{v}"
+                new_art[k] = _artifact_url(v, run_path)
             rep["artifacts"] = new_art
         else:
             rep["artifacts"] = {}
@@ -250,11 +472,333 @@ async def analyze_endpoint(
                 if isinstance(chk, dict) and chk.get("artifacts"):
                     new_ca = {}
                     for k, v in chk["artifacts"].items():
-                        p = Path(v)
-                        new_ca[k] = str(p) if p.is_absolute() else f"/runs/{run_id}/{v}"
+                        new_ca[k] = _artifact_url(v, run_path)
                     chk["artifacts"] = new_ca
     rep["run_id"] = run_id
-    return JSONResponse(rep)
+    return rep
+
+
+def _upload_name(file: UploadFile) -> str:
+    ext = os.path.splitext(file.filename or "")[1] or ".bin"
+    return f"original{ext}"
+
+def _write_upload(data: bytes, out: Path, name: str) -> Path:
+    out.mkdir(parents=True, exist_ok=True)
+    img_path = out / name
+    with img_path.open("wb") as f:
+        f.write(data)
+    return img_path
+
+async def _save_upload(file: UploadFile, out: Path) -> Path:
+    return _write_upload(await file.read(), out, _upload_name(file))
+
+@app.post("/v1/analyze", response_model=AnalyzeResponse)
+async def analyze_endpoint(
+    file: UploadFile = File(...),
+    profile: str = Form("recapture-id@2"),
+    out_dir: Optional[str] = Form(None),
+    params_json: Optional[str] = Form(None),
+    thresholds_json: Optional[str] = Form(None),
+    save_artifacts: bool = Form(True),
+    _api_key: str = Depends(get_api_key)
+):
+    run_id = str(uuid.uuid4())
+    data = await file.read()
+    name = _upload_name(file)
+    prof, cfg = _build_config(profile, params_json, thresholds_json, save_artifacts)
+
+    # --- cache dei risultati (non usata se il chiamante impone out_dir) ---
+    key = None
+    if RESULT_CACHE is not None and not out_dir:
+        # sha256 dell'upload e lettura dal tier su disco fuori dall'event loop
+        key = await asyncio.to_thread(lambda: cache_key(image_digest(data), config_digest(cfg)))
+        rep = await asyncio.to_thread(RESULT_CACHE.get, key, with_artifacts=save_artifacts)
+        if rep is not None:
+            rep["image"] = name
+            return JSONResponse(_finalize_report(rep, prof, profile, run_id, save_artifacts))
+
+    out = None
+    if not save_artifacts and not out_dir:
+        # --- nessun artifact richiesto: decodifica dai byte, zero I/O su disco ---
+        rep = await _run_in_pool(analyze_image_bytes, data, cfg, image_name=name)
+    else:
+        # --- salva upload in directory run dedicata ---
+        out = Path(out_dir) if out_dir else RUNS_DIR / run_id
+        img_path = _write_upload(data, out, name)
+        rep = await _run_in_pool(analyze_image, str(img_path), str(out), cfg)
+
+    observe_report(rep, image_bytes=len(data))
+    if out is not None and RETENTION.enabled:
+        await asyncio.to_thread(RETENTION.register, out)
+    if key is not None:
+        await asyncio.to_thread(RESULT_CACHE.put, key, rep, artifact_dir=str(out) if save_artifacts else None)
+    return JSONResponse(_finalize_report(rep, prof, profile, run_id, save_artifacts))
+
+# ---- Batch: più immagini (o uno zip) con un solo profilo, su process pool ----
+#   ogni worker batch riceve CPU_PER_PROCESS token (vedi IDS_CPU_BUDGET)
+BATCH_PARALLEL = ParallelConfig(max_parallel_images=BATCH_WORKERS, cpu_budget=CPU_PER_PROCESS * BATCH_WORKERS)
+IMG_EXTS = {".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp"}
+# limiti degli upload batch, oltre i quali si risponde 413; i membri degli zip
+# sono controllati sulla dimensione dichiarata prima di decomprimerli
+#   IDS_BATCH_MAX_FILES       immagini per richiesta (file + membri degli zip)
+#   IDS_BATCH_MAX_FILE_BYTES  byte di una singola immagine
+#   IDS_BATCH_MAX_BYTES       byte totali (non compressi) della richiesta
+#   IDS_BATCH_QUEUE           immagini in attesa oltre i worker, poi 503
+BATCH_MAX_FILES = int(os.getenv("IDS_BATCH_MAX_FILES", "256"))
+BATCH_MAX_FILE_BYTES = int(os.getenv("IDS_BATCH_MAX_FILE_BYTES", str(50 << 20)))
+BATCH_MAX_BYTES = int(os.getenv("IDS_BATCH_MAX_BYTES", str(512 << 20)))
+BATCH_QUEUE = int(os.getenv("IDS_BATCH_QUEUE", "64"))
+_BATCH_POOL = None
+_BATCH_POOL_LOCK = threading.Lock()
+_BATCH_PENDING = 0
+
+def _batch_pool():
+    global _BATCH_POOL
+    with _BATCH_POOL_LOCK:
+        if _BATCH_POOL is None:
+            try:
+                paths = _profile_model_paths(WARM_PROFILES)
+            except Exception:
+                paths = {}
+            _BATCH_POOL = create_image_pool(BATCH_PARALLEL, paths)
+        return _BATCH_POOL
+
+def _reserve_batch(n: int) -> bool:
+    """Prenota ``n`` immagini sul pool batch; False se la coda è piena.
+
+    Un batch trova sempre posto a pool vuoto (la dimensione è già limitata
+    da ``BATCH_MAX_FILES``).
+    """
+    global _BATCH_PENDING
+    with _BATCH_POOL_LOCK:
+        if _BATCH_PENDING and _BATCH_PENDING + n > BATCH_WORKERS + BATCH_QUEUE:
+            return False
+        _BATCH_PENDING += n
+        return True
+
+def _release_batch(n: int) -> None:
+    global _BATCH_PENDING
+    with _BATCH_POOL_LOCK:
+        _BATCH_PENDING -= n
+
+def _safe_name(name: str) -> str:
+    base = os.path.basename(name.replace("\\", "/")) or "image"
+    return "".join(c if (c.isalnum() or c in "._-") else "_" for c in base)
+
+def _too_large(detail: str) -> HTTPException:
+    return HTTPException(status_code=413, detail=detail)
+
+async def _save_batch_uploads(files: List[UploadFile], inputs: Path):
+    """Salva file singoli ed estrae gli zip; ritorna [(nome originale, path)].
+
+    Numero di immagini, dimensione di ciascuna e totale sono verificati
+    prima di scrivere (o decomprimere) ogni elemento.
+    """
+    inputs.mkdir(parents=True, exist_ok=True)
+    items = []
+    total = 0
+
+    def _admit(name: str, size: int):
+        nonlocal total
+        if len(items) >= BATCH_MAX_FILES:
+            raise _too_large(f"Too many images in request (max {BATCH_MAX_FILES})")
+        if size > BATCH_MAX_FILE_BYTES:
+            raise _too_large(f"{name}: image too large (max {BATCH_MAX_FILE_BYTES} bytes)")
+        if total + size > BATCH_MAX_BYTES:
+            raise _too_large(f"Request too large (max {BATCH_MAX_BYTES} bytes uncompressed)")
+        total += size
+
+    def _add(name: str, data: bytes):
+        # prefisso progressivo: nomi uguali (es. front.jpg in più zip) non collidono
+        dst = inputs / f"{len(items):04d}_{_safe_name(name)}"
+        dst.write_bytes(data)
+        items.append((name, dst))
+
+    for up in files:
+        data = await up.read()
+        fname = up.filename or "upload"
+        if fname.lower().endswith(".zip") or up.content_type in ("application/zip", "application/x-zip-compressed"):
+            try:
+                with zipfile.ZipFile(io.BytesIO(data)) as zf:
+                    for info in zf.infolist():
+                        if info.is_dir() or Path(info.filename).suffix.lower() not in IMG_EXTS:
+                            continue
+                        # file_size limita anche la lettura: un header falso non fa decomprimere di più
+                        _admit(info.filename, info.file_size)
+                        _add(info.filename, zf.read(info))
+            except zipfile.BadZipFile:
+                raise HTTPException(status_code=400, detail=f"Invalid zip archive: {fname}")
+        else:
+            _admit(fname, len(data))
+            _add(fname, data)
+    return items
+
+def _run_batch(paths: List[str], root: Path, cfg: AnalyzerConfig) -> Dict[str, Any]:
+    # un'immagine che fallisce non interrompe le altre: {path: report | eccezione}
+    return dict(iter_analyze_images(paths, str(root), cfg, BATCH_PARALLEL, _batch_pool(), RESULT_CACHE))
+
+@app.post("/v1/analyze/batch")
+async def analyze_batch_endpoint(
+    files: List[UploadFile] = File(...),
+    profile: str = Form("recapture-id@2"),
+    params_json: Optional[str] = Form(None),
+    thresholds_json: Optional[str] = Form(None),
+    save_artifacts: bool = Form(True),
+    _api_key: str = Depends(get_api_key)
+):
+    # profilo risolto una sola volta per tutto il batch
+    prof, cfg = _build_config(profile, params_json, thresholds_json, save_artifacts)
+    batch_id = str(uuid.uuid4())
+    root = RUNS_DIR / batch_id
+    try:
+        items = await _save_batch_uploads(files, root / "inputs")
+        if not items:
+            raise HTTPException(status_code=400, detail="No images in request")
+        if not _reserve_batch(len(items)):
+            ANALYZE_REJECTED.inc()
+            raise HTTPException(
+                status_code=503,
+                detail="Batch queue is full, retry later.",
+                headers={"Retry-After": str(RETRY_AFTER_S)},
+            )
+    except HTTPException:
+        shutil.rmtree(root, ignore_errors=True)
+        raise
+
+    t0 = time.perf_counter()
+    try:
+        reps = await asyncio.to_thread(_run_batch, [str(p) for _, p in items], root, cfg)
+    finally:
+        _release_batch(len(items))
+    wall_ms = (time.perf_counter() - t0) * 1000.0
+    if RETENTION.enabled:
+        await asyncio.to_thread(RETENTION.register, root)
+
+    out = []
+    n_errors = 0
+    for name, pth in items:
+        rep = reps[str(pth)]
+        if isinstance(rep, Exception):
+            n_errors += 1
+            logger.warning(
+                "batch image failed: %s: %s", name, rep,
+                extra={"path": "/v1/analyze/batch", "method": "POST", "status": "-", "duration_ms": "-"},
+            )
+            out.append({"filename": name, "error": f"{type(rep).__name__}: {rep}"})
+            continue
+        if not rep.get("cache"):
+            observe_report(rep, image_bytes=pth.stat().st_size)
+        rep = _finalize_report(rep, prof, profile, batch_id, save_artifacts, run_path=f"{batch_id}/{pth.stem}")
+        rep["filename"] = name
+        out.append(rep)
+    return {
+        "batch_id": batch_id,
+        "profile_id": profile,
+        "reports": out,
+        "timing": {
+            "n_images": len(out),
+            "n_errors": n_errors,
+            "wall_ms": wall_ms,
+            "images_per_s": len(out) / max(1e-9, wall_ms / 1000.0),
+            "sum_image_ms": sum(r.get("metrics", {}).get("total_ms", 0.0) for r in out),
+        },
+    }
+
+# ---- Job asincroni: coda SQLite persistente svuotata da thread worker ----
+#   IDS_JOB_WORKERS  thread che eseguono i job (0 = nessuno)
+#   IDS_JOB_POLL_S   intervallo di polling della coda
+#   IDS_JOB_LEASE_S  secondi senza heartbeat dopo cui un job running è considerato orfano
+JOBS = JobQueue(
+    DATA_DIR / "jobs.sqlite3", lease_s=float(os.getenv("IDS_JOB_LEASE_S", "60")), journal_mode=SQLITE_JOURNAL
+)
+JOB_WORKERS = int(os.getenv("IDS_JOB_WORKERS", "1"))
+JOB_POLL_S = float(os.getenv("IDS_JOB_POLL_S", "0.5"))
+_JOB_WAKE = threading.Event()
+
+def _run_job_in_pool(job_id: str, fn, *args):
+    """Esegue ``fn`` sul pool delle analisi rinnovando il lease del job.
+
+    A pool saturo il job aspetta (non fallisce): le richieste sincrone
+    hanno la precedenza e ricevono il 503.
+    """
+    heartbeat_s = max(0.5, JOBS.lease_s / 3)
+    while True:
+        try:
+            fut = ANALYZE_POOL.submit(fn, *args)
+            break
+        except PoolSaturated:
+            JOBS.heartbeat(job_id)
+            time.sleep(min(RETRY_AFTER_S, heartbeat_s))
+    while True:
+        try:
+            return fut.result(timeout=heartbeat_s)
+        except FutureTimeoutError:
+            JOBS.heartbeat(job_id)
+
+def _process_job(job: Dict[str, Any]) -> None:
+    p = job["payload"]
+    try:
+        save_artifacts = p.get("save_artifacts", True)
+        prof, cfg = _build_config(p["profile"], p.get("params_json"), p.get("thresholds_json"), save_artifacts)
+        rep = _run_job_in_pool(job["id"], analyze_image, p["image_path"], p["out_dir"], cfg)
+        observe_report(rep, image_bytes=Path(p["image_path"]).stat().st_size)
+        JOBS.complete(job["id"], _finalize_report(rep, prof, p["profile"], job["id"], save_artifacts))
+    except HTTPException as e:
+        JOBS.fail(job["id"], str(e.detail))
+    except Exception as e:
+        JOBS.fail(job["id"], f"{type(e).__name__}: {e}")
+    finally:
+        if RETENTION.enabled:
+            RETENTION.register(Path(p["out_dir"]))
+
+def _drain_jobs() -> None:
+    while True:
+        job = JOBS.claim()
+        if job is None:
+            _JOB_WAKE.wait(JOB_POLL_S)
+            _JOB_WAKE.clear()
+            continue
+        _process_job(job)
+
+@app.on_event("startup")
+def _start_job_workers():
+    for i in range(JOB_WORKERS):
+        threading.Thread(target=_drain_jobs, name=f"job-worker-{i}", daemon=True).start()
+
+@app.post("/v1/jobs", status_code=202)
+async def submit_job(
+    file: UploadFile = File(...),
+    profile: str = Form("recapture-id@2"),
+    params_json: Optional[str] = Form(None),
+    thresholds_json: Optional[str] = Form(None),
+    save_artifacts: bool = Form(True),
+    _api_key: str = Depends(get_api_key)
+):
+    # profilo/modelli validati subito: un job non valido non entra in coda
+    _build_config(profile, params_json, thresholds_json)
+    job_id = str(uuid.uuid4())
+    out = RUNS_DIR / job_id
+    img_path = await _save_upload(file, out)
+    JOBS.submit(
+        {
+            "profile": profile,
+            "params_json": params_json,
+            "thresholds_json": thresholds_json,
+            "save_artifacts": save_artifacts,
+            "image_path": str(img_path),
+            "out_dir": str(out),
+        },
+        job_id=job_id,
+    )
+    _JOB_WAKE.set()
+    return {"job_id": job_id, "status": "queued", "status_url": f"/v1/jobs/{job_id}"}
+
+@app.get("/v1/jobs/{job_id}")
+def get_job(job_id: str, _api_key: str = Depends(get_api_key)):
+    job = JOBS.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 # compatibilità con vecchio endpoint
 app.post("/analyze", response_model=AnalyzeResponse)(analyze_endpoint)
@@ -273,7 +817,10 @@ def artifact(path: str, _api_key: str = Depends(get_api_key)) -> FileResponse:
         if not p.is_absolute():
             p = DATA_DIR / p
     if not p.exists():
-        raise HTTPException(status_code=404, detail="Not found")
+        resp = _render_lazy(p)
+        if resp is None:
+            raise HTTPException(status_code=404, detail="Not found")
+        return resp
     return FileResponse(str(p))
 
 # ---- SPA static ----
@@ -0,0 +1,182 @@
+"""Retention delle directory di run sotto ``RUNS_DIR`` (età massima + budget in byte).
+
+Ogni run completato viene registrato in un piccolo indice SQLite (path,
+istante di creazione, byte occupati): lo sweep periodico lavora solo
+sull'indice, senza riscandire l'albero. La scansione completa
+(:meth:`RunRetention.rebuild`) va lanciata una sola volta dal thread di
+retention, quando l'indice è vuoto (primo avvio / migrazione).
+"""
+
+import shutil
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    path        TEXT PRIMARY KEY,
+    created_at  REAL NOT NULL,
+    bytes       INTEGER NOT NULL,
+    stripped    INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS runs_created ON runs(created_at);
+"""
+
+# file conservato quando un run viene "alleggerito"
+KEEP_FILE = "report.json"
+
+
+def _dir_bytes(p: Path) -> int:
+    total = 0
+    for f in p.rglob("*"):
+        try:
+            if f.is_file():
+                total += f.stat().st_size
+        except OSError:
+            pass
+    return total
+
+
+class RunRetention:
+    """Applica le policy di retention ai run registrati.
+
+    - ``max_age_s``: i run più vecchi vengono eliminati (0 = disattivato)
+    - ``max_bytes``: budget totale; si eliminano i run più vecchi finché
+      il totale non rientra (0 = disattivato)
+    - ``strip_after_s``: oltre questa età si conserva solo ``report.json``
+      (0 = disattivato)
+    """
+
+    def __init__(
+        self,
+        runs_dir: Path,
+        db_path: Path,
+        max_age_s: float = 0,
+        max_bytes: int = 0,
+        strip_after_s: float = 0,
+        journal_mode: str = "WAL",
+    ):
+        self.runs_dir = Path(runs_dir)
+        self.db_path = Path(db_path)
+        # WAL non funziona su volumi di rete: in quel caso usare "DELETE"
+        self.journal_mode = journal_mode
+        self.max_age_s = float(max_age_s)
+        self.max_bytes = int(max_bytes)
+        self.strip_after_s = float(strip_after_s)
+        self.stats = {"evicted": 0, "stripped": 0, "bytes_freed": 0, "sweeps": 0}
+        self._lock = threading.Lock()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._conn() as c:
+            c.executescript(_SCHEMA)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_age_s > 0 or self.max_bytes > 0 or self.strip_after_s > 0
+
+    @contextmanager
+    def _conn(self):
+        conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None)
+        try:
+            conn.execute(f"PRAGMA journal_mode={self.journal_mode}")
+            yield conn
+        finally:
+            conn.close()
+
+    def _rel(self, run_dir: Path) -> Optional[str]:
+        try:
+            return Path(run_dir).resolve().relative_to(self.runs_dir.resolve()).parts[0]
+        except (ValueError, IndexError):
+            return None
+
+    def register(self, run_dir: Path) -> None:
+        """Registra (o aggiorna) un run; path fuori da ``runs_dir`` sono ignorati."""
+        rel = self._rel(run_dir)
+        if rel is None:
+            return
+        p = self.runs_dir / rel
+        if not p.is_dir():
+            return
+        with self._conn() as c:
+            c.execute(
+                "INSERT INTO runs(path, created_at, bytes) VALUES (?, ?, ?) "
+                "ON CONFLICT(path) DO UPDATE SET bytes=excluded.bytes, stripped=0",
+                (rel, time.time(), _dir_bytes(p)),
+            )
+
+    def needs_rebuild(self) -> bool:
+        with self._conn() as c:
+            return c.execute("SELECT COUNT(*) FROM runs").fetchone()[0] == 0
+
+    def rebuild(self, exclude: Iterable[str] = ()) -> int:
+        """Indicizza i run già presenti su disco (età = mtime della directory).
+
+        ``exclude``: nomi di directory da non toccare, es. i job non ancora
+        eseguiti, che verranno registrati a fine elaborazione.
+        """
+        skip = set(exclude)
+        rows = []
+        if self.runs_dir.is_dir():
+            for p in self.runs_dir.iterdir():
+                if p.is_dir() and p.name not in skip:
+                    rows.append((p.name, p.stat().st_mtime, _dir_bytes(p)))
+        with self._conn() as c:
+            c.executemany("INSERT OR IGNORE INTO runs(path, created_at, bytes) VALUES (?, ?, ?)", rows)
+        return len(rows)
+
+    def _evict(self, c, rel: str, size: int) -> None:
+        shutil.rmtree(self.runs_dir / rel, ignore_errors=True)
+        c.execute("DELETE FROM runs WHERE path=?", (rel,))
+        self.stats["evicted"] += 1
+        self.stats["bytes_freed"] += size
+
+    def _strip(self, c, rel: str, size: int) -> None:
+        p = self.runs_dir / rel
+        for f in sorted(p.rglob("*"), reverse=True):
+            try:
+                if f.is_file() and f.name != KEEP_FILE:
+                    f.unlink()
+                elif f.is_dir() and not any(f.iterdir()):
+                    f.rmdir()
+            except OSError:
+                pass
+        left = _dir_bytes(p) if p.is_dir() else 0
+        c.execute("UPDATE runs SET bytes=?, stripped=1 WHERE path=?", (left, rel))
+        self.stats["stripped"] += 1
+        self.stats["bytes_freed"] += max(0, size - left)
+
+    def sweep(self, now: Optional[float] = None) -> Dict[str, int]:
+        """Applica strip, età massima e budget (in quest'ordine)."""
+        now = time.time() if now is None else now
+        before = dict(self.stats)
+        with self._lock, self._conn() as c:
+            if self.strip_after_s > 0:
+                rows = c.execute(
+                    "SELECT path, bytes FROM runs WHERE stripped=0 AND created_at<=?",
+                    (now - self.strip_after_s,),
+                ).fetchall()
+                for rel, size in rows:
+                    self._strip(c, rel, size)
+            if self.max_age_s > 0:
+                rows = c.execute(
+                    "SELECT path, bytes FROM runs WHERE created_at<=?", (now - self.max_age_s,)
+                ).fetchall()
+                for rel, size in rows:
+                    self._evict(c, rel, size)
+            if self.max_bytes > 0:
+                total = c.execute("SELECT COALESCE(SUM(bytes), 0) FROM runs").fetchone()[0]
+                if total > self.max_bytes:
+                    for rel, size in c.execute("SELECT path, bytes FROM runs ORDER BY created_at").fetchall():
+                        if total <= self.max_bytes:
+                            break
+                        self._evict(c, rel, size)
+                        total -= size
+            self.stats["sweeps"] += 1
+        return {k: self.stats[k] - before[k] for k in ("evicted", "stripped", "bytes_freed")}
+
+    def usage(self) -> Dict[str, int]:
+        with self._conn() as c:
+            n, total = c.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM runs").fetchone()
+        return {"runs": n, "bytes": total}
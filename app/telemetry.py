@@ -0,0 +1,66 @@
+"""Metriche Prometheus per check ed immagine, ricavate dai report della pipeline.
+
+I report arrivano anche dai processi worker, quindi le metriche sono
+osservate nel processo API a partire da ``report["metrics"]`` invece che
+dentro la pipeline. Le label restano limitate ai nomi dei check noti.
+"""
+
+from typing import Any, Dict, Optional
+
+from prometheus_client import Counter, Histogram
+
+from idtamper.pipeline import CHECK_NAMES
+
+_KNOWN = set(CHECK_NAMES)
+
+CHECK_DURATION = Histogram(
+    "idshield_check_duration_seconds",
+    "Duration of a single forensic check",
+    ["check"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+CHECK_ERRORS = Counter("idshield_check_errors_total", "Checks that raised during execution", ["check"])
+ANALYSIS_DURATION = Histogram(
+    "idshield_analysis_checks_seconds",
+    "Sum of check durations per analysed image",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+ARTIFACT_WRITE = Histogram(
+    "idshield_artifact_write_seconds",
+    "Time spent encoding and writing heatmaps/overlay per image",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+IMAGE_BYTES = Histogram(
+    "idshield_image_size_bytes",
+    "Size of the uploaded encoded image",
+    buckets=(1e4, 5e4, 1e5, 2.5e5, 5e5, 1e6, 2.5e6, 5e6, 1e7, 2.5e7),
+)
+IMAGE_MEGAPIXELS = Histogram(
+    "idshield_image_megapixels",
+    "Resolution of the analysed image",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 12.0, 16.0, 24.0, 50.0),
+)
+
+
+def _label(name: str) -> str:
+    return name if name in _KNOWN else "other"
+
+
+def observe_report(rep: Dict[str, Any], image_bytes: Optional[int] = None) -> None:
+    """Registra le metriche di un report appena calcolato (non per hit di cache)."""
+    if image_bytes is not None:
+        IMAGE_BYTES.observe(image_bytes)
+    m = rep.get("metrics") or {}
+    for c in m.get("checks", []):
+        CHECK_DURATION.labels(_label(c.get("name", ""))).observe(float(c.get("ms", 0.0)) / 1000.0)
+    if "total_ms" in m:
+        ANALYSIS_DURATION.observe(float(m["total_ms"]) / 1000.0)
+    if "artifacts_ms" in m:
+        ARTIFACT_WRITE.observe(float(m["artifacts_ms"]) / 1000.0)
+    img = m.get("image") or {}
+    if "megapixels" in img:
+        IMAGE_MEGAPIXELS.observe(float(img["megapixels"]))
+    for name, chk in (rep.get("per_check") or {}).items():
+        details = chk.get("details") if isinstance(chk, dict) else None
+        if isinstance(details, dict) and details.get("error"):
+            CHECK_ERRORS.labels(_label(name)).inc()
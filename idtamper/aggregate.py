@@ -18,4 +18,20 @@ def fuse_scores(per_check, weights):
             continue
         total += w * float(s)
         wsum += w
-    return total / (wsum if wsum>0 else 1.0)
\ No newline at end of file
+    return total / (wsum if wsum>0 else 1.0)
+def score_bounds(per_check, weights, pending):
+    """Range of values ``fuse_scores`` can still take once the checks in
+    ``pending`` report, assuming scores in [0, 1] (or None)."""
+    total = 0.0; wsum = 0.0
+    for k,v in per_check.items():
+        w = weights.get(k, 0.0)
+        s = v.get("score")
+        if s is None:
+            continue
+        total += w * float(s)
+        wsum += w
+    wr = sum(max(0.0, float(weights.get(k, 0.0))) for k in pending)
+    den = wsum + wr
+    if den <= 0:
+        return 0.0, 0.0
+    return total / den, (total + wr) / den
@@ -0,0 +1,219 @@
+from __future__ import annotations
+
+"""Cross-image micro-batching of ONNX Runtime calls.
+
+Checks that run a fixed-size model (ManTraNet resizes every image to its
+``input_size``) pay the per-call overhead of ``session.run`` once per image.
+When several images are analyzed in the same process, a
+:class:`MicroBatcher` gathers their single-sample calls for up to
+``max_batch`` inputs or ``max_wait_ms``, runs them as one batch and splits
+the outputs back per caller. Checks see a :class:`BatchedSession`, which has
+the ``get_inputs``/``get_outputs``/``run`` surface of an
+``InferenceSession``, so they need no changes.
+"""
+
+import concurrent.futures as cf
+import contextlib
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+Hold = Callable[[], Any]  # returns a context manager holding CPU tokens
+
+
+def supports_dynamic_batch(session) -> bool:
+    """True if every input of ``session`` has a symbolic first dimension."""
+
+    try:
+        inputs = session.get_inputs()
+    except Exception:
+        return False
+    return bool(inputs) and all(
+        len(inp.shape) > 0 and not isinstance(inp.shape[0], int) for inp in inputs
+    )
+
+
+class _Request:
+    __slots__ = ("output_names", "feeds", "done", "value", "error")
+
+    def __init__(self, output_names, feeds: Dict[str, np.ndarray]):
+        self.output_names = output_names
+        self.feeds = feeds
+        self.done = False
+        self.value: Optional[List[np.ndarray]] = None
+        self.error: Optional[BaseException] = None
+
+    def group(self) -> Tuple:
+        # calls can share a batch only with the same outputs and sample shapes
+        names = tuple(self.output_names) if self.output_names else None
+        return names, tuple(sorted((k, v.shape[1:], v.dtype.str) for k, v in self.feeds.items()))
+
+    def rows(self) -> int:
+        return int(next(iter(self.feeds.values())).shape[0])
+
+
+class MicroBatcher:
+    """Gathers concurrent ``session.run`` calls into batched calls.
+
+    The first caller becomes the leader: it waits until ``max_batch`` inputs
+    are queued or ``max_wait_ms`` have passed, runs the batch while holding
+    its own CPU tokens and wakes the other callers with their slice of the
+    outputs. Inputs with different shapes are run as separate batches; a
+    model whose outputs are not batch-major is run once per input.
+    """
+
+    def __init__(self, session, max_batch: int = 8, max_wait_ms: float = 5.0) -> None:
+        self.session = session
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait_s = max(0.0, float(max_wait_ms)) / 1000.0
+        self._cond = threading.Condition()
+        self._queue: List[_Request] = []
+        self._leader = False
+        self.stats = {"calls": 0, "batches": 0}
+
+    def run(self, output_names, feeds: Dict[str, np.ndarray], hold: Hold | None = None) -> List[np.ndarray]:
+        req = _Request(output_names, {k: np.asarray(v) for k, v in feeds.items()})
+        with self._cond:
+            self._queue.append(req)
+            self.stats["calls"] += 1
+            self._cond.notify_all()
+        while True:
+            with self._cond:
+                while not req.done and self._leader:
+                    self._cond.wait()
+                if req.done:
+                    break
+                self._leader = True
+                deadline = time.monotonic() + self.max_wait_s
+                while len(self._queue) < self.max_batch:
+                    left = deadline - time.monotonic()
+                    if left <= 0:
+                        break
+                    self._cond.wait(left)
+                batch = self._queue[: self.max_batch]
+                del self._queue[: self.max_batch]
+            try:
+                with (hold() if hold is not None else contextlib.nullcontext()):
+                    self._execute(batch)
+            finally:
+                with self._cond:
+                    self._leader = False
+                    self._cond.notify_all()
+        if req.error is not None:
+            raise req.error
+        return req.value  # type: ignore[return-value]
+
+    def _execute(self, batch: Sequence[_Request]) -> None:
+        groups: Dict[Tuple, List[_Request]] = {}
+        for req in batch:
+            groups.setdefault(req.group(), []).append(req)
+        for reqs in groups.values():
+            try:
+                self._run_group(reqs)
+            except BaseException as e:
+                for req in reqs:
+                    req.error = e
+            for req in reqs:
+                req.done = True
+
+    def _run_group(self, reqs: List[_Request]) -> None:
+        self.stats["batches"] += 1
+        if len(reqs) == 1:
+            reqs[0].value = self.session.run(reqs[0].output_names, reqs[0].feeds)
+            return
+        feeds = {k: np.concatenate([r.feeds[k] for r in reqs], axis=0) for k in reqs[0].feeds}
+        outs = self.session.run(reqs[0].output_names, feeds)
+        total = sum(r.rows() for r in reqs)
+        if any(np.ndim(o) == 0 or np.shape(o)[0] != total for o in outs):
+            self.stats["batches"] += len(reqs) - 1
+            for r in reqs:
+                r.value = self.session.run(r.output_names, r.feeds)
+            return
+        start = 0
+        for r in reqs:
+            n = r.rows()
+            r.value = [o[start:start + n] for o in outs]
+            start += n
+
+
+class BatchedSession:
+    """``InferenceSession`` stand-in routing ``run`` through a batcher.
+
+    Without a batcher (static batch dimension) calls go straight to the
+    session; either way ``hold`` is held while the model runs.
+    """
+
+    def __init__(self, session, batcher: MicroBatcher | None, hold: Hold | None = None) -> None:
+        self.session = session
+        self.batcher = batcher
+        self._hold = hold
+
+    def get_inputs(self):
+        return self.session.get_inputs()
+
+    def get_outputs(self):
+        return self.session.get_outputs()
+
+    def run(self, output_names, input_feed, run_options=None):
+        if self.batcher is not None and run_options is None:
+            return self.batcher.run(output_names, input_feed, self._hold)
+        with (self._hold() if self._hold is not None else contextlib.nullcontext()):
+            return self.session.run(output_names, input_feed, run_options)
+
+
+_BATCHERS: Dict[Tuple[int, int, float], MicroBatcher] = {}
+_LOCK = threading.Lock()
+_WAIT_POOL: cf.ThreadPoolExecutor | None = None
+
+
+def _reset_after_fork() -> None:
+    global _LOCK, _WAIT_POOL
+    _BATCHERS.clear()
+    _LOCK = threading.Lock()
+    _WAIT_POOL = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_batcher(session, max_batch: int, max_wait_ms: float) -> MicroBatcher:
+    """Process-wide batcher of ``session`` (one per batch settings)."""
+
+    key = (id(session), int(max_batch), float(max_wait_ms))
+    with _LOCK:
+        b = _BATCHERS.get(key)
+        if b is None or b.session is not session:
+            b = _BATCHERS[key] = MicroBatcher(session, max_batch, max_wait_ms)
+    return b
+
+
+def batched_session(session, max_batch: int, max_wait_ms: float, hold: Hold | None = None) -> BatchedSession:
+    """Wrap ``session`` so concurrent calls share batches when the model allows it."""
+
+    batcher = get_batcher(session, max_batch, max_wait_ms) if supports_dynamic_batch(session) else None
+    return BatchedSession(session, batcher, hold)
+
+
+def wait_executor() -> cf.ThreadPoolExecutor:
+    """Threads for checks that wait in a batcher.
+
+    They hold no CPU tokens while waiting (the leader takes them for the
+    batched call), so they must not occupy the budget's executor.
+    """
+
+    global _WAIT_POOL
+    with _LOCK:
+        if _WAIT_POOL is None:
+            _WAIT_POOL = cf.ThreadPoolExecutor(max_workers=64, thread_name_prefix="idtamper-batch")
+        return _WAIT_POOL
+
+
+def clear() -> None:
+    """Drop every batcher (mainly for tests)."""
+
+    with _LOCK:
+        _BATCHERS.clear()
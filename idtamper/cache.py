@@ -0,0 +1,298 @@
+from __future__ import annotations
+
+"""Content-addressed caches of analysis results.
+
+:class:`ResultCache` stores whole reports, keyed by the SHA-256 of the
+encoded image bytes plus a canonical hash of the resolved analyzer
+configuration (weights, thresholds, check parameters and the digests of the
+ONNX model files they reference).
+
+:class:`StageCache` stores what the reports are built from: the preprocessed
+image and the result of every check, each keyed by the image digest, only
+the parameters that stage reads and the digest of the code computing it.
+Changing one check's parameters (or its module) then invalidates that check
+alone, and changing weights or thresholds none of them.
+"""
+
+from collections import OrderedDict
+import copy
+import hashlib
+import inspect
+import io
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+from .visualize import artifact_available
+
+# bump when a change in the checks alters scores for identical inputs
+CACHE_VERSION = 4
+
+_MODEL_DIGESTS: Dict[Tuple[str, int, int], str] = {}
+
+
+def image_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_digest(path: str) -> str:
+    """SHA-256 of a file, memoised on ``(path, mtime, size)``."""
+
+    st = os.stat(path)
+    key = (str(Path(path).resolve()), st.st_mtime_ns, st.st_size)
+    dg = _MODEL_DIGESTS.get(key)
+    if dg is None:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        dg = _MODEL_DIGESTS[key] = h.hexdigest()
+    return dg
+
+
+def _canonical_params(params: Any) -> Any:
+    if isinstance(params, dict):
+        out = {}
+        for k, v in params.items():
+            if k == "session":
+                continue
+            if k == "model_path" and isinstance(v, str) and os.path.isfile(v):
+                v = "sha256:" + file_digest(v)
+            out[str(k)] = _canonical_params(v)
+        return out
+    if isinstance(params, (list, tuple)):
+        return [_canonical_params(v) for v in params]
+    return params
+
+
+def config_digest(cfg) -> str:
+    """Canonical hash of an :class:`~idtamper.pipeline.AnalyzerConfig`."""
+
+    payload = {
+        "version": CACHE_VERSION,
+        "weights": cfg.weights,
+        "threshold": cfg.threshold,
+        "check_params": _canonical_params(cfg.check_params or {}),
+        "check_thresholds": cfg.check_thresholds,
+    }
+    if getattr(cfg, "cascade", False):
+        # skipped checks leave tamper_score as a partial mean
+        payload["cascade"] = True
+    if not getattr(cfg, "skip_ignored", True) or getattr(cfg, "disabled_checks", None) or getattr(cfg, "force_checks", None):
+        # the plan decides which checks (and so which flags/confidence) are in the report
+        payload["plan"] = [
+            getattr(cfg, "skip_ignored", True),
+            sorted(getattr(cfg, "disabled_checks", None) or []),
+            sorted(getattr(cfg, "force_checks", None) or []),
+        ]
+    blob = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def cache_key(img_digest: str, cfg_digest: str) -> str:
+    return hashlib.sha256(f"{img_digest}:{cfg_digest}".encode("ascii")).hexdigest()
+
+
+class ResultCache:
+    """Two-tier (in-memory LRU + optional JSON files on disk) report cache.
+
+    Entries store the report and, for runs that wrote artifacts, the absolute
+    directory holding them. A lookup that needs artifacts only hits when that
+    directory still exists; the returned report then points at it with
+    absolute paths.
+    """
+
+    def __init__(self, max_entries: int = 1024, disk_dir: Optional[str] = None):
+        self.max_entries = int(max_entries)
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        if self.disk_dir is not None:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+        self._mem: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+    def _disk_path(self, key: str) -> Path:
+        return self.disk_dir / key[:2] / f"{key}.json"
+
+    def _remember(self, key: str, entry: Dict[str, Any]) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._mem[key] = entry
+            self._mem.move_to_end(key)
+            while len(self._mem) > self.max_entries:
+                self._mem.popitem(last=False)
+
+    def _lookup(self, key: str) -> Tuple[Optional[Dict[str, Any]], str]:
+        with self._lock:
+            entry = self._mem.get(key)
+            if entry is not None:
+                self._mem.move_to_end(key)
+                return entry, "memory"
+        if self.disk_dir is not None:
+            p = self._disk_path(key)
+            try:
+                entry = json.loads(p.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                entry = None
+            if entry is not None:
+                self._remember(key, entry)
+                return entry, "disk"
+        return None, ""
+
+    def get(self, key: str, *, with_artifacts: bool = False) -> Optional[Dict[str, Any]]:
+        entry, tier = self._lookup(key)
+        if entry is not None and with_artifacts:
+            adir = entry.get("artifact_dir")
+            files = (entry["report"].get("artifacts") or {}).values()
+            # retention may have deleted the run or kept only report.json
+            if not adir or not Path(adir).is_dir() or not all(artifact_available(adir, v) for v in files):
+                entry = None
+        with self._lock:
+            self.stats["misses" if entry is None else f"{tier}_hits"] += 1
+        if entry is None:
+            return None
+        rep = copy.deepcopy(entry["report"])
+        if with_artifacts:
+            adir = Path(entry["artifact_dir"])
+            rep["artifacts"] = {k: str(adir / v) for k, v in (rep.get("artifacts") or {}).items()}
+        else:
+            rep["artifacts"] = {}
+        rep["cache"] = {"hit": True, "tier": tier}
+        return rep
+
+    def put(self, key: str, report: Dict[str, Any], artifact_dir: Optional[str] = None) -> None:
+        rep = {k: v for k, v in report.items() if k not in ("maps", "cache")}
+        entry = {
+            "report": copy.deepcopy(rep),
+            "artifact_dir": str(Path(artifact_dir).resolve()) if artifact_dir else None,
+        }
+        self._remember(key, entry)
+        if self.disk_dir is not None:
+            p = self._disk_path(key)
+            try:
+                p.parent.mkdir(parents=True, exist_ok=True)
+                tmp = p.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+                tmp.write_text(json.dumps(entry, ensure_ascii=False), encoding="utf-8")
+                os.replace(tmp, p)
+            except OSError:
+                pass
+
+
+# modules every check result depends on besides its own
+_SHARED_SOURCES = ("preproc.py", "jpegdct.py", "tiling.py")
+
+
+def code_digest(fn: Callable | None = None) -> str:
+    """Digest of the code behind ``fn``: its module source, the shared
+    preprocessing modules and :data:`CACHE_VERSION`."""
+
+    here = Path(__file__).resolve().parent
+    files = [str(here / name) for name in _SHARED_SOURCES]
+    if fn is not None:
+        try:
+            files.append(inspect.getsourcefile(inspect.unwrap(fn)))
+        except TypeError:
+            files.append(repr(fn))  # builtins: no source to hash
+    h = hashlib.sha256(f"v{CACHE_VERSION}".encode("ascii"))
+    for f in files:
+        h.update(b"\0" + (file_digest(f) if f and os.path.isfile(f) else str(f)).encode("utf-8"))
+    return h.hexdigest()
+
+
+def stage_key(img_digest: str, stage: str, params: Any, code: str) -> str:
+    blob = json.dumps([stage, _canonical_params(params), code], sort_keys=True, separators=(",", ":"), default=str)
+    return cache_key(img_digest, hashlib.sha256(blob.encode("utf-8")).hexdigest())
+
+
+class StageCache:
+    """On-disk cache of per-stage intermediates (check results, preproc planes).
+
+    Every entry is an ``.npz`` file under ``disk_dir/<key[:2]>/<key>.npz``:
+    arrays are stored with their exact dtype, so a cached check result
+    scores and fuses exactly like a fresh one; the JSON part (score, meta)
+    is kept as a byte array, so files load with ``allow_pickle=False``.
+    Entries are not compressed: float heatmaps barely shrink under deflate,
+    which would cost more than the check it saves on the first run.
+    Writes go through a temporary file and ``os.replace``, so concurrent
+    workers and interrupted runs never leave a partial entry behind.
+    """
+
+    def __init__(self, disk_dir: str):
+        self.disk_dir = Path(disk_dir)
+        self.disk_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "writes": 0}
+
+    def _path(self, key: str) -> Path:
+        return self.disk_dir / key[:2] / f"{key}.npz"
+
+    def _count(self, stat: str) -> None:
+        with self._lock:
+            self.stats[stat] += 1
+
+    def load(self, key: str) -> Optional[Tuple[Dict[str, Any], Dict[str, np.ndarray]]]:
+        """``(json_part, arrays)`` stored under ``key``, or ``None``."""
+
+        try:
+            with np.load(self._path(key), allow_pickle=False) as z:
+                arrays = {k: z[k] for k in z.files}
+            doc = json.loads(arrays.pop("__json__").tobytes().decode("utf-8"))
+        except (OSError, ValueError, KeyError):
+            self._count("misses")
+            return None
+        self._count("hits")
+        return doc, arrays
+
+    def store(self, key: str, doc: Dict[str, Any], arrays: Dict[str, np.ndarray]) -> bool:
+        try:
+            blob = json.dumps(doc, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        except (TypeError, ValueError):
+            return False  # not JSON data: the fresh result is used, not cached
+        payload = {"__json__": np.frombuffer(blob, dtype=np.uint8), **arrays}
+        p = self._path(key)
+        try:
+            p.parent.mkdir(parents=True, exist_ok=True)
+            buf = io.BytesIO()
+            np.savez(buf, **payload)
+            tmp = p.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp.write_bytes(buf.getvalue())
+            os.replace(tmp, p)
+        except OSError:
+            return False
+        self._count("writes")
+        return True
+
+    # --- check results ---
+    def get_result(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self.load(key)
+        if entry is None:
+            return None
+        doc, arrays = entry
+        return {"name": doc["name"], "score": doc["score"], "map": arrays.get("map"), "meta": doc["meta"]}
+
+    def put_result(self, key: str, res: Dict[str, Any]) -> bool:
+        if "error" in (res.get("meta") or {}):
+            return False  # failures (model load, bad input) are retried on the next run
+        hm = res.get("map")
+        arrays = {} if hm is None else {"map": np.asarray(hm)}
+        return self.store(key, {"name": res["name"], "score": res["score"], "meta": res.get("meta", {})}, arrays)
+
+
+_STAGE_CACHES: Dict[str, StageCache] = {}
+_STAGE_LOCK = threading.Lock()
+
+
+def stage_cache(disk_dir: str) -> StageCache:
+    """Process-wide :class:`StageCache` over ``disk_dir`` (stats shared across images)."""
+
+    key = str(Path(disk_dir).resolve())
+    with _STAGE_LOCK:
+        cache = _STAGE_CACHES.get(key)
+        if cache is None:
+            cache = _STAGE_CACHES[key] = StageCache(key)
+        return cache
@@ -4,7 +4,8 @@ from __future__ import annotations
 
 import numpy as np
 
-from ..preproc import PreprocCache
+from .. import jpegdct
+from ..preproc import PreprocCache, as_preproc_cache
 
 
 def run(img_or_cache, params=None):
@@ -15,16 +16,31 @@ def run(img_or_cache, params=None):
     img_or_cache:
         Either a PIL image or :class:`PreprocCache` instance.
     params:
-        Optional parameters dictionary. Supported key ``q`` for block size.
+        Optional parameters dictionary. Supported keys ``q`` for block size,
+        ``full_res`` to measure the grid on the native-resolution image
+        instead of the resized one and ``mode``: ``"pixel"`` (default) or
+        ``"dct"``, which reads the quantization tables of a JPEG source and
+        maps the windows whose 8x8 grid is shifted from the image's (see
+        :func:`idtamper.jpegdct.grid_alignment`; params ``win``,
+        ``top_percent``). Non-JPEG inputs fall back to ``"pixel"``.
     """
 
     p = params or {}
     q = int(p.get("q", 8))
+    full_res = bool(p.get("full_res", False))
+    fallback_reason = None
+    if p.get("mode", "pixel") == "dct":
+        cache = as_preproc_cache(img_or_cache)
+        if 0 in cache.jpeg_tables:
+            return _run_dct(cache, p)
+        fallback_reason = "no JPEG quantization tables"
 
-    if isinstance(img_or_cache, PreprocCache):
-        arr = img_or_cache.gray.astype(np.float32)
+    if isinstance(img_or_cache, PreprocCache) and full_res:
+        arr = np.asarray(img_or_cache.native.convert("L"), dtype=np.float32) / 255.0
+    elif isinstance(img_or_cache, PreprocCache):
+        arr = img_or_cache.gray01
     else:
-        arr = np.asarray(img_or_cache.convert("L"), dtype=np.float32)
+        arr = np.asarray(img_or_cache.convert("L"), dtype=np.float32) / 255.0
 
     H, W = arr.shape
     gy = np.abs(np.diff(arr, axis=0, prepend=arr[:1, :]))
@@ -38,15 +54,40 @@ def run(img_or_cache, params=None):
     hm = (bm - bm.min()) / (bm.max() - bm.min() + 1e-8)
     on = bm[(np.indices(bm.shape)[0] % q == 0) | (np.indices(bm.shape)[1] % q == 0)]
     off = bm[(np.indices(bm.shape)[0] % q != 0) & (np.indices(bm.shape)[1] % q != 0)]
-    on_m = float(on.mean()) if on.size else 0.0
-    off_m = float(off.mean()) if off.size else 0.0
-    std = float(bm.std() + 1e-6)
+    # statistics are reported on the 0-255 scale
+    on_m = float(on.mean()) * 255.0 if on.size else 0.0
+    off_m = float(off.mean()) * 255.0 if off.size else 0.0
+    std = float(bm.std()) * 255.0 + 1e-6
     score = max(0.0, min(1.0, (on_m - off_m) / std))
 
-    return {
+    out = {
         "name": "jpeg_blockiness",
         "score": score,
         "map": hm,
-        "meta": {"q": q, "on_mean": on_m, "off_mean": off_m, "std": std},
+        "meta": {"q": q, "full_res": full_res, "on_mean": on_m, "off_mean": off_m, "std": std},
     }
+    if fallback_reason:
+        out["meta"]["fallback_reason"] = fallback_reason
+    return out
+
+
+def _run_dct(cache: PreprocCache, p) -> dict:
+    win = int(p.get("win", 64))
+    tp = float(p.get("top_percent", 5.0))
+    quality, standard = jpegdct.estimate_quality(cache.jpeg_tables[0])
+    grid = jpegdct.grid_alignment(cache.native_luma, win=win)
+    hm = grid.map
+    thr = np.percentile(hm, 100.0 - tp)
+    top = hm[hm >= thr]
+    score = float(np.clip(top.mean(), 0.0, 1.0)) if top.size else 0.0
+    meta = {
+        "mode": "dct",
+        "quality": quality,
+        "standard_tables": standard,
+        "grid_offset": list(grid.offset),
+        "grid_contrast": grid.contrast,
+        "win": win,
+        "top_percent": tp,
+    }
+    return {"name": "jpeg_blockiness", "score": score, "map": hm, "meta": meta}
 
@@ -43,7 +43,7 @@ def run(img_or_cache, params=None):
     top_percent = float(p.get("top_percent", 2.0))
 
     if isinstance(img_or_cache, PreprocCache):
-        arr = img_or_cache.gray.astype(np.float32) / 255.0
+        arr = img_or_cache.gray01
     else:
         arr = np.asarray(img_or_cache.convert("L"), dtype=np.float32) / 255.0
 
@@ -2,11 +2,9 @@
 
 from __future__ import annotations
 
-import io
 import numpy as np
-from PIL import Image
 
-from ..preproc import PreprocCache
+from ..preproc import as_preproc_cache
 
 
 def run(img_or_cache, params=None):
@@ -17,18 +15,8 @@ def run(img_or_cache, params=None):
     scale = float(p.get("scale", 10.0))
     tp = float(p.get("top_percent", 5.0))
 
-    if isinstance(img_or_cache, PreprocCache):
-        pil_image = Image.fromarray(img_or_cache.img)
-    else:
-        pil_image = img_or_cache
-
-    buf = io.BytesIO()
-    pil_image.save(buf, "JPEG", quality=q)
-    rec = Image.open(io.BytesIO(buf.getvalue())).convert("RGB")
-    a = np.asarray(pil_image, dtype=np.int16)
-    b = np.asarray(rec, dtype=np.int16)
-    diff = np.abs(a - b).astype(np.float32)
-    gray = diff.mean(axis=2)
+    # the round trip is shared with jpeg_ghosts when it sweeps the same quality
+    gray = as_preproc_cache(img_or_cache).recompressed(q).diff
     s = scale / max(1.0, gray.mean())
     gray = np.clip(gray * s, 0, 255)
     hm = (gray - gray.min()) / (gray.max() - gray.min() + 1e-8)
@@ -2,44 +2,78 @@
 
 from __future__ import annotations
 
-import io
 import numpy as np
-from PIL import Image
 
-from ..preproc import PreprocCache
+from .. import jpegdct
+from ..preproc import PreprocCache, as_preproc_cache
 
 
 def run(img_or_cache, params=None):
-    """Execute JPEG ghost detection."""
+    """Execute JPEG ghost detection.
+
+    ``mode`` selects ``"pixel"`` (default: recompression sweep over
+    ``qualities``) or ``"dct"``: for a JPEG source, double quantization is
+    tested on its DCT coefficients without re-encoding (see
+    :func:`idtamper.jpegdct.dq_analysis`) and the map marks the blocks that
+    were not compressed twice. Non-JPEG inputs fall back to ``"pixel"``.
+    """
 
     p = params or {}
     qualities = p.get("qualities", [75, 85, 95])
     tp = float(p.get("top_percent", 5.0))
+    cache = as_preproc_cache(img_or_cache)
+
+    fallback_reason = None
+    if p.get("mode", "pixel") == "dct":
+        if 0 in cache.jpeg_tables:
+            return _run_dct(cache, p, tp)
+        fallback_reason = "no JPEG quantization tables"
 
-    if isinstance(img_or_cache, PreprocCache):
-        pil_image = Image.fromarray(img_or_cache.img)
-    else:
-        pil_image = img_or_cache
-
-    a = np.asarray(pil_image, dtype=np.int16)
-    acc = None
-    for q in qualities:
-        buf = io.BytesIO()
-        pil_image.save(buf, "JPEG", quality=int(q))
-        rec = Image.open(io.BytesIO(buf.getvalue())).convert("RGB")
-        b = np.asarray(rec, dtype=np.int16)
-        diff = np.abs(a - b).astype(np.float32).mean(axis=2)
-        acc = diff if acc is None else np.maximum(acc, diff)
+    acc = cache.ghost_map(qualities)
 
     hm = (acc - acc.min()) / (acc.max() - acc.min() + 1e-8)
     thr = np.percentile(acc, 100.0 - tp)
     top = acc[acc >= thr]
     score = float((top.mean() / 255.0) if top.size else 0.0)
 
+    meta = {"qualities": qualities, "top_percent": tp}
+    if fallback_reason:
+        meta["fallback_reason"] = fallback_reason
     return {
         "name": "jpeg_ghosts",
         "score": score,
         "map": hm,
-        "meta": {"qualities": qualities, "top_percent": tp},
+        "meta": meta,
     }
 
+
+def _box_mean(a: np.ndarray, r: int) -> np.ndarray:
+    """Mean over the ``(2r+1) x (2r+1)`` neighbourhood (edge-padded)."""
+
+    k = 2 * r + 1
+    c = np.pad(a, r, mode="edge").cumsum(axis=0).cumsum(axis=1)
+    c = np.pad(c, ((1, 0), (1, 0)))
+    return ((c[k:, k:] - c[:-k, k:] - c[k:, :-k] + c[:-k, :-k]) / (k * k)).astype(np.float32)
+
+
+def _run_dct(cache: PreprocCache, p, tp: float) -> dict:
+    smooth = int(p.get("smooth", 2))
+    table = cache.jpeg_tables[0]
+    quality, _ = jpegdct.estimate_quality(table)
+    dq = jpegdct.dq_analysis(cache.native_dct, table)
+    hm = dq.map
+    if smooth > 0 and hm.size > 1:
+        # one block holds few coefficients: average over neighbouring blocks
+        hm = _box_mean(hm, smooth)
+    thr = np.percentile(hm, 100.0 - tp)
+    top = hm[hm >= thr]
+    # without double compression there is nothing to be inconsistent with
+    score = float(np.clip(dq.strength * (top.mean() if top.size else 0.0), 0.0, 1.0))
+    meta = {
+        "mode": "dct",
+        "quality": quality,
+        "primary_quality": dq.primary_quality,
+        "dq_strength": dq.strength,
+        "top_percent": tp,
+    }
+    return {"name": "jpeg_ghosts", "score": score, "map": hm, "meta": meta}
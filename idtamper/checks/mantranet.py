@@ -13,6 +13,9 @@ def run(pil_image, params=None):
       model_path: str | None
       input_size: [H,W] or None (auto from model if not given)
       top_percent: float (default 1.0)
+      tiled: bool (default False) -> native resolution in overlapping tiles of
+        the model input size (tile_overlap, tile_batch, max_mem_mb) instead
+        of one downsampled pass
       mock: bool (default False)
     Output: {name:'mantranet', score, map, meta}
     """
@@ -48,21 +51,29 @@ def run(pil_image, params=None):
                 except Exception:
                     Ht, Wt = 256, 256
                 logger.info("ManTraNet input size auto-detected as (%d,%d)", Ht, Wt)
-            im = pil_image.convert('RGB').resize((Wt, Ht))
-            arr = (np.asarray(im).astype('float32')/255.0)
-            if channels_first:
-                x = np.transpose(arr, (2,0,1))[None, ...]  # NCHW
+            if p.get('tiled'):
+                from idtamper.tiling import TileOptions, run_tiled, static_dims
+                nb, _, _ = static_dims(session)
+                arr = np.asarray(pil_image.convert('RGB')).astype('float32')/255.0
+                topts = TileOptions.from_params(p)
+                y = run_tiled(session, np.transpose(arr, (2,0,1)), topts, fixed_tile=min(Ht, Wt),
+                              max_batch=nb, channels_last=not channels_first)
             else:
-                x = arr[None, ...]
-            feeds = {inp.name: x}
-            outs = session.run(None, feeds)
-            y = outs[0]
-            y = np.asarray(y)
-            y = np.squeeze(y)
-            if y.ndim == 3:
-                y = y[0] if y.shape[0] in (1,2,3) else y[0]
-            if y.ndim != 2:
-                y = y.reshape((y.shape[-2], y.shape[-1]))
+                im = pil_image.convert('RGB').resize((Wt, Ht))
+                arr = (np.asarray(im).astype('float32')/255.0)
+                if channels_first:
+                    x = np.transpose(arr, (2,0,1))[None, ...]  # NCHW
+                else:
+                    x = arr[None, ...]
+                feeds = {inp.name: x}
+                outs = session.run(None, feeds)
+                y = outs[0]
+                y = np.asarray(y)
+                y = np.squeeze(y)
+                if y.ndim == 3:
+                    y = y[0] if y.shape[0] in (1,2,3) else y[0]
+                if y.ndim != 2:
+                    y = y.reshape((y.shape[-2], y.shape[-1]))
             hm = y.astype('float32')
             hm = hm - hm.min()
             denom = (hm.max()-hm.min()+1e-8)
@@ -72,7 +83,7 @@ def run(pil_image, params=None):
             topk = np.partition(flat, -k)[-k:]
             score = float(np.clip(topk.mean(), 0.0, 1.0))
             logger.info("ManTraNet inference completed: score=%.4f", score)
-            return {"name":"mantranet","score":score,"map":hm,"meta":{"input_size":[Ht,Wt],"top_percent":top_percent}}
+            return {"name":"mantranet","score":score,"map":hm,"meta":{"input_size":[Ht,Wt],"top_percent":top_percent,"tiled":bool(p.get('tiled'))}}
         except Exception as e:
             logger.error("ManTraNet inference failed: %s", e)
             return {"name":"mantranet","score":None,"map":None,"meta":{"reason":str(e)}}
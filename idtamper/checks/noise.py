@@ -42,7 +42,7 @@ def run(img_or_cache, params=None):
     top_percent = float(p.get("top_percent", 5.0))
 
     if isinstance(img_or_cache, PreprocCache):
-        arr = img_or_cache.gray.astype(np.float32) / 255.0
+        arr = img_or_cache.gray01
     else:
         arr = np.asarray(img_or_cache.convert("L"), dtype=np.float32) / 255.0
 
@@ -51,7 +51,7 @@ def run(img_or_cache, params=None):
 
         blur = float(p.get("blur_radius", 1.0))
         if isinstance(img_or_cache, PreprocCache):
-            pil = Image.fromarray(img_or_cache.img)
+            pil = img_or_cache.pil
         else:
             pil = img_or_cache
         arr_blur = np.asarray(
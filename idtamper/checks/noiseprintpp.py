@@ -1,6 +1,8 @@
 import numpy as np
 from PIL import Image
 
+from ..tiling import TileOptions, run_tiled, static_dims
+
 def _mock_forward(H, W, seed=0):
     rng = np.random.RandomState(seed)
     base = rng.randn(H, W).astype(np.float32) * 0.1
@@ -10,6 +12,7 @@ def _mock_forward(H, W, seed=0):
 
 def run(pil_image, params=None):
     p = params or {}
+    tiled = None
     mock = bool(p.get('mock', False))
     top_percent = float(p.get('score_top_percent', 5.0))
     blk = int(p.get('block', 32))
@@ -30,13 +33,21 @@ def run(pil_image, params=None):
         in_name = sess.get_inputs()[0].name
         out_name = sess.get_outputs()[0].name
         arr = np.asarray(pil_image.convert('RGB'))
-        Ht, Wt = (p.get('input_size') or [arr.shape[0], arr.shape[1]])
-        arr = np.array(Image.fromarray(arr).resize((Wt, Ht), Image.BILINEAR), dtype=np.float32) / 255.0
-        x = np.transpose(arr, (2, 0, 1))[None, ...].astype(np.float32)
-        resid = sess.run([out_name], {in_name: x})[0]
-        resid = np.squeeze(resid).astype(np.float32)
-        if resid.ndim == 3:
-            resid = resid[0] if resid.shape[0] <= 3 else resid.mean(axis=0)
+        topts = TileOptions.from_params(p)
+        if not p.get('input_size') and topts.tile > 0 and max(arr.shape[:2]) > topts.tile:
+            # full resolution in overlapping tiles: memory bounded by tile/batch, not by image size
+            nb, _, _ = static_dims(sess)
+            x = np.transpose(arr.astype(np.float32) / 255.0, (2, 0, 1))
+            resid = run_tiled(sess, x, topts, max_batch=nb)
+            tiled = {"tile": topts.tile, "overlap": topts.overlap}
+        else:
+            Ht, Wt = (p.get('input_size') or [arr.shape[0], arr.shape[1]])
+            arr = np.array(Image.fromarray(arr).resize((Wt, Ht), Image.BILINEAR), dtype=np.float32) / 255.0
+            x = np.transpose(arr, (2, 0, 1))[None, ...].astype(np.float32)
+            resid = sess.run([out_name], {in_name: x})[0]
+            resid = np.squeeze(resid).astype(np.float32)
+            if resid.ndim == 3:
+                resid = resid[0] if resid.shape[0] <= 3 else resid.mean(axis=0)
     H, W = resid.shape[:2]
     emap = np.zeros((H, W), dtype=np.float32)
     for y in range(0, H, blk):
@@ -50,4 +61,4 @@ def run(pil_image, params=None):
     score = float(np.clip(topk.mean(), 0.0, 1.0))
     W0, H0 = pil_image.size
     emap_rs = np.array(Image.fromarray((emap * 255).astype('uint8')).resize((W0, H0), Image.BILINEAR), dtype=np.float32) / 255.0
-    return {"name": "noiseprintpp", "score": score, "map": emap_rs, "meta": {"block": blk, "top_percent": top_percent}}
+    return {"name": "noiseprintpp", "score": score, "map": emap_rs, "meta": {"block": blk, "top_percent": top_percent, **({"tiled": tiled} if tiled else {})}}
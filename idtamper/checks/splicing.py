@@ -50,7 +50,7 @@ def run(img_or_cache, params=None):
     win = int(p.get("win", 7))
 
     if isinstance(img_or_cache, PreprocCache):
-        im = Image.fromarray(img_or_cache.img)
+        im = img_or_cache.pil
         arr = img_or_cache.ycbcr.astype(np.float32)
     else:
         im = img_or_cache
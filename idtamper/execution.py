@@ -3,9 +3,11 @@ from __future__ import annotations
 """Execution utilities for controlling parallelism and thread usage."""
 
 from dataclasses import dataclass
+import concurrent.futures as cf
 import contextlib
 import os
-from typing import Dict, Iterator
+import threading
+from typing import Any, Callable, Dict, Iterator, Sequence, Tuple
 
 import onnxruntime as ort
 
@@ -19,22 +21,54 @@ class ParallelConfig:
     max_parallel_images:
         Maximum number of images to process in parallel at the pipeline level.
     parallel_signal_checks:
-        Whether to parallelise classic signal based checks for a single image
-        using a thread pool.
+        Whether to run the checks of a single image concurrently as a
+        dependency graph (see :func:`run_dag`), overlapping the ONNX checks
+        with the signal based ones.
     onnx_intra_threads:
-        Number of intra-op threads used by ONNX Runtime sessions.
+        Number of intra-op threads used by ONNX Runtime sessions; ``0``
+        derives it from the process CPU budget (see :func:`onnx_threads`).
     onnx_inter_threads:
         Number of inter-op threads used by ONNX Runtime sessions.
     env_thread_caps:
         If ``True`` set environment thread related variables such as
         ``OMP_NUM_THREADS`` to avoid oversubscription.
+    pool_kind:
+        ``"thread"`` or ``"process"``; kind of pool used by
+        :class:`BoundedExecutor`.
+    max_queue:
+        Number of submissions a :class:`BoundedExecutor` accepts beyond the
+        ``max_parallel_images`` running ones before rejecting new work.
+    cpu_budget:
+        Total CPU threads for the analysis (``0`` = cores available to the
+        process). Image-level worker processes split it evenly; within a
+        process checks run on a long-lived executor holding that many
+        tokens, see :func:`process_cpu_budget`.
+    prefetch:
+        Images decoded ahead of the one being analyzed when a batch runs in
+        the calling process (decode, compute and write stages overlap).
+    io_workers:
+        Threads writing heatmaps, overlays and ``report.json`` for such
+        batches; ``0`` writes them inline after each image.
+    onnx_batch:
+        Largest micro-batch of single-image ONNX calls gathered across
+        concurrent images (see :mod:`idtamper.batching`); ``1`` disables
+        batching, ``0`` uses the process default (:func:`set_process_batching`).
+    onnx_batch_wait_ms:
+        How long the first call of a micro-batch waits for more inputs.
     """
 
     max_parallel_images: int = 1
     parallel_signal_checks: bool = True
-    onnx_intra_threads: int = 1
+    onnx_intra_threads: int = 0
     onnx_inter_threads: int = 1
     env_thread_caps: bool = True
+    pool_kind: str = "thread"
+    max_queue: int = 8
+    cpu_budget: int = 0
+    prefetch: int = 2
+    io_workers: int = 1
+    onnx_batch: int = 0
+    onnx_batch_wait_ms: float = 5.0
 
 
 _THREAD_VARS = [
@@ -53,7 +87,7 @@ def apply_thread_env(config: ParallelConfig) -> Iterator[None]:
     if config.env_thread_caps:
         for v in _THREAD_VARS:
             old[v] = os.environ.get(v, "")
-            os.environ[v] = str(config.onnx_intra_threads)
+            os.environ[v] = str(onnx_threads(config))
     try:
         yield
     finally:
@@ -69,7 +103,272 @@ def init_onnx_session_opts(config: ParallelConfig) -> ort.SessionOptions:
     """Create ONNX Runtime ``SessionOptions`` according to the configuration."""
 
     opts = ort.SessionOptions()
-    opts.intra_op_num_threads = int(config.onnx_intra_threads)
+    opts.intra_op_num_threads = onnx_threads(config)
     opts.inter_op_num_threads = int(config.onnx_inter_threads)
     opts.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
     return opts
+
+
+class PoolSaturated(RuntimeError):
+    """Raised by :class:`BoundedExecutor` when no queue slot is free."""
+
+
+class BoundedExecutor:
+    """Thread or process pool with a bounded number of pending submissions.
+
+    At most ``max_parallel_images`` tasks run at once and at most
+    ``max_queue`` more wait for a worker; further :meth:`submit` calls raise
+    :class:`PoolSaturated` instead of growing the backlog.
+    """
+
+    def __init__(
+        self,
+        config: ParallelConfig,
+        initializer: Callable[..., Any] | None = None,
+        initargs: tuple = (),
+    ) -> None:
+        self.workers = max(1, int(config.max_parallel_images))
+        self.max_queue = max(0, int(config.max_queue))
+        if config.pool_kind == "process":
+            self._ex: cf.Executor = cf.ProcessPoolExecutor(
+                max_workers=self.workers, initializer=initializer, initargs=initargs
+            )
+        elif config.pool_kind == "thread":
+            self._ex = cf.ThreadPoolExecutor(
+                max_workers=self.workers,
+                thread_name_prefix="idtamper",
+                initializer=initializer,
+                initargs=initargs,
+            )
+        else:
+            raise ValueError(f"unknown pool_kind: {config.pool_kind!r}")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.rejected = 0
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    @property
+    def in_flight(self) -> int:
+        return min(self._pending, self.workers)
+
+    @property
+    def queue_depth(self) -> int:
+        return max(0, self._pending - self.workers)
+
+    def _release(self, _fut: cf.Future) -> None:
+        with self._lock:
+            self._pending -= 1
+
+    def submit(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> cf.Future:
+        with self._lock:
+            if self._pending >= self.workers + self.max_queue:
+                self.rejected += 1
+                raise PoolSaturated(
+                    f"{self._pending} tasks pending (workers={self.workers}, max_queue={self.max_queue})"
+                )
+            self._pending += 1
+        try:
+            fut = self._ex.submit(fn, *args, **kwargs)
+        except BaseException:
+            with self._lock:
+                self._pending -= 1
+            raise
+        fut.add_done_callback(self._release)
+        return fut
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._ex.shutdown(wait=wait)
+
+
+DagNode = Tuple[Callable[[Dict[str, Any]], Any], Sequence[str]]
+
+
+def run_dag(
+    nodes: Dict[str, DagNode],
+    *,
+    parallel: bool = True,
+    max_workers: int | None = None,
+    priority: Callable[[str], Any] | None = None,
+    executor: cf.Executor | None = None,
+    placement: Callable[[str], cf.Executor | None] | None = None,
+) -> Dict[str, Any]:
+    """Run a dependency graph of callables and return ``name -> result``.
+
+    Each node is ``(fn, deps)``; ``fn`` receives a dict with the results of
+    ``deps`` and runs as soon as they are available. Ready nodes are submitted
+    in ``priority`` order (then insertion order), so expensive nodes can be
+    started first. With ``parallel=False`` nodes run one at a time in the
+    calling thread. An exception raised by a node propagates to the caller.
+    Nodes run on ``executor`` when given (it is not shut down), otherwise on
+    a temporary thread pool; ``placement`` may send a node to another
+    executor instead.
+    """
+
+    for name, (_fn, deps) in nodes.items():
+        missing = [d for d in deps if d not in nodes]
+        if missing:
+            raise ValueError(f"node {name!r} depends on unknown nodes {missing}")
+    order = list(nodes)
+    if priority is not None:
+        order.sort(key=priority)
+
+    done: Dict[str, Any] = {}
+    pending = list(order)
+
+    def _ready() -> list:
+        return [n for n in pending if all(d in done for d in nodes[n][1])]
+
+    def _args(n: str) -> Dict[str, Any]:
+        return {d: done[d] for d in nodes[n][1]}
+
+    if not parallel:
+        while pending:
+            ready = _ready()
+            if not ready:
+                raise ValueError(f"dependency cycle among {pending}")
+            n = ready[0]
+            pending.remove(n)
+            done[n] = nodes[n][0](_args(n))
+        return done
+
+    if executor is None:
+        workers = max_workers or max(1, len(nodes))
+        with cf.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="idtamper-dag") as ex:
+            return run_dag(nodes, priority=priority, executor=ex, placement=placement)
+
+    running: Dict[cf.Future, str] = {}
+    try:
+        while pending or running:
+            for n in _ready():
+                pending.remove(n)
+                ex = (placement(n) if placement is not None else None) or executor
+                running[ex.submit(nodes[n][0], _args(n))] = n
+            if not running:
+                raise ValueError(f"dependency cycle among {pending}")
+            finished, _ = cf.wait(running, return_when=cf.FIRST_COMPLETED)
+            for fut in finished:
+                done[running.pop(fut)] = fut.result()
+    finally:
+        # a shared executor outlives this call: do not leave work behind
+        for fut in running:
+            fut.cancel()
+        cf.wait(running)
+    return done
+
+
+def available_cpus() -> int:
+    """CPUs this process may run on (affinity/cgroup aware where supported)."""
+    try:
+        return max(1, len(os.sched_getaffinity(0)))
+    except AttributeError:  # pragma: no cover - non-Linux
+        return max(1, os.cpu_count() or 1)
+
+
+class CpuBudget:
+    """CPU tokens of a process plus a long-lived executor sized to them.
+
+    Every unit of work holds tokens while it runs (:meth:`hold`); ONNX checks
+    hold one per intra-op thread. Concurrent images in the same process share
+    the tokens, so runnable threads stay within :attr:`tokens`.
+    """
+
+    def __init__(self, tokens: int) -> None:
+        self.tokens = max(1, int(tokens))
+        self._free = self.tokens
+        self._cond = threading.Condition()
+        self.executor = cf.ThreadPoolExecutor(max_workers=self.tokens, thread_name_prefix="idtamper-check")
+
+    @property
+    def in_use(self) -> int:
+        return self.tokens - self._free
+
+    @contextlib.contextmanager
+    def hold(self, n: int = 1) -> Iterator[None]:
+        n = max(1, min(int(n), self.tokens))
+        with self._cond:
+            while self._free < n:
+                self._cond.wait()
+            self._free -= n
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._free += n
+                self._cond.notify_all()
+
+
+_BUDGETS: Dict[int, CpuBudget] = {}
+_BUDGET_LOCK = threading.Lock()
+_PROCESS_SHARE = 1
+_PROCESS_TOTAL = 0
+_PROCESS_BATCH = 1
+
+
+def _reset_budgets_after_fork() -> None:
+    # executor threads and held tokens do not survive fork()
+    global _BUDGET_LOCK
+    _BUDGETS.clear()
+    _BUDGET_LOCK = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_budgets_after_fork)
+
+
+def set_process_share(n_processes: int, cpu_budget: int = 0) -> None:
+    """Declare that this process is one of ``n_processes`` image-level workers
+    sharing ``cpu_budget`` CPUs (``0`` = available CPUs). The total applies
+    to configs that do not set their own ``cpu_budget``."""
+    global _PROCESS_SHARE, _PROCESS_TOTAL
+    _PROCESS_SHARE = max(1, int(n_processes))
+    _PROCESS_TOTAL = max(0, int(cpu_budget))
+
+
+def set_process_batching(max_batch: int) -> None:
+    """Default ``onnx_batch`` of this process, for configs leaving it at ``0``."""
+    global _PROCESS_BATCH
+    _PROCESS_BATCH = max(1, int(max_batch))
+
+
+def onnx_batch_size(config: ParallelConfig) -> int:
+    """Largest cross-image ONNX micro-batch for ``config`` (``1`` = off)."""
+    return max(1, int(config.onnx_batch) or _PROCESS_BATCH)
+
+
+def process_cpu_tokens(config: ParallelConfig) -> int:
+    """CPU tokens of this process (see :func:`process_cpu_budget`)."""
+    total = int(config.cpu_budget) or _PROCESS_TOTAL or available_cpus()
+    return max(1, total // _PROCESS_SHARE)
+
+
+def onnx_threads(config: ParallelConfig) -> int:
+    """Intra-op threads for ONNX sessions.
+
+    An explicit ``onnx_intra_threads`` wins; otherwise half of the process
+    tokens, so the two ONNX checks of an image can run side by side within
+    the budget.
+    """
+    if int(config.onnx_intra_threads) > 0:
+        return int(config.onnx_intra_threads)
+    return max(1, process_cpu_tokens(config) // 2)
+
+
+def process_cpu_budget(config: ParallelConfig) -> CpuBudget:
+    """Process-wide :class:`CpuBudget` derived from ``config``.
+
+    ``config.cpu_budget`` (or the available CPUs) is divided by the number of
+    image-level worker processes declared with :func:`set_process_share`.
+    The budget and its executor are created once per process and size.
+    """
+
+    tokens = process_cpu_tokens(config)
+    budget = _BUDGETS.get(tokens)
+    if budget is None:
+        with _BUDGET_LOCK:
+            budget = _BUDGETS.get(tokens)
+            if budget is None:
+                budget = _BUDGETS[tokens] = CpuBudget(tokens)
+    return budget
@@ -0,0 +1,272 @@
+from __future__ import annotations
+
+"""JPEG features read from the compressed domain, without re-encoding.
+
+The quantization tables come straight from the file header
+(``Image.quantization``), so :func:`estimate_quality` costs no decoding.
+The 8x8 DCT coefficients are recomputed from the decoded luminance on the
+JPEG grid: since the last compression left every block on the lattice of
+its quantization table, ``round(coef / q)`` gives back the stored integers
+up to the decoder's rounding noise. On top of them:
+
+- :func:`dq_analysis` detects aligned double quantization (a JPEG saved
+  again at a higher quality leaves periodically empty histogram bins) and
+  maps the blocks that do not follow it, i.e. content pasted after the
+  first compression;
+- :func:`grid_alignment` finds the dominant 8x8 blocking grid of each window
+  and maps the windows whose grid is shifted from the global one.
+"""
+
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+# IJG (libjpeg) reference tables, natural order; Pillow reports tables in the same order
+STD_LUMA = np.array(
+    [
+        [16, 11, 10, 16, 24, 40, 51, 61],
+        [12, 12, 14, 19, 26, 58, 60, 55],
+        [14, 13, 16, 24, 40, 57, 69, 56],
+        [14, 17, 22, 29, 51, 87, 80, 62],
+        [18, 22, 37, 56, 68, 109, 103, 77],
+        [24, 35, 55, 64, 81, 104, 113, 92],
+        [49, 64, 78, 87, 103, 121, 120, 101],
+        [72, 92, 95, 98, 112, 100, 103, 99],
+    ],
+    dtype=np.float32,
+)
+STD_CHROMA = np.full((8, 8), 99, dtype=np.float32)
+STD_CHROMA[:4, :4] = [[17, 18, 24, 47], [18, 21, 26, 66], [24, 26, 56, 99], [47, 66, 99, 99]]
+
+# low-frequency AC modes in zigzag order: the ones with enough non-zero coefficients
+AC_MODES: Tuple[Tuple[int, int], ...] = (
+    (0, 1), (1, 0), (2, 0), (1, 1), (0, 2), (0, 3), (1, 2), (2, 1), (3, 0),
+    (4, 0), (3, 1), (2, 2), (1, 3), (0, 4),
+)
+
+
+def _dct_matrix() -> np.ndarray:
+    k = np.arange(8)
+    d = np.cos((2 * k[None, :] + 1) * k[:, None] * np.pi / 16) * np.sqrt(2 / 8)
+    d[0] /= np.sqrt(2)
+    return d.astype(np.float32)
+
+
+_D = _dct_matrix()
+
+
+def ijg_table(quality: int, chroma: bool = False) -> np.ndarray:
+    """Table libjpeg writes for ``quality`` (1-100)."""
+
+    q = min(100, max(1, int(quality)))
+    scale = 5000.0 / q if q < 50 else 200.0 - 2.0 * q
+    base = STD_CHROMA if chroma else STD_LUMA
+    return np.clip(np.floor((base * scale + 50.0) / 100.0), 1, 255).astype(np.float32)
+
+
+_IJG_LUMA = np.stack([ijg_table(q) for q in range(1, 101)])
+
+
+def quant_tables(quantization) -> Dict[int, np.ndarray]:
+    """``Image.quantization`` as 8x8 float32 tables (empty for non-JPEG)."""
+
+    if not quantization:
+        return {}
+    return {int(k): np.asarray(list(v), dtype=np.float32).reshape(8, 8) for k, v in quantization.items() if len(v) == 64}
+
+
+def estimate_quality(table: np.ndarray) -> Tuple[int, bool]:
+    """``(quality, exact)``: IJG quality whose luma table is closest to ``table``.
+
+    ``exact`` is true when the table is the IJG one (libjpeg, Pillow, most
+    editors); camera firmware tables only map to the nearest quality.
+    """
+
+    err = np.abs(_IJG_LUMA - np.asarray(table, dtype=np.float32)[None]).mean(axis=(1, 2))
+    i = int(np.argmin(err))
+    return i + 1, bool(err[i] == 0.0)
+
+
+def luma(rgb: np.ndarray) -> np.ndarray:
+    """JFIF luminance of an RGB array as float32 (no rounding to uint8)."""
+
+    rgb = np.asarray(rgb, dtype=np.float32)
+    return rgb[..., 0] * 0.299 + rgb[..., 1] * 0.587 + rgb[..., 2] * 0.114
+
+
+def block_dct(y: np.ndarray) -> np.ndarray:
+    """8x8 DCT of the blocks of ``y`` on the JPEG grid: ``(By, Bx, 8, 8)``.
+
+    Partial blocks at the right and bottom edges are dropped.
+    """
+
+    By, Bx = y.shape[0] // 8, y.shape[1] // 8
+    blocks = np.asarray(y[: By * 8, : Bx * 8], dtype=np.float32).reshape(By, 8, Bx, 8).transpose(0, 2, 1, 3)
+    return _D @ (blocks - 128.0) @ _D.T
+
+
+@dataclass
+class DQResult:
+    """Outcome of :func:`dq_analysis`.
+
+    Attributes
+    ----------
+    strength:
+        0 (single compression) to 1 (every checked bin left empty by the
+        primary quantization).
+    primary_quality:
+        IJG quality of the most likely first compression, ``None`` without
+        evidence of one.
+    map:
+        Per-block share, in ``[0, 1]``, of the checked coefficients that fall
+        in bins the primary quantization leaves empty. High values mark
+        blocks that were not compressed twice.
+    modes:
+        DCT modes that took part in the test.
+    """
+
+    strength: float
+    primary_quality: int | None
+    map: np.ndarray
+    modes: List[Tuple[int, int]] = field(default_factory=list)
+
+
+def _empty_bins(q1: float, q2: float, radius: int) -> np.ndarray:
+    """Bins ``-radius..radius`` that ``round(k1 * q1 / q2)`` never reaches."""
+
+    k1 = np.arange(-int(radius * q2 / q1) - 2, int(radius * q2 / q1) + 3)
+    hit = np.rint(k1 * (q1 / q2)).astype(np.int64) + radius
+    empty = np.ones(2 * radius + 1, dtype=bool)
+    empty[hit[(hit >= 0) & (hit <= 2 * radius)]] = False
+    return empty
+
+
+def dq_analysis(
+    coefs: np.ndarray, table: np.ndarray, radius: int = 20, min_q: float = 2.0, min_expected: float = 200.0
+) -> DQResult:
+    """Test aligned double quantization on the DCT ``coefs`` of a JPEG.
+
+    For every candidate primary quality the counts in the bins its table
+    leaves empty after requantization with ``table`` are compared with what
+    their neighbours predict: a double-compressed image has (almost)
+    nothing in them, a single compressed one has a smooth histogram.
+    Candidates predicting fewer than ``min_expected`` coefficients there
+    are not tested. Only low-frequency modes with a
+    step of at least ``min_q`` are used (smaller steps drown in the
+    decoder's rounding). Among qualities that explain the histogram about
+    equally well the lowest wins: a coarser primary table predicts more
+    empty bins, so it only fits if they really are empty.
+    """
+
+    By, Bx = coefs.shape[:2]
+    table = np.asarray(table, dtype=np.float32)
+    modes = [m for m in AC_MODES if table[m] >= min_q]
+    ks = {m: np.clip(np.rint(coefs[:, :, m[0], m[1]] / table[m]).astype(np.int64), -radius, radius) for m in modes}
+    hists = {m: np.bincount((k + radius).ravel(), minlength=2 * radius + 1).astype(np.float64) for m, k in ks.items()}
+
+    scored = []
+    for q1 in range(50, 100):
+        t1 = _IJG_LUMA[q1 - 1]
+        seen = expected = 0.0
+        used = []
+        for m in modes:
+            if t1[m] <= table[m]:
+                continue  # no empty bins: requantizing to a coarser or equal step
+            empty = _empty_bins(float(t1[m]), float(table[m]), radius)
+            # the outer bins hold the clipped tails, their neighbours cannot be predicted
+            empty[:2] = empty[-2:] = False
+            empty[radius] = False  # zeros are always reachable and dominate the histogram
+            if not empty.any():
+                continue
+            h = hists[m]
+            # what a smooth (single compression) histogram would put there;
+            # next to zero only the outer neighbour is comparable
+            around = (np.roll(h, 1) + np.roll(h, -1)) / 2.0
+            around[radius - 1], around[radius + 1] = h[radius - 2], h[radius + 2]
+            seen += float(h[empty].sum())
+            expected += float(around[empty].sum())
+            used.append(m)
+        if expected >= min_expected:
+            scored.append((max(0.0, 1.0 - seen / expected), q1, used))
+
+    best_q, best_s, best_modes = None, 0.0, []
+    if scored:
+        top = max(s for s, _, _ in scored)
+        if top > 0:
+            fits = [x for x in scored if x[0] > 0 and x[0] >= top - 0.05]
+            best_s, best_q, best_modes = min(fits, key=lambda x: x[1])
+
+    hits = np.zeros((By, Bx), dtype=np.float32)
+    seen = np.zeros((By, Bx), dtype=np.float32)
+    if best_q is not None:
+        t1 = _IJG_LUMA[best_q - 1]
+        for m in best_modes:
+            empty = _empty_bins(float(t1[m]), float(table[m]), radius)
+            empty[[0, -1]] = False
+            k = ks[m]
+            nz = k != 0
+            hits += (empty[k + radius] & nz).astype(np.float32)
+            seen += nz.astype(np.float32)
+    dq_map = np.where(seen > 0, hits / np.maximum(seen, 1.0), 0.0).astype(np.float32)
+    return DQResult(float(best_s), best_q, dq_map, best_modes)
+
+
+@dataclass
+class GridResult:
+    """Outcome of :func:`grid_alignment`.
+
+    Attributes
+    ----------
+    offset:
+        ``(dy, dx)`` of the dominant 8x8 grid of the whole image.
+    contrast:
+        Strength of that grid (peak over median of the phase profile, minus 1).
+    map:
+        Per-window misalignment in ``[0, 1]``: 0 while the window's own grid
+        leads the one at ``offset`` by at most ``z0`` noise units, 1 from
+        ``3 * z0`` on.
+    """
+
+    offset: Tuple[int, int]
+    contrast: float
+    map: np.ndarray
+
+
+def _phase_contrast(profile: np.ndarray) -> float:
+    return float(profile.max() / max(float(np.median(profile)), 1e-6) - 1.0)
+
+
+def grid_alignment(y: np.ndarray, win: int = 64, z0: float = 2.0) -> GridResult:
+    """Blocking-artifact grid of ``y`` (native-resolution luminance).
+
+    JPEG blocking leaves larger pixel steps across the block boundaries, so
+    the sum of ``|y[x] - y[x-1]|`` per column phase ``x mod 8`` peaks at the
+    grid (and likewise per row). The phase is taken over the whole image and
+    over every ``win x win`` window; the noise unit of a window is the spread
+    of its six weakest phases.
+    """
+
+    win = max(8, int(win) // 8 * 8)
+    y = np.asarray(y, dtype=np.float32)
+    gx = np.zeros_like(y)
+    gy = np.zeros_like(y)
+    gx[:, 1:] = np.abs(np.diff(y, axis=1))
+    gy[1:, :] = np.abs(np.diff(y, axis=0))
+    Hw, Ww = y.shape[0] // win, y.shape[1] // win
+    if Hw == 0 or Ww == 0:
+        return GridResult((0, 0), 0.0, np.zeros((max(1, Hw), max(1, Ww)), dtype=np.float32))
+    n = win // 8
+    # (Hw, Ww, 8): boundary energy per column / row phase inside each window
+    px = gx[: Hw * win, : Ww * win].reshape(Hw, win, Ww, n, 8).sum(axis=(1, 3))
+    py = gy[: Hw * win, : Ww * win].reshape(Hw, n, 8, Ww, win).sum(axis=(1, 4)).transpose(0, 2, 1)
+    gpx, gpy = px.sum(axis=(0, 1)), py.sum(axis=(0, 1))
+    offset = (int(np.argmax(gpy)), int(np.argmax(gpx)))
+    contrast = min(_phase_contrast(gpx), _phase_contrast(gpy))
+
+    # lead of a window's own grid over the global one, in units of the spread
+    # of its non-grid phases (the noise a weak grid drowns in)
+    lead_x = (px.max(axis=-1) - px[..., offset[1]]) / np.maximum(np.sort(px, axis=-1)[..., :6].std(axis=-1), 1e-6)
+    lead_y = (py.max(axis=-1) - py[..., offset[0]]) / np.maximum(np.sort(py, axis=-1)[..., :6].std(axis=-1), 1e-6)
+    mis = np.clip((np.maximum(lead_x, lead_y) - z0) / (2.0 * z0), 0.0, 1.0).astype(np.float32)
+    return GridResult(offset, max(0.0, contrast), mis)
@@ -1,50 +1,92 @@
+import collections
+import contextlib
 import json
 import json
 import os
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
 import numpy as np
 from PIL import Image
 
-from .aggregate import DEFAULT_WEIGHTS, fuse_scores
-from .checks import (
-    blockiness,
-    copymove,
-    ela,
-    exif as exifcheck,
-    jpegghost,
-    mantranet,
-    noise,
-    noiseprintpp,
-    splicing,
+from .aggregate import DEFAULT_WEIGHTS, fuse_scores, score_bounds
+from .cache import ResultCache, StageCache, cache_key, code_digest, config_digest, image_digest, stage_cache, stage_key
+from .batching import batched_session, wait_executor
+from .execution import (
+    CpuBudget,
+    ParallelConfig,
+    apply_thread_env,
+    onnx_batch_size,
+    onnx_threads,
+    process_cpu_budget,
+    run_dag,
+    set_process_share,
 )
-from .execution import ParallelConfig, init_onnx_session_opts, apply_thread_env
-from .metrics import measure, embed_report_metrics, describe_runtime
-from .preproc import PreprocOptions, build_preproc_cache
-from .visualize import fuse_heatmaps, overlay_on_image, save_heatmap_gray
+from .metrics import CheckMetrics, Stopwatch, measure, embed_report_metrics, describe_runtime
+from .preproc import PreprocCache, PreprocOptions, SourceImage, as_source, build_preproc_cache
+from . import sessions as ort_sessions
+from . import shm
+from .registry import COST_CLASSES, CheckSpec, registered_checks
+from .visualize import MAPS_FILE, fuse_heatmaps, overlay_on_image, save_heatmap_gray, save_maps_npz
 
 import concurrent.futures as cf
-import onnxruntime as ort
 import cv2
 
-# cache for ONNX sessions inside worker processes
+# optional name -> session overrides; by default sessions come from the
+# process-wide registry in ``idtamper.sessions`` (keyed by model path)
 _ORT_SESS: Dict[str, Any] = {}
 
 
+# names of the built-in checks (see ``idtamper.registry``)
+CHECK_NAMES = tuple(spec.name for spec in registered_checks())
+
+# checks whose flags and heatmaps feed the confidence computation; pass them
+# as ``force_checks`` to compute it even when they carry no weight
+CONFIDENCE_CHECKS = ("noiseprintpp", "copy_move", "splicing", "noise_inconsistency")
+
+# artifact policies: what is produced besides scores
+ARTIFACTS_NONE = "none"  # scores only: no PNG encoding, overlay or file writes
+ARTIFACTS_MAPS = "maps"  # scores + heatmaps kept in memory (``report["maps"]``)
+ARTIFACTS_FULL = "full"  # PNG heatmaps, overlay and report.json on disk
+ARTIFACT_POLICIES = (ARTIFACTS_NONE, ARTIFACTS_MAPS, ARTIFACTS_FULL)
+
+# on-disk heatmap format for the ``full`` policy
+HEATMAPS_PNG = "png"  # PNG heatmaps and overlay encoded eagerly
+HEATMAPS_NPZ = "npz"  # uint8 maps in maps.npz, PNGs rendered on request (visualize.render_artifact)
+
+
 @dataclass
 class AnalyzerConfig:
     weights: Optional[Dict[str, float]] = None
     threshold: float = 0.30
     check_params: Optional[Dict[str, Any]] = None
     check_thresholds: Optional[Dict[str, float]] = None
-
-
-def _run_check(fn, name, inp, params, sessions):
+    artifacts: str = ARTIFACTS_FULL
+    heatmap_format: str = HEATMAPS_PNG
+    # run checks cheapest first and stop once the verdict can no longer change
+    cascade: bool = False
+    # execution plan: zero-weight and disabled checks are skipped unless forced
+    skip_ignored: bool = True
+    disabled_checks: Optional[List[str]] = None
+    force_checks: Optional[List[str]] = None
+    # directory of the per-check/preproc cache (see idtamper.cache.StageCache);
+    # a rerun only recomputes the checks whose parameters or code changed
+    stage_cache: Optional[str] = None
+
+
+def _run_check(fn, name, inp, params, sessions, pcfg: ParallelConfig | None = None, wrap=None):
     p = dict(params.get(name, {})) if params else {}
     if sessions and name in sessions and sessions[name] is not None:
         p.setdefault("session", sessions[name])
+    elif p.get("model_path") and not p.get("mock") and "session" not in p:
+        # reuse the process-wide warmed session instead of loading per call
+        try:
+            p["session"] = ort_sessions.get_session(p["model_path"], pcfg)
+        except Exception:
+            pass  # the check reports its own load error
+    if wrap is not None and p.get("session") is not None:
+        p["session"] = wrap(p["session"])
     try:
         res = fn(inp, params=p)
         score = res.get("score", None)
@@ -58,7 +100,7 @@ def _run_check(fn, name, inp, params, sessions):
 def _resolve_model_paths(cfg: AnalyzerConfig) -> Dict[str, str]:
     res = {}
     p = cfg.check_params or {}
-    for k in ("mantranet", "noiseprintpp"):
+    for k in (spec.name for spec in registered_checks() if spec.needs_session):
         mp = p.get(k, {}).get("model_path") if isinstance(p.get(k), dict) else None
         if mp:
             res[k] = mp
@@ -66,117 +108,356 @@ def _resolve_model_paths(cfg: AnalyzerConfig) -> Dict[str, str]:
 
 
 def _worker_init(cfg: ParallelConfig, model_paths: Dict[str, str]):
+    set_process_share(cfg.max_parallel_images, cfg.cpu_budget)
     with apply_thread_env(cfg):
+        _process_budget(cfg)
+        ort_sessions.preload(model_paths, cfg)
+
+
+_CV2_CAPPED = False
+
+
+def _process_budget(pcfg: ParallelConfig) -> CpuBudget:
+    """CPU budget of this process; OpenCV's own pool is disabled so checks
+    only use the threads the budget hands out."""
+
+    global _CV2_CAPPED
+    if not _CV2_CAPPED:
         try:
             cv2.setNumThreads(1)
         except Exception:
             pass
-        so = init_onnx_session_opts(cfg)
-        for name, pth in model_paths.items():
-            try:
-                sess = ort.InferenceSession(pth, sess_options=so, providers=["CPUExecutionProvider"])
-                # warm-up with dummy input
-                inp = sess.get_inputs()[0]
-                shape = [d if isinstance(d, int) else 1 for d in inp.shape]
-                dummy = np.zeros(shape, dtype=np.float32)
-                sess.run(None, {inp.name: dummy})
-                _ORT_SESS[name] = sess
+        _CV2_CAPPED = True
+    return process_cpu_budget(pcfg)
+
+
+def _stage_cache(cfg: AnalyzerConfig, source: SourceImage) -> StageCache | None:
+    """Stage cache for ``source``, if enabled and the encoded bytes are known."""
+
+    if not cfg.stage_cache or source.digest is None:
+        return None
+    return stage_cache(cfg.stage_cache)
+
+
+def _cached_check(stage: StageCache | None, cfg: AnalyzerConfig, spec: CheckSpec, source: SourceImage, sessions):
+    """Stored result of ``spec`` on ``source`` (``None`` on a miss), read once per image.
+
+    Returns ``(key, result)``; ``key`` is ``None`` when the check cannot be
+    cached (no stage cache, or a session object passed in by the caller).
+    """
+
+    if stage is None:
+        return None, None
+    params = (cfg.check_params or {}).get(spec.name, {})
+    if (sessions or {}).get(spec.name) is not None or (isinstance(params, dict) and "session" in params):
+        return None, None
+    key = stage_key(source.digest, "check:" + spec.name, params, code_digest(spec.run))
+    return key, source.memo("stage:" + key, lambda: stage.get_result(key))
+
+
+def _preproc_input(source: SourceImage, stage: StageCache | None) -> PreprocCache:
+    """Preproc cache of ``source``; with a stage cache the resized image is
+    read back from disk instead of decoded, the full-resolution view is
+    still decoded on demand."""
+
+    opts = PreprocOptions()
+    if stage is None:
+        return build_preproc_cache(source, opts)
+    key = stage_key(source.digest, "preproc", asdict(opts), code_digest())
+
+    def build():
+        entry = stage.load(key)
+        if entry is not None:
+            img = entry[1]["img"]
+            img.setflags(write=False)
+            return PreprocCache(img=img, native=lambda: source.full, quantization=source.quantization)
+        cache = build_preproc_cache(source, opts)
+        stage.store(key, {"shape": list(cache.img.shape)}, {"img": cache.img})
+        return cache
+
+    return source.memo("stage:" + key, build)
+
+
+def _decode_stage(
+    image_path: str,
+    out_dir: str | None,
+    cfg: AnalyzerConfig,
+    pcfg: ParallelConfig,
+    preproc: bool = True,
+):
+    """Decode stage: source image, copy of the original next to the artifacts
+    and, with ``preproc``, the inputs the planned checks consume (preproc
+    cache from a reduced decode, native-resolution RGB image).
+
+    Returns ``(source, outp, ready)``; ``ready`` holds the prebuilt input
+    nodes for :func:`_check_graph`. Without ``preproc`` nothing is decoded
+    yet beyond the header.
+    """
+
+    source = SourceImage(image_path)
+    outp = None
+    if cfg.artifacts == ARTIFACTS_FULL and out_dir is not None:
+        outp = Path(out_dir)
+        outp.mkdir(parents=True, exist_ok=True)
+        dst = outp / Path(image_path).name
+        if not (dst.exists() and dst.samefile(image_path)):
+            try:  # save copy of original
+                import shutil
+
+                shutil.copy2(image_path, str(dst))
             except Exception:
-                _ORT_SESS[name] = None
+                pass
+    ready: Dict[str, Any] = {"input:source": source}
+    planned, _ = _plan_checks(registered_checks(), cfg)
+    stage = _stage_cache(cfg, source)
+    # checks found in the stage cache need no input at all
+    inputs = {spec.input for spec in planned if _cached_check(stage, cfg, spec, source, _ORT_SESS)[1] is None}
+    if preproc and "preproc" in inputs:
+        with _process_budget(pcfg).hold():
+            ready["input:preproc"] = _preproc_input(source, stage)
+    if preproc and "pil" in inputs:
+        with _process_budget(pcfg).hold():
+            ready["input:pil"] = source.full
+    return source, outp, ready
 
 
 def _analyze_single(image_path: str, out_dir: str, cfg: AnalyzerConfig, pcfg: ParallelConfig, sessions: Dict[str, Any] | None = None):
+    # decoding is left to the check graph, where it overlaps with the ONNX checks
+    source, outp, ready = _decode_stage(image_path, out_dir, cfg, pcfg, preproc=False)
+    return _analyze_pil(source, os.path.basename(image_path), outp, cfg, pcfg, sessions, ready)
+
+
+def _check_graph(
+    specs: List[CheckSpec],
+    source: SourceImage,
+    cfg: AnalyzerConfig,
+    pcfg: ParallelConfig,
+    sessions,
+    ready: Dict[str, Any] | None = None,
+    budget: CpuBudget | None = None,
+):
+    """Dependency graph for :func:`run_dag` and its submission priority.
+
+    Input nodes (native-resolution image, preproc cache) are decoded only if
+    a check consumes them, unless already in ``ready``; check nodes are ordered by
+    cost class so ONNX checks start first and overlap with the signal checks.
+    With ``cfg.stage_cache`` a check whose result is stored becomes a node
+    without dependencies returning it, fresh results are stored as they
+    complete.
+    ``after`` constraints on checks outside ``specs`` are ignored. With a
+    ``budget`` every node holds CPU tokens while it runs (ONNX checks one
+    per intra-op thread). Batchable checks join a cross-image micro-batch
+    when ``onnx_batch`` allows it: they wait on the batching pool returned
+    by the placement function and only the batch leader holds tokens.
+
+    Returns ``(nodes, priority, placement)`` for :func:`run_dag`.
+    """
+
+    params = cfg.check_params or {}
+    stage = _stage_cache(cfg, source)
+
+    def _hold(n=1):
+        return budget.hold(n) if budget is not None else contextlib.nullcontext()
+
+    def _preproc(_deps):
+        with _hold():
+            return _preproc_input(source, stage)
+
+    def _full(_deps):
+        with _hold():
+            return source.full
+
+    inputs = {"pil": _full, "preproc": _preproc, "source": lambda _deps: source}
+    nodes: Dict[str, Any] = {}
+    rank: Dict[str, int] = {}
+    names = {spec.name for spec in specs}
+    max_batch = onnx_batch_size(pcfg)
+    waiting = set()
+
+    def _batched(sess):
+        return batched_session(sess, max_batch, pcfg.onnx_batch_wait_ms, lambda: _hold(onnx_threads(pcfg)))
+
+    def _stored(out, skey):
+        if skey is not None:
+            stage.put_result(skey, out[0])
+        return out
+
+    for spec in specs:
+        skey, hit = _cached_check(stage, cfg, spec, source, sessions)
+        if hit is not None:
+            nodes[spec.name] = (lambda _deps, r=hit, name=spec.name: (r, CheckMetrics(name, 0.0, 0.0, 0)), ())
+            rank[spec.name] = -1
+            continue
+        key = f"input:{spec.input}"
+        if key not in nodes:
+            if ready and key in ready:
+                nodes[key] = (lambda _deps, v=ready[key]: v, ())
+            else:
+                nodes[key] = (inputs[spec.input], ())
+            rank[key] = -1
+
+        def _node(deps, spec=spec, key=key, skey=skey):
+            with _hold(onnx_threads(pcfg) if spec.needs_session else 1):
+                out = measure(lambda: _run_check(spec.run, spec.name, deps[key], params, sessions, pcfg), spec.name)
+            return _stored(out, skey)
+
+        def _batched_node(deps, spec=spec, key=key, skey=skey):
+            out = measure(lambda: _run_check(spec.run, spec.name, deps[key], params, sessions, pcfg, _batched), spec.name)
+            return _stored(out, skey)
+
+        after = tuple(a for a in spec.after if a in names)
+        if spec.batchable and max_batch > 1:
+            nodes[spec.name] = (_batched_node, (key,) + after)
+            waiting.add(spec.name)
+        else:
+            nodes[spec.name] = (_node, (key,) + after)
+        rank[spec.name] = COST_CLASSES.index(spec.cost)
+    return nodes, rank.__getitem__, (lambda n: wait_executor() if n in waiting else None)
+
+
+def _per_check_entry(res: Dict[str, Any], thr: Dict[str, float]) -> Dict[str, Any]:
+    nm = res["name"]
+    return {
+        "score": res["score"],
+        "threshold": float(thr.get(nm, 0.5)),
+        "flag": (res["score"] is not None and float(res["score"]) >= float(thr.get(nm, 0.5))),
+        "details": res.get("meta", {}),
+    }
+
+
+def _plan_checks(specs: List[CheckSpec], cfg: AnalyzerConfig):
+    """Split ``specs`` into the checks to run and ``{name: reason}`` for the skipped ones."""
+
+    if not cfg.skip_ignored:
+        return list(specs), {}
+    weights = cfg.weights or DEFAULT_WEIGHTS
+    disabled = set(cfg.disabled_checks or ())
+    forced = set(cfg.force_checks or ())
+    run, skipped = [], {}
+    for spec in specs:
+        if spec.name in forced:
+            run.append(spec)
+        elif spec.name in disabled:
+            skipped[spec.name] = "disabled in profile"
+        elif float(weights.get(spec.name, 0.0)) <= 0.0:
+            skipped[spec.name] = "zero weight"
+        else:
+            run.append(spec)
+    return run, skipped
+
+
+def _run_cascade(
+    specs: List[CheckSpec],
+    source: SourceImage,
+    cfg: AnalyzerConfig,
+    pcfg: ParallelConfig,
+    sessions,
+    ready: Dict[str, Any] | None = None,
+):
+    """Run the checks one cost class at a time, cheapest first.
+
+    After each stage the interval ``tamper_score`` can still reach is
+    computed with :func:`score_bounds`; once it lies entirely on one side of
+    ``cfg.threshold`` the remaining stages are skipped.
+    """
+
+    weights = cfg.weights or DEFAULT_WEIGHTS
+    thr = cfg.check_thresholds or {}
+    stages = [[s for s in specs if s.cost == c] for c in reversed(COST_CLASSES)]
+    stages = [st for st in stages if st]
+    ready = dict(ready or {})
+    done: Dict[str, Any] = {}
+    per_check: Dict[str, Any] = {}
+    info: Dict[str, Any] = {"stages": [[s.name for s in st] for st in stages], "skipped": {}}
+    budget = _process_budget(pcfg)
+    for i, stage in enumerate(stages):
+        nodes, priority, placement = _check_graph(stage, source, cfg, pcfg, sessions, ready, budget)
+        out = run_dag(
+            nodes, parallel=pcfg.parallel_signal_checks, priority=priority, executor=budget.executor, placement=placement
+        )
+        ready.update({k: v for k, v in out.items() if k.startswith("input:")})
+        for spec in stage:
+            done[spec.name] = out[spec.name]
+            per_check[spec.name] = _per_check_entry(out[spec.name][0], thr)
+        pending = [s.name for st in stages[i + 1:] for s in st]
+        lo, hi = score_bounds(per_check, weights, pending)
+        info["bounds"] = [lo, hi]
+        if pending and (lo >= cfg.threshold or hi < cfg.threshold):
+            verdict = "tampered" if lo >= cfg.threshold else "genuine"
+            reason = (
+                f"verdict fixed ({verdict}) after stage {i + 1}: "
+                f"reachable score [{lo:.4f}, {hi:.4f}] vs threshold {cfg.threshold}"
+            )
+            info["skipped"] = {name: reason for name in pending}
+            break
+    return done, info
+
+
+def _score_pil(
+    image: Image.Image | SourceImage,
+    image_name: str,
+    cfg: AnalyzerConfig,
+    pcfg: ParallelConfig,
+    sessions: Dict[str, Any] | None = None,
+    ready: Dict[str, Any] | None = None,
+):
+    """Compute stage: run the checks on an RGB image (decoded, or a source
+    decoded on demand) and score them.
+
+    Returns ``(report, maps, fused)``; the report has no artifacts yet, see
+    :func:`_write_artifacts`. ``ready`` holds input nodes already built by
+    :func:`_decode_stage`.
+    """
+
+    if cfg.artifacts not in ARTIFACT_POLICIES:
+        raise ValueError(f"unknown artifacts policy: {cfg.artifacts!r}")
+    if cfg.heatmap_format not in (HEATMAPS_PNG, HEATMAPS_NPZ):
+        raise ValueError(f"unknown heatmap format: {cfg.heatmap_format!r}")
     sessions = sessions or _ORT_SESS
-    outp = Path(out_dir)
-    outp.mkdir(parents=True, exist_ok=True)
-    pil_img = Image.open(image_path).convert("RGB")
-
-    try:  # save copy of original
-        import shutil
-
-        shutil.copy2(image_path, str(outp / Path(image_path).name))
-    except Exception:
-        pass
-
-    cache = build_preproc_cache(np.asarray(pil_img), PreprocOptions())
-
-    results: List[Dict[str, Any]] = []
-    metrics = []
-
-    deep_checks = [
-        ("mantranet", mantranet.run, pil_img),
-        ("noiseprintpp", noiseprintpp.run, pil_img),
-    ]
-    signal_checks = [
-        ("ela95", ela.run, cache),
-        ("jpeg_ghosts", jpegghost.run, cache),
-        ("noise_inconsistency", noise.run, cache),
-        ("splicing", splicing.run, cache),
-        ("copy_move", copymove.run, cache),
-        ("jpeg_blockiness", blockiness.run, cache),
-        ("exif", exifcheck.run, pil_img),
-    ]
-
-    # Deep checks sequential
-    for name, fn, inp in deep_checks:
-        res, metr = measure(lambda fn=fn, name=name, inp=inp: _run_check(fn, name, inp, cfg.check_params or {}, sessions), name)
-        results.append(res)
-        metrics.append(metr)
-
-    def _do(item):
-        name, fn, inp = item
-        return measure(lambda fn=fn, name=name, inp=inp: _run_check(fn, name, inp, cfg.check_params or {}, sessions), name)
-
-    if pcfg.parallel_signal_checks and len(signal_checks) > 1:
-        with cf.ThreadPoolExecutor() as tp:
-            for res, metr in tp.map(_do, signal_checks):
-                results.append(res)
-                metrics.append(metr)
+    source = as_source(image)
+
+    specs = registered_checks()
+    planned, skipped = _plan_checks(specs, cfg)
+    cascade = None
+    if cfg.cascade:
+        done, cascade = _run_cascade(planned, source, cfg, pcfg, sessions, ready)
+        skipped.update(cascade["skipped"])
     else:
-        for item in signal_checks:
-            res, metr = _do(item)
-            results.append(res)
-            metrics.append(metr)
-
-    # per_check dict with thresholds
+        budget = _process_budget(pcfg)
+        nodes, priority, placement = _check_graph(planned, source, cfg, pcfg, sessions, ready, budget)
+        done = run_dag(
+            nodes, parallel=pcfg.parallel_signal_checks, priority=priority, executor=budget.executor, placement=placement
+        )
+    results: List[Dict[str, Any]] = [done[s.name][0] for s in specs if s.name in done]
+    metrics = [done[s.name][1] for s in specs if s.name in done]
+
+    # per_check dict with thresholds; skipped checks (plan or cascade) have no score
     per_check = {}
     thr = cfg.check_thresholds or {}
-    for r in results:
-        nm = r["name"]
-        per_check[nm] = {
-            "score": r["score"],
-            "threshold": float(thr.get(nm, 0.5)),
-            "flag": (r["score"] is not None and float(r["score"]) >= float(thr.get(nm, 0.5))),
-            "details": r.get("meta", {}),
-        }
+    for spec in specs:
+        if spec.name in done:
+            res = done[spec.name][0]
+            per_check[res["name"]] = _per_check_entry(res, thr)
+        else:
+            per_check[spec.name] = {
+                "score": None,
+                "threshold": float(thr.get(spec.name, 0.5)),
+                "flag": False,
+                "details": {"skipped": skipped[spec.name]},
+            }
 
     weights = cfg.weights or DEFAULT_WEIGHTS
     tamper_score = fuse_scores(per_check, weights)
     is_tampered = bool(tamper_score >= cfg.threshold)
 
-    # Save heatmaps per-check
-    artifacts: Dict[str, str] = {}
-    hm_maps = {}
-    for r in results:
-        if r.get("map") is not None:
-            hm_name = f"heatmap_{r['name']}.png"
-            save_heatmap_gray(r["map"], str(outp / hm_name))
-            artifacts[hm_name[:-4]] = hm_name
-            hm_maps[r["name"]] = r["map"]
-
-    # fused + overlay
-    fused = fuse_heatmaps(hm_maps, weights=weights)
-    if fused is not None:
-        save_heatmap_gray(fused, str(outp / "fused_heatmap.png"))
-        ov = overlay_on_image(pil_img, fused, alpha=0.45)
-        ov.save(str(outp / "overlay.png"))
-        artifacts["fused_heatmap"] = "fused_heatmap.png"
-        artifacts["overlay"] = "overlay.png"
+    hm_maps = {r["name"]: r["map"] for r in results if r.get("map") is not None}
+    fused = fuse_heatmaps(hm_maps, weights=weights) if cfg.artifacts != ARTIFACTS_NONE else None
 
     # --- Confidence computation (margin + overlap + agreement) ---
     import numpy as _np, math as _math
 
-    strong_checks = ['noiseprintpp', 'copy_move', 'splicing', 'noise_inconsistency']
+    # only strong checks that actually ran (not skipped by the plan/cascade) count
+    strong_checks = [nm for nm in CONFIDENCE_CHECKS if nm in per_check and nm not in skipped]
     mask_thr = float((cfg.check_params or {}).get('confidence_mask_thr', 0.6))
     tau = float((cfg.check_params or {}).get('confidence_tau', 0.10))
     alpha = float((cfg.check_params or {}).get('confidence_alpha', 0.30))
@@ -184,7 +465,7 @@ def _analyze_single(image_path: str, out_dir: str, cfg: AnalyzerConfig, pcfg: Pa
 
     # Select flagged strong checks with a heatmap (resize to common size)
     sel_maps = []
-    Ht, Wt = pil_img.size[1], pil_img.size[0]
+    Ht, Wt = source.size[1], source.size[0]
     from PIL import Image as _Image
 
     for nm in strong_checks:
@@ -220,7 +501,7 @@ def _analyze_single(image_path: str, out_dir: str, cfg: AnalyzerConfig, pcfg: Pa
     confidence = float(max(0.0, min(1.0, confidence)))
 
     report = {
-        "image": os.path.basename(image_path),
+        "image": image_name,
         "tamper_score": tamper_score,
         "threshold": cfg.threshold,
         "is_tampered": is_tampered,
@@ -230,43 +511,469 @@ def _analyze_single(image_path: str, out_dir: str, cfg: AnalyzerConfig, pcfg: Pa
             "overlap_ratio": overlap_ratio,
             "checks_forti_flag": checks_forti_flag,
             "nstrong": nstrong,
+            "strong_checks_run": strong_checks,
             "tau": tau,
             "alpha": alpha,
             "beta": beta,
             "mask_thr": mask_thr,
         },
         "per_check": per_check,
-        "artifacts": artifacts,
+        "artifacts": {},
     }
+    if cascade is not None:
+        report["cascade"] = cascade
 
     total_ms = sum(m.ms for m in metrics)
     report = embed_report_metrics(report, total_ms, metrics, describe_runtime(pcfg))
-
-    (outp / "report.json").write_text(json.dumps(report, ensure_ascii=False, indent=2))
+    report["metrics"]["image"] = {"width": Wt, "height": Ht, "megapixels": Wt * Ht / 1e6}
+    stage = _stage_cache(cfg, source)
+    if stage is not None:
+        ran = [s for s in specs if s.name in done]
+        hits = [s.name for s in ran if _cached_check(stage, cfg, s, source, sessions)[1] is not None]
+        report["metrics"]["stage_cache"] = {"hits": hits, "computed": [s.name for s in ran if s.name not in hits]}
+    return report, hm_maps, fused
+
+
+def _write_artifacts(
+    report: Dict[str, Any],
+    image: Image.Image | SourceImage,
+    maps: Dict[str, Any],
+    fused,
+    outp: Path | None,
+    cfg: AnalyzerConfig,
+) -> Dict[str, Any]:
+    """Writer stage: heatmaps, overlay and ``report.json`` for a scored image.
+
+    Files are only written with the ``full`` artifact policy and an output
+    directory; otherwise ``artifacts`` stays empty.
+    """
+
+    if cfg.artifacts != ARTIFACTS_FULL:
+        outp = None
+    art_sw = Stopwatch()
+    artifacts: Dict[str, str] = {}
+    lazy = outp is not None and cfg.heatmap_format == HEATMAPS_NPZ
+    if outp is not None and not lazy:
+        for name, hm in maps.items():
+            hm_name = f"heatmap_{name}.png"
+            save_heatmap_gray(hm, str(outp / hm_name))
+            artifacts[hm_name[:-4]] = hm_name
+    if lazy:
+        image_name = report["image"]
+        original = image_name if (outp / image_name).is_file() else None
+        artifacts.update(save_maps_npz(maps, fused, str(outp / MAPS_FILE), image_file=original))
+    elif fused is not None and outp is not None:
+        save_heatmap_gray(fused, str(outp / "fused_heatmap.png"))
+        # drawn on the reduced decode: a large JPEG is not decoded in full for it
+        base = as_source(image).reduced(PreprocOptions().max_side)
+        ov = overlay_on_image(base, fused, alpha=0.45)
+        ov.save(str(outp / "overlay.png"))
+        artifacts["fused_heatmap"] = "fused_heatmap.png"
+        artifacts["overlay"] = "overlay.png"
+    report["artifacts"] = artifacts
+    report["metrics"]["artifacts_ms"] = art_sw.stop().ms
+
+    if outp is not None:
+        (outp / "report.json").write_text(json.dumps(report, ensure_ascii=False, indent=2))
+    if cfg.artifacts == ARTIFACTS_MAPS:
+        # numpy arrays: not JSON serialisable, for in-process consumers only
+        report["maps"] = {"per_check": maps, "fused": fused}
     return report
 
 
-def analyze_images(image_paths: List[str], out_dir: str, cfg: AnalyzerConfig, parallel: ParallelConfig = ParallelConfig()) -> List[Dict[str, Any]]:
+def _analyze_pil(
+    image: Image.Image | SourceImage,
+    image_name: str,
+    outp: Path | None,
+    cfg: AnalyzerConfig,
+    pcfg: ParallelConfig,
+    sessions: Dict[str, Any] | None = None,
+    ready: Dict[str, Any] | None = None,
+):
+    """Run every check on an RGB image (or source) and write its artifacts."""
+
+    source = as_source(image)
+    report, maps, fused = _score_pil(source, image_name, cfg, pcfg, sessions, ready)
+    return _write_artifacts(report, source, maps, fused, outp, cfg)
+
+
+def analyze_image_bytes(
+    data: bytes,
+    cfg: AnalyzerConfig,
+    parallel: ParallelConfig = ParallelConfig(),
+    *,
+    image_name: str = "image",
+    out_dir: str | None = None,
+):
+    """Analyze an encoded image held in memory.
+
+    The image is decoded straight from ``data``, at the resolutions the
+    planned checks need (see :class:`~idtamper.preproc.SourceImage`). The
+    filesystem is only touched when ``out_dir`` is given and
+    ``cfg.artifacts`` is ``full``; the original bytes are then written there
+    as ``image_name`` next to the artifacts.
+    """
+
+    source = SourceImage(data)
+    outp = None
+    if out_dir is not None and cfg.artifacts == ARTIFACTS_FULL:
+        outp = Path(out_dir)
+        outp.mkdir(parents=True, exist_ok=True)
+        (outp / image_name).write_bytes(data)
+    return _analyze_pil(source, image_name, outp, cfg, parallel, _ORT_SESS)
+
+
+def create_image_pool(parallel: ParallelConfig, model_paths: Dict[str, str] | None = None) -> cf.ProcessPoolExecutor:
+    """Create a long-lived process pool for :func:`analyze_images`.
+
+    Each worker loads and warms ``model_paths`` once at start-up, so the pool
+    can be reused across batches without paying the session cost again.
+    """
+
+    return cf.ProcessPoolExecutor(
+        max_workers=max(1, parallel.max_parallel_images),
+        initializer=_worker_init,
+        initargs=(parallel, dict(model_paths or {})),
+    )
+
+
+# result of one image in a batch: its report, or the exception that stopped it
+Outcome = Any  # Dict[str, Any] | Exception
+Lookup = Optional[Callable[[str], Optional[Outcome]]]
+
+
+def _outcome(fn, *args) -> Outcome:
+    try:
+        return fn(*args)
+    except Exception as e:
+        return e
+
+
+def _default_run_dir(out_root: Path) -> Callable[[str], str]:
+    return lambda path: str(out_root / Path(path).stem)
+
+
+def _cache_hooks(cfg: AnalyzerConfig, cache: ResultCache, run_dir: Callable[[str], str]):
+    """``(lookup, store)`` serving images from ``cache`` and storing fresh reports."""
+
+    cfg_dg = config_digest(cfg)
+    full = cfg.artifacts == ARTIFACTS_FULL
+    keys: Dict[str, str] = {}
+
+    def lookup(path: str):
+        key = cache_key(image_digest(Path(path).read_bytes()), cfg_dg)
+        rep = cache.get(key, with_artifacts=full)
+        if rep is None:
+            keys[path] = key
+            return None
+        rep["image"] = os.path.basename(path)
+        return rep
+
+    def store(path: str, rep: Outcome) -> None:
+        key = keys.pop(path, None)
+        if key is not None and not isinstance(rep, Exception):
+            cache.put(key, rep, artifact_dir=run_dir(path) if full else None)
+
+    return lookup, store
+
+
+def _score_stage(decoding: cf.Future, image_name: str, cfg: AnalyzerConfig, pcfg: ParallelConfig, sessions):
+    source, outp, ready = decoding.result()
+    report, maps, fused = _score_pil(source, image_name, cfg, pcfg, sessions, ready)
+    return report, source, maps, fused, outp
+
+
+def _write_stage(scoring: cf.Future, cfg: AnalyzerConfig):
+    report, source, maps, fused, outp = scoring.result()
+    return _write_artifacts(report, source, maps, fused, outp, cfg)
+
+
+def _iter_staged(
+    image_paths: Iterable[str],
+    run_dir: Callable[[str], str],
+    cfg: AnalyzerConfig,
+    parallel: ParallelConfig,
+    sessions,
+    lookup: Lookup = None,
+) -> Iterator[Tuple[str, Outcome]]:
+    """Analyze ``image_paths`` in this process as three overlapped stages.
+
+    A decode thread prefetches images (decode, copy of the original, preproc
+    cache), compute threads run the checks and ``parallel.io_workers`` writer
+    threads encode heatmaps, overlay and ``report.json`` while the next image
+    is scored. Each image is chained through the stages as futures and at
+    most ``prefetch`` + compute + ``2 * io_workers`` images are in flight.
+    Images are scored one at a time unless ``onnx_batch`` lets concurrent
+    images share ONNX micro-batches; then that many are scored together.
+    Analyzed images are yielded in input order; ``lookup`` hits and failures
+    as soon as they are known.
+    """
+
+    prefetch = max(1, int(parallel.prefetch))
+    width = onnx_batch_size(parallel)
+    io_workers = max(0, int(parallel.io_workers))
+    window = prefetch + width + 2 * io_workers
+    decoder = cf.ThreadPoolExecutor(max_workers=1, thread_name_prefix="idtamper-decode")
+    scorer = cf.ThreadPoolExecutor(max_workers=width, thread_name_prefix="idtamper-score")
+    writer = cf.ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix="idtamper-write") if io_workers else None
+    inflight: collections.deque = collections.deque()
+    try:
+        for path in image_paths:
+            early = _outcome(lookup, path) if lookup is not None else None
+            if early is not None:
+                yield path, early
+                continue
+            decoding = decoder.submit(_decode_stage, path, run_dir(path), cfg, parallel)
+            scoring = scorer.submit(_score_stage, decoding, os.path.basename(path), cfg, parallel, sessions)
+            if writer is None:
+                scoring = scorer.submit(_write_stage, scoring, cfg)
+            inflight.append((path, writer.submit(_write_stage, scoring, cfg) if writer is not None else scoring))
+            while inflight and (inflight[0][1].done() or len(inflight) >= window):
+                path, fut = inflight.popleft()
+                yield path, _outcome(fut.result)
+        while inflight:
+            path, fut = inflight.popleft()
+            yield path, _outcome(fut.result)
+    finally:
+        for _path, fut in inflight:
+            fut.cancel()
+        for ex in (decoder, scorer, writer):
+            if ex is not None:
+                ex.shutdown(wait=True, cancel_futures=True)
+
+
+def _iter_pool(
+    image_paths: Iterable[str],
+    run_dir: Callable[[str], str],
+    cfg: AnalyzerConfig,
+    parallel: ParallelConfig,
+    executor: cf.Executor,
+    window: int,
+    lookup: Lookup = None,
+) -> Iterator[Tuple[str, Outcome]]:
+    """Run :func:`_analyze_single` on ``executor`` with at most ``window``
+    images in flight, yielding in completion order."""
+
+    running: Dict[cf.Future, str] = {}
+    todo = iter(image_paths)
+    try:
+        while True:
+            for path in todo:
+                early = _outcome(lookup, path) if lookup is not None else None
+                if early is not None:
+                    yield path, early
+                    continue
+                running[executor.submit(_analyze_single, path, run_dir(path), cfg, parallel, None)] = path
+                if len(running) >= window:
+                    break
+            if not running:
+                break
+            finished, _ = cf.wait(running, return_when=cf.FIRST_COMPLETED)
+            for fut in finished:
+                path = running.pop(fut)
+                yield path, _outcome(fut.result)
+    finally:
+        # the caller stopped early: do not leave queued work on a shared pool
+        for fut in running:
+            fut.cancel()
+
+
+def iter_analyze_images(
+    image_paths: Iterable[str],
+    out_dir: str,
+    cfg: AnalyzerConfig,
+    parallel: ParallelConfig = ParallelConfig(),
+    executor: cf.Executor | None = None,
+    cache: ResultCache | None = None,
+    *,
+    window: int = 0,
+    run_dir: Callable[[str], str] | None = None,
+) -> Iterator[Tuple[str, Outcome]]:
+    """Analyze ``image_paths`` and yield ``(path, report)`` as images complete.
+
+    ``image_paths`` is consumed lazily and at most ``window`` images
+    (default: twice the workers) are in flight, so memory does not grow with
+    the number of images. An image that fails yields ``(path, exception)``
+    and the batch goes on. Artifacts of each image go to ``run_dir(path)``,
+    by default ``out_dir/<stem>``.
+    """
+
     out_root = Path(out_dir)
     out_root.mkdir(parents=True, exist_ok=True)
-
-    if parallel.max_parallel_images <= 1:
-        return [
-            _analyze_single(path, str(out_root / Path(path).stem), cfg, parallel, _ORT_SESS)
-            for path in image_paths
-        ]
-
-    model_paths = _resolve_model_paths(cfg)
-    with cf.ProcessPoolExecutor(
-        max_workers=parallel.max_parallel_images,
-        initializer=_worker_init,
-        initargs=(parallel, model_paths),
-    ) as ex:
-        futures = [
-            ex.submit(_analyze_single, path, str(out_root / Path(path).stem), cfg, parallel, None)
-            for path in image_paths
-        ]
-        return [f.result() for f in futures]
+    run_dir = run_dir or _default_run_dir(out_root)
+
+    if executor is None and parallel.max_parallel_images > 1:
+        with create_image_pool(parallel, _resolve_model_paths(cfg)) as ex:
+            yield from iter_analyze_images(
+                image_paths, out_dir, cfg, parallel, ex, cache, window=window, run_dir=run_dir
+            )
+        return
+
+    lookup = store = None
+    if cache is not None and cfg.artifacts != ARTIFACTS_MAPS:
+        lookup, store = _cache_hooks(cfg, cache, run_dir)
+    if executor is None:
+        results = _iter_staged(image_paths, run_dir, cfg, parallel, _ORT_SESS, lookup)
+    else:
+        window = window or 2 * max(1, int(parallel.max_parallel_images))
+        results = _iter_pool(image_paths, run_dir, cfg, parallel, executor, window, lookup)
+    for path, rep in results:
+        if store is not None:
+            store(path, rep)
+        yield path, rep
+
+
+def _score_shared(image: shm.SharedBlock, image_name: str, cfg: AnalyzerConfig, pcfg: ParallelConfig):
+    """Worker side of :func:`iter_analyze_arrays`.
+
+    Reads the RGB array from shared memory and scores it. Returns the report
+    and, unless no artifacts are wanted, a block with the heatmaps
+    (``map:<check>`` and ``fused``) for the parent to write.
+    """
+
+    with shm.open_arrays(image) as arrays:
+        pil_img = Image.fromarray(arrays["rgb"])  # PIL copies into its own RGB layout
+    report, maps, fused = _score_pil(pil_img, image_name, cfg, pcfg, None)
+    if cfg.artifacts == ARTIFACTS_NONE:
+        return report, None
+    out = {f"map:{k}": np.asarray(v, dtype=np.float32) for k, v in maps.items()}
+    if fused is not None:
+        out["fused"] = np.asarray(fused, dtype=np.float32)
+    return report, shm.share(out)
+
+
+def _write_shared(report, rgb: np.ndarray, block, outp: Path | None, cfg: AnalyzerConfig):
+    """Parent side of :func:`iter_analyze_arrays`: artifacts straight from the shared maps."""
+
+    opened = shm.open_arrays(block, unlink=True) if block is not None else contextlib.nullcontext({})
+    with opened as arrays:
+        pil_img = Image.fromarray(rgb)
+        if outp is not None:
+            outp.mkdir(parents=True, exist_ok=True)
+            pil_img.save(str(outp / report["image"]))
+        if cfg.artifacts == ARTIFACTS_MAPS:  # handed to the caller: must outlive the segment
+            arrays = {k: v.copy() for k, v in arrays.items()}
+        maps = {k[4:]: v for k, v in arrays.items() if k.startswith("map:")}
+        rep = _write_artifacts(report, pil_img, maps, arrays.get("fused"), outp, cfg)
+        del maps, arrays
+    return rep
+
+
+def _analyze_array(name: str, rgb: np.ndarray, outp: Path | None, cfg: AnalyzerConfig, pcfg: ParallelConfig):
+    pil_img = Image.fromarray(np.asarray(rgb, dtype=np.uint8))
+    if outp is not None:
+        outp.mkdir(parents=True, exist_ok=True)
+        pil_img.save(str(outp / name))
+    return _analyze_pil(pil_img, name, outp, cfg, pcfg, _ORT_SESS)
+
+
+def iter_analyze_arrays(
+    images: Iterable[Tuple[str, np.ndarray]],
+    out_dir: str | None,
+    cfg: AnalyzerConfig,
+    parallel: ParallelConfig = ParallelConfig(),
+    executor: cf.Executor | None = None,
+    *,
+    window: int = 0,
+    run_dir: Callable[[str], str] | None = None,
+) -> Iterator[Tuple[str, Outcome]]:
+    """Analyze decoded ``(image_name, rgb_uint8_array)`` pairs held in memory.
+
+    On a process pool (``executor`` or ``max_parallel_images > 1``) each
+    array reaches its worker through shared memory rather than a temporary
+    file or a pickle. The worker sends back only the report plus a
+    shared-memory block with the heatmaps, and the artifacts are written
+    here. Otherwise the images are analyzed in this process. Yields
+    ``(image_name, report | exception)`` in completion order, with at most
+    ``window`` images in flight (default: twice the workers). Files are
+    written only with the ``full`` policy and an ``out_dir``; each image goes
+    to ``run_dir(image_name)``, by default ``out_dir/<stem>``.
+    """
+
+    full = cfg.artifacts == ARTIFACTS_FULL and out_dir is not None
+    if full:
+        run_dir = run_dir or _default_run_dir(Path(out_dir))
+
+    def _outp(name: str) -> Path | None:
+        return Path(run_dir(name)) if full else None
+
+    if executor is None and parallel.max_parallel_images <= 1:
+        for name, rgb in images:
+            yield name, _outcome(_analyze_array, name, rgb, _outp(name), cfg, parallel)
+        return
+    if executor is None:
+        with create_image_pool(parallel, _resolve_model_paths(cfg)) as ex:
+            yield from iter_analyze_arrays(images, out_dir, cfg, parallel, ex, window=window, run_dir=run_dir)
+        return
+
+    window = window or 2 * max(1, int(parallel.max_parallel_images))
+    running: Dict[cf.Future, Tuple[str, np.ndarray, Any]] = {}
+
+    def _release(seg) -> None:
+        seg.close()
+        seg.unlink()
+
+    todo = iter(images)
+    try:
+        while True:
+            for name, rgb in todo:
+                rgb = np.ascontiguousarray(rgb, dtype=np.uint8)
+                seg, block = shm.put_arrays({"rgb": rgb})
+                try:
+                    fut = executor.submit(_score_shared, block, name, cfg, parallel)
+                except BaseException:
+                    _release(seg)
+                    raise
+                running[fut] = (name, rgb, seg)
+                if len(running) >= window:
+                    break
+            if not running:
+                break
+            finished, _ = cf.wait(running, return_when=cf.FIRST_COMPLETED)
+            for fut in finished:
+                name, rgb, seg = running.pop(fut)
+                _release(seg)
+                scored = _outcome(fut.result)
+                if isinstance(scored, Exception):
+                    yield name, scored
+                    continue
+                report, maps = scored
+                yield name, _outcome(_write_shared, report, rgb, maps, _outp(name), cfg)
+    finally:
+        # stopped early: nothing may stay in /dev/shm
+        for fut in running:
+            fut.cancel()
+        cf.wait(running)
+        for fut, (_name, _rgb, seg) in running.items():
+            _release(seg)
+            if not fut.cancelled() and fut.exception() is None and fut.result()[1] is not None:
+                shm.discard(fut.result()[1])
+
+
+def analyze_images(
+    image_paths: List[str],
+    out_dir: str,
+    cfg: AnalyzerConfig,
+    parallel: ParallelConfig = ParallelConfig(),
+    executor: cf.Executor | None = None,
+    cache: ResultCache | None = None,
+) -> List[Dict[str, Any]]:
+    """Reports of ``image_paths`` in input order.
+
+    Every image is processed (and cached) before the first failure, if any,
+    is raised; use :func:`iter_analyze_images` to handle failures per image.
+    """
+
+    slots: Dict[str, collections.deque] = collections.defaultdict(collections.deque)
+    for i, path in enumerate(image_paths):
+        slots[path].append(i)
+    reports: List[Outcome] = [None] * len(image_paths)
+    for path, rep in iter_analyze_images(image_paths, out_dir, cfg, parallel, executor, cache):
+        reports[slots[path].popleft()] = rep
+    for rep in reports:
+        if isinstance(rep, Exception):
+            raise rep
+    return reports
 
 
 def analyze_image(image_path: str, out_dir: str, cfg: AnalyzerConfig, parallel: ParallelConfig = ParallelConfig()):
@@ -3,35 +3,298 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import List
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Tuple
+import hashlib
 import io
+import math
+import threading
 
 import numpy as np
 from PIL import Image
 
+from . import jpegdct
+
 
 @dataclass
 class PreprocOptions:
     max_side: int = 1600
     keep_exif: bool = False
     colorspace: str = "RGB"
+    # decode oversized JPEGs at a reduced DCT scale (see SourceImage.reduced)
+    draft: bool = True
 
 
-@dataclass
-class PreprocCache:
+class _Memo:
+    """Thread-safe, per-key memoization of lazily built values."""
+
+    def __init__(self) -> None:
+        self._values: Dict[str, Any] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def memo(self, key: str, build: Callable[[], Any]) -> Any:
+        """Value stored under ``key``, computed with ``build()`` on first use."""
+
+        try:
+            return self._values[key]
+        except KeyError:
+            pass
+        with self._lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            if key not in self._values:
+                self._values[key] = build()
+        return self._values[key]
+
+    def computed(self) -> List[str]:
+        """Names of the values built so far."""
+
+        return sorted(self._values)
+
+
+class SourceImage(_Memo):
+    """An encoded image, decoded on demand at the resolution a check needs.
+
+    Opening only reads the header (size, format, EXIF).  :attr:`full` decodes
+    the native-resolution RGB image; :meth:`reduced` decodes a JPEG larger
+    than ``max_side`` directly at a reduced DCT scale (libjpeg's 1/2, 1/4 or
+    1/8 scaling through ``Image.draft``), the smallest one still at least
+    ``max_side`` wide, which skips most of the IDCT work and never
+    allocates the full-size image.  Other formats fall back to :attr:`full`.
+    """
+
+    def __init__(self, src: str | Path | bytes) -> None:
+        super().__init__()
+        self._src = src
+        with self._open() as im:
+            self.size: Tuple[int, int] = im.size
+            self.format: str | None = im.format
+            self.quantization = getattr(im, "quantization", None)
+            self._exif = im.getexif()
+
+    @classmethod
+    def from_pil(cls, pil: Image.Image) -> "SourceImage":
+        """Source over an image already decoded in memory."""
+
+        self = cls.__new__(cls)
+        _Memo.__init__(self)
+        self._src = None
+        self.size, self.format = pil.size, pil.format
+        self.quantization = getattr(pil, "quantization", None)
+        self._exif = pil.getexif()
+        self._values["full"] = pil if pil.mode == "RGB" else pil.convert("RGB")
+        return self
+
+    def _open(self) -> Image.Image:
+        return Image.open(io.BytesIO(self._src) if isinstance(self._src, bytes) else self._src)
+
+    def getexif(self) -> Image.Exif:
+        return self._exif
+
+    @property
+    def digest(self) -> str | None:
+        """SHA-256 of the encoded bytes (``None`` for an in-memory image)."""
+
+        def build():
+            if self._src is None:
+                return None
+            h = hashlib.sha256()
+            if isinstance(self._src, bytes):
+                h.update(self._src)
+            else:
+                with open(self._src, "rb") as f:
+                    for chunk in iter(lambda: f.read(1 << 20), b""):
+                        h.update(chunk)
+            return h.hexdigest()
+
+        return self.memo("digest", build)
+
+    @property
+    def full(self) -> Image.Image:
+        """Native-resolution RGB image."""
+
+        def build():
+            with self._open() as im:
+                return im.convert("RGB")
+
+        return self.memo("full", build)
+
+    def reduced(self, max_side: int) -> Image.Image:
+        """RGB image at least ``max_side`` on its long side, or :attr:`full`."""
+
+        W, H = self.size
+        if self.format != "JPEG" or self._src is None or max(W, H) <= max_side:
+            return self.full
+
+        def build():
+            scale = max_side / float(max(W, H))
+            with self._open() as im:
+                im.draft("RGB", (math.ceil(W * scale), math.ceil(H * scale)))
+                return im.convert("RGB")
+
+        return self.memo(f"reduced:{int(max_side)}", build)
+
+
+def as_source(image: Image.Image | SourceImage) -> SourceImage:
+    """``image`` itself, or a :class:`SourceImage` over a decoded PIL image."""
+
+    return image if isinstance(image, SourceImage) else SourceImage.from_pil(image)
+
+
+class Recompressed(NamedTuple):
+    """JPEG round trip of :attr:`PreprocCache.img` at one quality."""
+
+    quality: int
+    img: np.ndarray  # decoded RGB, int16
+    diff: np.ndarray  # |source - decoded| averaged over channels, float32 HxW
+
+
+class PreprocCache(_Memo):
     """Container for preprocessed representations of an image.
 
     The naming of the attributes is intentionally kept short and
     consistent so that checks can rely on a stable API.  For backward
     compatibility ``img_orig``/``img_gray``/``img_ycbcr`` are provided as
     properties mapping to the new names.
+
+    Only ``img`` (the resized RGB array) is built up front.  Every other
+    representation is computed on first access and memoized, so a plane
+    that no planned check reads is never built.  Checks running in
+    parallel threads may share one cache: each plane is computed once,
+    concurrent readers of the same plane wait for it.
+
+    ``native`` returns the image at its original resolution for checks that
+    must not see the resized one (e.g. the 8x8 JPEG grid); ``quantization``
+    holds the tables of a JPEG source, for the compressed-domain views.
     """
 
-    img: np.ndarray
-    gray: np.ndarray
-    ycbcr: np.ndarray
-    pyramid: List[np.ndarray]
-    jpeg_q90_bytes: bytes | None = None
+    def __init__(
+        self,
+        img: np.ndarray,
+        gray: np.ndarray | None = None,
+        ycbcr: np.ndarray | None = None,
+        pyramid: List[np.ndarray] | None = None,
+        jpeg_q90_bytes: bytes | None = None,
+        native: Callable[[], Image.Image] | None = None,
+        quantization: Dict[int, Any] | None = None,
+    ) -> None:
+        super().__init__()
+        self.img = img
+        self._native = native
+        self.quantization = quantization
+        for key, value in (("gray", gray), ("ycbcr", ycbcr), ("pyramid", pyramid), ("jpeg_q90_bytes", jpeg_q90_bytes)):
+            if value is not None:
+                self._values[key] = value
+
+    # --- Representations ---
+    @property
+    def pil(self) -> Image.Image:
+        """``img`` as a PIL image."""
+
+        return self.memo("pil", lambda: Image.fromarray(self.img))
+
+    @property
+    def native(self) -> Image.Image:
+        """The RGB image at its original resolution (decoded on first use)."""
+
+        return self.memo("native", self._native or (lambda: self.pil))
+
+    @property
+    def gray(self) -> np.ndarray:
+        return self.memo("gray", lambda: np.asarray(self.pil.convert("L"), dtype=np.uint8))
+
+    @property
+    def gray01(self) -> np.ndarray:
+        """``gray`` as float32 in ``[0, 1]`` (treat as read-only)."""
+
+        return self.memo("gray01", lambda: self.gray.astype(np.float32) / 255.0)
+
+    @property
+    def ycbcr(self) -> np.ndarray:
+        return self.memo("ycbcr", lambda: np.asarray(self.pil.convert("YCbCr"), dtype=np.uint8))
+
+    @property
+    def pyramid(self) -> List[np.ndarray]:
+        return self.memo("pyramid", self._build_pyramid)
+
+    @property
+    def jpeg_q90_bytes(self) -> bytes | None:
+        return self.memo("jpeg_q90_bytes", self._encode_q90)
+
+    @property
+    def jpeg_tables(self) -> Dict[int, np.ndarray]:
+        """Quantization tables of the source JPEG (8x8, natural order); empty otherwise."""
+
+        return self.memo("jpeg_tables", lambda: jpegdct.quant_tables(self.quantization))
+
+    @property
+    def native_luma(self) -> np.ndarray:
+        """float32 luminance of :attr:`native`, on the source JPEG grid."""
+
+        return self.memo("native_luma", lambda: jpegdct.luma(np.asarray(self.native)))
+
+    @property
+    def native_dct(self) -> np.ndarray:
+        """8x8 block DCT of :attr:`native_luma` (see :func:`jpegdct.block_dct`)."""
+
+        return self.memo("native_dct", lambda: jpegdct.block_dct(self.native_luma))
+
+    @property
+    def img16(self) -> np.ndarray:
+        """``img`` as int16, the dtype recompression differences are taken in."""
+
+        return self.memo("img16", lambda: _readonly(self.img.astype(np.int16)))
+
+    def recompressed(self, quality: int) -> Recompressed:
+        """JPEG encode/decode of ``img`` at ``quality``, once per quality.
+
+        The returned arrays are shared between checks and read-only.
+        """
+
+        q = int(quality)
+        return self.memo(f"jpeg:{q}", lambda: self._recompress(q))
+
+    def ghost_map(self, qualities: Iterable[int]) -> np.ndarray:
+        """Per-pixel maximum of :meth:`recompressed` ``diff`` over ``qualities``.
+
+        Reuses the round trips already made for other checks (e.g. ELA at
+        the same quality) and memoizes the result per quality list.
+        """
+
+        qs = tuple(int(q) for q in qualities)
+
+        def build():
+            acc = None
+            for q in qs:
+                diff = self.recompressed(q).diff
+                acc = diff if acc is None else np.maximum(acc, diff)
+            return _readonly(acc) if acc is not None else _readonly(np.zeros(self.img.shape[:2], np.float32))
+
+        return self.memo("ghost:" + ",".join(map(str, qs)), build)
+
+    def _recompress(self, quality: int) -> Recompressed:
+        buf = io.BytesIO()
+        self.pil.save(buf, "JPEG", quality=quality)
+        rec = np.asarray(Image.open(io.BytesIO(buf.getvalue())).convert("RGB"), dtype=np.int16)
+        diff = np.abs(self.img16 - rec).astype(np.float32).mean(axis=2)
+        return Recompressed(quality, _readonly(rec), _readonly(diff))
+
+    def _build_pyramid(self) -> List[np.ndarray]:
+        pyramid = [self.gray]
+        cur = Image.fromarray(self.gray)
+        while min(cur.size) > 32:
+            cur = cur.resize((max(1, cur.size[0] // 2), max(1, cur.size[1] // 2)), Image.BILINEAR)
+            pyramid.append(np.asarray(cur, dtype=np.uint8))
+        return pyramid
+
+    def _encode_q90(self) -> bytes | None:
+        try:
+            buf = io.BytesIO()
+            self.pil.save(buf, "JPEG", quality=90)
+            return buf.getvalue()
+        except Exception:
+            return None
 
     # --- Backward compatibility aliases ---
     @property
@@ -47,38 +310,51 @@ class PreprocCache:
         return self.ycbcr
 
 
-def build_preproc_cache(image: np.ndarray, opts: PreprocOptions) -> PreprocCache:
-    """Build a :class:`PreprocCache` from an RGB ``image`` array."""
+def _readonly(a: np.ndarray) -> np.ndarray:
+    a.setflags(write=False)
+    return a
 
-    pil = Image.fromarray(image)
-    W, H = pil.size
-    if max(W, H) > opts.max_side:
-        scale = opts.max_side / float(max(W, H))
-        pil = pil.resize((int(W * scale), int(H * scale)), Image.BILINEAR)
 
-    img_rgb = np.asarray(pil, dtype=np.uint8)
-    img_gray = np.asarray(pil.convert("L"), dtype=np.uint8)
-    img_ycbcr = np.asarray(pil.convert("YCbCr"), dtype=np.uint8)
+def as_preproc_cache(img_or_cache) -> PreprocCache:
+    """``img_or_cache`` itself, or a cache over a PIL image at its own size."""
 
-    pyramid = [img_gray]
-    cur = pil.convert("L")
-    while min(cur.size) > 32:
-        cur = cur.resize((max(1, cur.size[0] // 2), max(1, cur.size[1] // 2)), Image.BILINEAR)
-        pyramid.append(np.asarray(cur, dtype=np.uint8))
+    if isinstance(img_or_cache, PreprocCache):
+        return img_or_cache
+    pil = img_or_cache if img_or_cache.mode == "RGB" else img_or_cache.convert("RGB")
+    cache = PreprocCache(img=np.asarray(pil, dtype=np.uint8), quantization=getattr(img_or_cache, "quantization", None))
+    cache._values["pil"] = pil
+    return cache
 
-    jpeg90 = None
-    try:
-        buf = io.BytesIO()
-        pil.save(buf, "JPEG", quality=90)
-        jpeg90 = buf.getvalue()
-    except Exception:
-        jpeg90 = None
-
-    return PreprocCache(
-        img=img_rgb,
-        gray=img_gray,
-        ycbcr=img_ycbcr,
-        pyramid=pyramid,
-        jpeg_q90_bytes=jpeg90,
-    )
 
+def build_preproc_cache(image: np.ndarray | Image.Image | SourceImage, opts: PreprocOptions) -> PreprocCache:
+    """Build a :class:`PreprocCache` from an RGB ``image`` (array, PIL image or source).
+
+    Only the resize to ``opts.max_side`` happens here; the other
+    representations are built lazily by the checks that read them.  A
+    :class:`SourceImage` is decoded with :meth:`SourceImage.reduced` when
+    ``opts.draft`` is set, and at full resolution only if a check asks for
+    :attr:`PreprocCache.native`.
+    """
+
+    if isinstance(image, SourceImage):
+        source = image
+        pil = source.reduced(opts.max_side) if opts.draft else source.full
+        native = lambda: source.full  # noqa: E731
+        quantization = source.quantization
+    else:
+        pil = image if isinstance(image, Image.Image) else Image.fromarray(image)
+        if pil.mode != "RGB":
+            pil = pil.convert("RGB")
+        native = lambda orig=pil: orig  # noqa: E731
+        quantization = getattr(image, "quantization", None)
+    W, H = pil.size
+    resized = max(W, H) > opts.max_side
+    if resized:
+        scale = opts.max_side / float(max(W, H))
+        pil = pil.resize((int(W * scale), int(H * scale)), Image.BILINEAR)
+
+    cache = PreprocCache(img=np.asarray(pil, dtype=np.uint8), native=native, quantization=quantization)
+    if resized:
+        # the resized image is ours: reuse it instead of wrapping the array again
+        cache._values["pil"] = pil
+    return cache
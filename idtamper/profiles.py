@@ -1,7 +1,9 @@
 import os
 import json
+import threading
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional, Tuple
 
 # Directory dei profili configurabile (default: /app/profiles in container)
 PROFILES_DIR = Path(os.getenv("IDS_PROFILES_DIR", "/app/profiles"))
@@ -9,9 +11,9 @@ PROFILES_DIR = Path(os.getenv("IDS_PROFILES_DIR", "/app/profiles"))
 def _read_json(p: Path) -> Dict[str, Any]:
     return json.loads(p.read_text(encoding="utf-8"))
 
-def load_profile(name_or_path: str) -> Dict[str, Any]:
+def resolve_profile_path(name_or_path: str) -> Path:
     """
-    Loader robusto dei profili:
+    Risolve il file di un profilo:
       - Accetta path assoluto/relativo o solo nome (con/senza .json)
       - Supporta alias con suffisso '@N' → fallback al core (es. recapture-id@2 → recapture-id)
       - Directory configurabile via env IDS_PROFILES_DIR
@@ -20,24 +22,204 @@ def load_profile(name_or_path: str) -> Dict[str, Any]:
 
     # 1) Path esplicito
     if p.suffix == ".json" and p.exists():
-        return _read_json(p)
+        return p
     if p.is_absolute() and p.exists():
-        return _read_json(p)
+        return p
 
     # 2) Nome dentro la dir profili
     stem = p.name[:-5] if p.name.endswith(".json") else p.name
     cand = PROFILES_DIR / f"{stem}.json"
     if cand.exists():
-        return _read_json(cand)
+        return cand
 
     # 3) Fallback alias (recapture-id@2 → recapture-id)
     core = stem.split("@", 1)[0]
     core_cand = PROFILES_DIR / f"{core}.json"
     if core and core_cand.exists():
-        return _read_json(core_cand)
+        return core_cand
 
     # 4) Errore con elenco disponibili
     available = sorted(x.name for x in PROFILES_DIR.glob("*.json"))
     raise FileNotFoundError(
         f"Profile '{name_or_path}' not found. Looked in {PROFILES_DIR}. Available: {available}"
     )
+
+def load_profile(name_or_path: str) -> Dict[str, Any]:
+    """Loader robusto dei profili (vedi :func:`resolve_profile_path`)."""
+    return _read_json(resolve_profile_path(name_or_path))
+
+
+# ---------------------------------------------------------------------------
+# Profili compilati: risolti una volta, invalidati solo al cambio di mtime
+# ---------------------------------------------------------------------------
+
+class ModelNotFoundError(FileNotFoundError):
+    """Il modello ONNX di un check abilitato non esiste."""
+
+    def __init__(self, check: str, path: str):
+        super().__init__(
+            f"Model for '{check}' not found at {path}. "
+            f"Configure env IDS_MODELS_DIR or IDS_*_MODEL, or mount the file."
+        )
+        self.check = check
+        self.path = path
+
+# nomi brevi usati nei profili "checks" -> nomi dei check registrati in pipeline
+CHECK_ALIASES = {
+    "ela": "ela95",
+    "jpeg_ghost": "jpeg_ghosts",
+    "blockiness": "jpeg_blockiness",
+    "noise": "noise_inconsistency",
+    "copymove": "copy_move",
+}
+
+class UnknownCheckError(ValueError):
+    """Il profilo nomina un check che la pipeline non conosce."""
+
+def _canonical_checks(checks: Dict[str, Any], profile: str) -> Dict[str, Any]:
+    from .registry import registered_checks
+
+    known = {spec.name for spec in registered_checks()}
+    out: Dict[str, Any] = {}
+    for name, cfg in checks.items():
+        canon = CHECK_ALIASES.get(name, name)
+        if canon not in known:
+            raise UnknownCheckError(f"Profile '{profile}': unknown check '{name}'. Known: {sorted(known)}")
+        out[canon] = cfg
+    return out
+
+def _is_enabled(cfg: Any) -> bool:
+    # un check elencato in "checks" è abilitato salvo ``enabled: false``
+    return isinstance(cfg, dict) and cfg.get("enabled", True) is not False
+
+def resolve_model_path(model_path: Optional[str], models_dir: Optional[Path] = None) -> Optional[str]:
+    """Path relativi dei modelli sono risolti rispetto a ``models_dir``."""
+    if not model_path:
+        return None
+    p = Path(model_path)
+    if p.is_absolute() or models_dir is None:
+        return str(p)
+    return str(Path(models_dir) / p)
+
+@dataclass
+class CompiledProfile:
+    """Profilo già risolto: params con i path dei modelli, soglie e pesi."""
+
+    name: str
+    path: Path
+    mtime_ns: int
+    profile: Dict[str, Any]
+    params: Dict[str, Any]
+    thresholds: Dict[str, float]
+    weights: Dict[str, float]
+    threshold: float
+    model_paths: Dict[str, str] = field(default_factory=dict)
+    enabled_checks: List[str] = field(default_factory=list)
+    # check con ``enabled: false`` esplicito: la pipeline non li esegue
+    disabled_checks: List[str] = field(default_factory=list)
+
+    def merged_params(self, overrides: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Copia dei params con gli override per-check applicati (merge a un livello)."""
+        params = {k: (dict(v) if isinstance(v, dict) else v) for k, v in self.params.items()}
+        for k, v in (overrides or {}).items():
+            params[k] = {**params.get(k, {}), **v} if isinstance(v, dict) else v
+        return params
+
+    def merged_thresholds(self, overrides: Optional[Dict[str, float]] = None) -> Dict[str, float]:
+        thr = dict(self.thresholds)
+        thr.update(overrides or {})
+        return thr
+
+def compile_profile(
+    name_or_path: str,
+    model_registry: Optional[Dict[str, str]] = None,
+    models_dir: Optional[Path] = None,
+) -> CompiledProfile:
+    """Compila un profilo: inietta i path dei modelli dei check abilitati
+    (da ``model_registry`` se assenti), ne verifica l'esistenza e deriva
+    soglie/pesi dalla sezione ``checks``. I nomi dei check sono portati ai
+    nomi della pipeline (:data:`CHECK_ALIASES`); un nome sconosciuto è un
+    errore di compilazione.
+    """
+    path = resolve_profile_path(name_or_path)
+    mtime_ns = path.stat().st_mtime_ns
+    prof = _read_json(path)
+
+    params: Dict[str, Any] = {k: (dict(v) if isinstance(v, dict) else v) for k, v in prof.get("params", {}).items()}
+    checks = _canonical_checks(prof.get("checks", {}) or {}, name_or_path)
+
+    model_paths: Dict[str, str] = {}
+    for check_name, default_path in (model_registry or {}).items():
+        if not _is_enabled(checks.get(check_name)):
+            continue
+        params.setdefault(check_name, {})
+        params[check_name].setdefault("model_path", default_path)
+        mp = resolve_model_path(params[check_name]["model_path"], models_dir)
+        if not Path(mp).exists():
+            raise ModelNotFoundError(check_name, mp)
+        params[check_name]["model_path"] = mp
+        model_paths[check_name] = mp
+
+    # soglie: dal profilo se presenti, altrimenti derivate dai checks
+    if "thresholds" in prof and isinstance(prof["thresholds"], dict):
+        thresholds: Dict[str, float] = dict(prof["thresholds"])
+    else:
+        thresholds = {
+            name: (cfg.get("threshold", 0.5) if isinstance(cfg, dict) else 0.5)
+            for name, cfg in checks.items() if isinstance(cfg, dict)
+        }
+
+    # soglia globale: prof.decision.threshold o prof.threshold (legacy)
+    decision = prof.get("decision") or {}
+    threshold = decision.get("threshold", prof.get("threshold", 0.5))
+
+    weights = {
+        name: (cfg.get("weight", 0.0) if isinstance(cfg, dict) else 0.0)
+        for name, cfg in checks.items() if isinstance(cfg, dict)
+    }
+    enabled = [name for name, cfg in checks.items() if _is_enabled(cfg)]
+    disabled = [name for name, cfg in checks.items() if isinstance(cfg, dict) and not _is_enabled(cfg)]
+
+    return CompiledProfile(
+        name=name_or_path,
+        path=path,
+        mtime_ns=mtime_ns,
+        profile=prof,
+        params=params,
+        thresholds=thresholds,
+        weights=weights,
+        threshold=threshold,
+        model_paths=model_paths,
+        enabled_checks=enabled,
+        disabled_checks=disabled,
+    )
+
+_COMPILED: Dict[Tuple[str, Tuple[Tuple[str, str], ...], str], CompiledProfile] = {}
+_COMPILED_LOCK = threading.Lock()
+
+def get_compiled_profile(
+    name_or_path: str,
+    model_registry: Optional[Dict[str, str]] = None,
+    models_dir: Optional[Path] = None,
+) -> CompiledProfile:
+    """Versione cache-ata di :func:`compile_profile`.
+
+    Sul percorso caldo costa una sola ``stat`` del file già risolto: si
+    ricompila solo se l'mtime cambia o il file sparisce.
+    """
+    key = (name_or_path, tuple(sorted((model_registry or {}).items())), str(models_dir))
+    comp = _COMPILED.get(key)
+    if comp is not None:
+        try:
+            if comp.path.stat().st_mtime_ns == comp.mtime_ns:
+                return comp
+        except OSError:
+            pass
+    comp = compile_profile(name_or_path, model_registry, models_dir)
+    with _COMPILED_LOCK:
+        _COMPILED[key] = comp
+    return comp
+
+def clear_compiled_profiles() -> None:
+    with _COMPILED_LOCK:
+        _COMPILED.clear()
@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+"""Registry of the checks run by the pipeline.
+
+Each check declares what it consumes (``"pil"`` for the RGB image at native
+resolution, ``"preproc"`` for the shared :class:`~idtamper.preproc.PreprocCache`,
+``"source"`` for the undecoded :class:`~idtamper.preproc.SourceImage`), its
+cost class, whether it needs an ONNX session and which other checks it must
+run after. :func:`idtamper.pipeline._analyze_pil` turns the registered checks
+into a dependency graph executed by :func:`idtamper.execution.run_dag`, so a
+new check is added with :func:`register_check` instead of a pipeline edit.
+"""
+
+from dataclasses import dataclass
+import threading
+from typing import Callable, Dict, List, Tuple
+
+from .checks import (
+    blockiness,
+    copymove,
+    ela,
+    exif as exifcheck,
+    jpegghost,
+    mantranet,
+    noise,
+    noiseprintpp,
+    splicing,
+)
+
+# inputs a check can consume
+INPUT_PIL = "pil"
+INPUT_PREPROC = "preproc"
+INPUT_SOURCE = "source"  # header and EXIF only: no pixels are decoded
+INPUTS = (INPUT_PIL, INPUT_PREPROC, INPUT_SOURCE)
+
+# cost classes, most expensive first: the scheduler starts them in this order
+COST_ONNX = "onnx"
+COST_SIGNAL = "signal"
+COST_LIGHT = "light"
+COST_CLASSES = (COST_ONNX, COST_SIGNAL, COST_LIGHT)
+
+
+@dataclass(frozen=True)
+class CheckSpec:
+    """Declaration of a check.
+
+    Attributes
+    ----------
+    name:
+        Key used in ``per_check``, ``check_params`` and weights.
+    run:
+        ``run(inp, params=...) -> {"score", "map", "meta"}``.
+    input:
+        One of :data:`INPUTS`.
+    cost:
+        One of :data:`COST_CLASSES`; used to order submissions.
+    needs_session:
+        The check runs an ONNX model from ``params["model_path"]``.
+    outputs:
+        Keys of the result the check can fill (``"score"``, ``"map"``).
+    after:
+        Names of checks that must complete first.
+    batchable:
+        The model input has the same shape for every image, so calls from
+        concurrent images can share a micro-batch (see :mod:`idtamper.batching`).
+    """
+
+    name: str
+    run: Callable
+    input: str = INPUT_PREPROC
+    cost: str = COST_SIGNAL
+    needs_session: bool = False
+    outputs: Tuple[str, ...] = ("score", "map")
+    after: Tuple[str, ...] = ()
+    batchable: bool = False
+
+
+_CHECKS: Dict[str, CheckSpec] = {}
+_LOCK = threading.Lock()
+
+
+def register_check(spec: CheckSpec, *, replace: bool = False) -> CheckSpec:
+    if spec.input not in INPUTS:
+        raise ValueError(f"unknown input {spec.input!r} for check {spec.name!r}")
+    if spec.cost not in COST_CLASSES:
+        raise ValueError(f"unknown cost class {spec.cost!r} for check {spec.name!r}")
+    with _LOCK:
+        if spec.name in _CHECKS and not replace:
+            raise ValueError(f"check {spec.name!r} already registered")
+        _CHECKS[spec.name] = spec
+    return spec
+
+
+def unregister_check(name: str) -> None:
+    with _LOCK:
+        _CHECKS.pop(name, None)
+
+
+def registered_checks() -> List[CheckSpec]:
+    """Registered checks in registration order (the order used in reports)."""
+    with _LOCK:
+        return list(_CHECKS.values())
+
+
+def get_check(name: str) -> CheckSpec:
+    return _CHECKS[name]
+
+
+for _spec in (
+    CheckSpec("mantranet", mantranet.run, INPUT_PIL, COST_ONNX, needs_session=True, batchable=True),
+    CheckSpec("noiseprintpp", noiseprintpp.run, INPUT_PIL, COST_ONNX, needs_session=True),
+    CheckSpec("ela95", ela.run, cost=COST_LIGHT),
+    CheckSpec("jpeg_ghosts", jpegghost.run),
+    CheckSpec("noise_inconsistency", noise.run),
+    CheckSpec("splicing", splicing.run),
+    CheckSpec("copy_move", copymove.run),
+    CheckSpec("jpeg_blockiness", blockiness.run, cost=COST_LIGHT),
+    CheckSpec("exif", exifcheck.run, INPUT_SOURCE, COST_LIGHT, outputs=("score",)),
+):
+    register_check(_spec)
@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+"""Process-wide registry of loaded and warmed ONNX Runtime sessions."""
+
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+import onnxruntime as ort
+
+from .execution import ParallelConfig, init_onnx_session_opts, onnx_threads
+
+logger = logging.getLogger(__name__)
+
+SessionKey = Tuple[str, int, int]
+
+# sessions shared by every request/check of the current process
+_SESSIONS: Dict[SessionKey, Any] = {}
+_LOCK = threading.Lock()
+
+
+def session_key(model_path: str, config: Optional[ParallelConfig] = None) -> SessionKey:
+    """Return the registry key for ``model_path`` under ``config``.
+
+    Sessions are keyed by the resolved model path and by the session options
+    derived from :class:`ParallelConfig` (intra/inter-op thread counts).
+    """
+
+    cfg = config or ParallelConfig()
+    return (str(Path(model_path).resolve()), onnx_threads(cfg), int(cfg.onnx_inter_threads))
+
+
+def warm_up(sess) -> None:
+    """Run ``sess`` once on a zero tensor so that first real call is fast."""
+
+    inp = sess.get_inputs()[0]
+    shape = [d if isinstance(d, int) else 1 for d in inp.shape]
+    dummy = np.zeros(shape, dtype=np.float32)
+    sess.run(None, {inp.name: dummy})
+
+
+def get_session(model_path: str, config: Optional[ParallelConfig] = None, *, warm: bool = True):
+    """Return the shared session for ``model_path``, loading it on first use.
+
+    Raises the underlying ONNX Runtime error if the model cannot be loaded;
+    a failed warm-up is only logged.
+    """
+
+    cfg = config or ParallelConfig()
+    key = session_key(model_path, cfg)
+    sess = _SESSIONS.get(key)
+    if sess is not None:
+        return sess
+    with _LOCK:
+        sess = _SESSIONS.get(key)
+        if sess is None:
+            sess = ort.InferenceSession(
+                key[0], sess_options=init_onnx_session_opts(cfg), providers=["CPUExecutionProvider"]
+            )
+            if warm:
+                try:
+                    warm_up(sess)
+                except Exception as e:
+                    logger.warning("warm-up failed for %s: %s", key[0], e)
+            _SESSIONS[key] = sess
+            logger.info("ONNX session ready: %s (intra=%d inter=%d)", *key)
+    return sess
+
+
+def preload(model_paths: Dict[str, str], config: Optional[ParallelConfig] = None) -> Dict[str, Any]:
+    """Load and warm a session for each ``name -> model_path`` entry.
+
+    Returns a ``name -> session`` mapping; models that fail to load map to
+    ``None`` so callers can fall back to per-check loading.
+    """
+
+    out: Dict[str, Any] = {}
+    for name, pth in model_paths.items():
+        try:
+            out[name] = get_session(pth, config)
+        except Exception as e:
+            logger.error("failed to load ONNX model for %s from %s: %s", name, pth, e)
+            out[name] = None
+    return out
+
+
+def is_loaded(model_path: str, config: Optional[ParallelConfig] = None) -> bool:
+    return session_key(model_path, config) in _SESSIONS
+
+
+def clear() -> None:
+    """Drop every cached session (mainly for tests)."""
+
+    with _LOCK:
+        _SESSIONS.clear()
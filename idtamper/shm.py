@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+"""Hand-off of numpy arrays between processes through shared memory.
+
+Decoded images sent to pool workers, and the heatmaps they send back, can
+be several megabytes each. Pickling them through the pool's pipe costs a
+serialisation and a copy on each side. :func:`put_arrays` instead packs a
+dict of arrays into one ``multiprocessing.shared_memory`` segment and
+returns a small, picklable :class:`SharedBlock`. The receiver maps the same
+pages with :func:`open_arrays`. The receiver unlinks the segment once it is
+done with it.
+"""
+
+from contextlib import contextmanager
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from typing import Dict, Iterator, Tuple
+
+import numpy as np
+
+_ALIGN = 64
+
+
+@dataclass(frozen=True)
+class SharedBlock:
+    """Name of a segment plus ``(key, offset, shape, dtype)`` of each array."""
+
+    name: str
+    fields: Tuple[Tuple[str, int, Tuple[int, ...], str], ...]
+
+
+def put_arrays(arrays: Dict[str, np.ndarray]) -> Tuple[shared_memory.SharedMemory, SharedBlock]:
+    """Copy ``arrays`` into a new segment.
+
+    Returns the segment, which the caller closes once it is done writing,
+    and its descriptor. The receiver must unlink it (``open_arrays(...,
+    unlink=True)``).
+    """
+
+    fields = []
+    offset = 0
+    for key, arr in arrays.items():
+        arr = np.asarray(arr)
+        fields.append((key, offset, tuple(arr.shape), arr.dtype.str))
+        offset += -(-arr.nbytes // _ALIGN) * _ALIGN
+    shm = shared_memory.SharedMemory(create=True, size=max(1, offset))
+    try:
+        for (key, off, shape, dtype), arr in zip(fields, arrays.values()):
+            np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=off)[...] = arr
+    except BaseException:
+        shm.close()
+        shm.unlink()
+        raise
+    return shm, SharedBlock(shm.name, tuple(fields))
+
+
+def share(arrays: Dict[str, np.ndarray]) -> SharedBlock:
+    """:func:`put_arrays` for senders that do not keep the segment mapped."""
+
+    shm, block = put_arrays(arrays)
+    shm.close()
+    return block
+
+
+@contextmanager
+def open_arrays(block: SharedBlock, unlink: bool = False) -> Iterator[Dict[str, np.ndarray]]:
+    """Map ``block`` and yield its arrays as views on the shared pages.
+
+    The views are only valid inside the ``with`` block; copy what must
+    outlive it. With ``unlink`` the segment is removed on exit.
+    """
+
+    shm = shared_memory.SharedMemory(name=block.name)
+    views: Dict[str, np.ndarray] = {}
+    try:
+        for key, off, shape, dtype in block.fields:
+            views[key] = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=off)
+        yield views
+    finally:
+        views.clear()
+        try:
+            shm.close()
+        except BufferError:  # a view escaped: the mapping goes away with it
+            pass
+        if unlink:
+            shm.unlink()
+
+
+def discard(block: SharedBlock) -> None:
+    """Unlink a segment that will not be read (e.g. the task was cancelled)."""
+
+    try:
+        shm = shared_memory.SharedMemory(name=block.name)
+    except FileNotFoundError:
+        return
+    shm.close()
+    shm.unlink()
@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+"""Tiled, memory-bounded inference for the deep checks.
+
+Running a fully convolutional model on a whole high-resolution image
+allocates activations proportional to its area in one go. The helpers here
+cut the ``CHW`` input into fixed-size overlapping tiles, run them through the
+session a few at a time (one ``session.run`` per group of tiles) and stitch
+the per-tile outputs back with a linear blend across the overlap, so peak
+memory depends on the tile size and batch instead of the image size.
+"""
+
+from dataclasses import dataclass
+from typing import List, Tuple
+
+import numpy as np
+from PIL import Image
+
+
+@dataclass
+class TileOptions:
+    """Tiling parameters.
+
+    Attributes
+    ----------
+    tile:
+        Side of the square tiles fed to the model (input pixels).
+    overlap:
+        Pixels shared by neighbouring tiles; outputs are blended across it.
+    batch:
+        Tiles per ``session.run``.
+    max_mem_mb:
+        Cap on the activation memory of one ``session.run`` (``0`` = no
+        cap); the batch, then the tile, is reduced to fit.
+    bytes_per_px:
+        Estimated activation bytes per input pixel of the model, used with
+        ``max_mem_mb``.
+    """
+
+    tile: int = 512
+    overlap: int = 32
+    batch: int = 4
+    max_mem_mb: float = 1024.0
+    bytes_per_px: int = 1024
+
+    @classmethod
+    def from_params(cls, p: dict) -> "TileOptions":
+        d = cls()
+        return cls(
+            tile=int(p.get("tile", d.tile)),
+            overlap=int(p.get("tile_overlap", d.overlap)),
+            batch=int(p.get("tile_batch", d.batch)),
+            max_mem_mb=float(p.get("max_mem_mb", d.max_mem_mb)),
+            bytes_per_px=int(p.get("bytes_per_px", d.bytes_per_px)),
+        )
+
+
+MIN_TILE = 64
+
+
+def fit_to_memory(opts: TileOptions) -> Tuple[int, int]:
+    """``(tile, batch)`` whose estimated activations fit ``opts.max_mem_mb``."""
+
+    tile, batch = max(MIN_TILE, int(opts.tile)), max(1, int(opts.batch))
+    if opts.max_mem_mb <= 0:
+        return tile, batch
+    cap = opts.max_mem_mb * (1 << 20)
+    per_tile = lambda t: t * t * max(1, opts.bytes_per_px)  # noqa: E731
+    while tile > MIN_TILE and per_tile(tile) > cap:
+        tile //= 2
+    batch = int(max(1, min(batch, cap // per_tile(tile))))
+    return max(MIN_TILE, tile), batch
+
+
+def tile_origins(size: int, tile: int, overlap: int) -> List[int]:
+    """Start offsets covering ``[0, size)`` with ``tile``-long, overlapping windows."""
+
+    if size <= tile:
+        return [0]
+    stride = max(1, tile - max(0, overlap))
+    starts = list(range(0, size - tile, stride))
+    starts.append(size - tile)
+    return starts
+
+
+def blend_window(tile: int, overlap: int) -> np.ndarray:
+    """2D weights rising linearly over ``overlap`` pixels at each border."""
+
+    ramp = np.ones(tile, dtype=np.float32)
+    if overlap > 0:
+        edge = (np.arange(min(overlap, tile // 2), dtype=np.float32) + 1.0) / (overlap + 1.0)
+        ramp[: len(edge)] = edge
+        ramp[tile - len(edge):] = edge[::-1]
+    return np.outer(ramp, ramp)
+
+
+def _to_tile_map(y: np.ndarray, tile: int) -> np.ndarray:
+    """First output channel of one tile (CHW or HWC) as a ``tile x tile`` float32 map."""
+
+    y = np.asarray(y, dtype=np.float32)
+    while y.ndim > 2:
+        y = y[..., 0] if y.shape[-1] <= 3 < y.shape[0] else y[0]
+    if y.shape != (tile, tile):
+        y = np.asarray(Image.fromarray(y).resize((tile, tile), Image.BILINEAR), dtype=np.float32)
+    return y
+
+
+def run_tiled(
+    session,
+    x: np.ndarray,
+    opts: TileOptions,
+    fixed_tile: int | None = None,
+    max_batch: int | None = None,
+    channels_last: bool = False,
+) -> np.ndarray:
+    """Run ``session`` over ``x`` (``3 x H x W`` float32) tile by tile.
+
+    Returns the stitched ``H x W`` map of the first output channel.
+    ``fixed_tile`` forces the tile side (models with a static input size);
+    ``max_batch`` caps tiles per call (models with a static batch);
+    ``channels_last`` feeds NHWC tiles.
+    """
+
+    _, H, W = x.shape
+    tile, batch = fit_to_memory(opts)
+    if fixed_tile:
+        tile = int(fixed_tile)
+    if max_batch:
+        batch = min(batch, int(max_batch))
+    overlap = min(max(0, int(opts.overlap)), tile // 2)
+    # images smaller than a tile are padded up to it (reflect keeps the noise statistics)
+    ph, pw = max(0, tile - H), max(0, tile - W)
+    if ph or pw:
+        x = np.pad(x, ((0, 0), (0, ph), (0, pw)), mode="reflect" if min(H, W) > 1 else "edge")
+    Hp, Wp = x.shape[1:]
+
+    in_name = session.get_inputs()[0].name
+    win = blend_window(tile, overlap)
+    acc = np.zeros((Hp, Wp), dtype=np.float32)
+    wsum = np.zeros((Hp, Wp), dtype=np.float32)
+    boxes = [(y0, x0) for y0 in tile_origins(Hp, tile, overlap) for x0 in tile_origins(Wp, tile, overlap)]
+    for i in range(0, len(boxes), batch):
+        group = boxes[i:i + batch]
+        xb = np.stack([x[:, y0:y0 + tile, x0:x0 + tile] for y0, x0 in group]).astype(np.float32, copy=False)
+        if channels_last:
+            xb = np.ascontiguousarray(xb.transpose(0, 2, 3, 1))
+        y = np.asarray(session.run(None, {in_name: xb})[0])
+        for k, (y0, x0) in enumerate(group):
+            acc[y0:y0 + tile, x0:x0 + tile] += _to_tile_map(y[k], tile) * win
+            wsum[y0:y0 + tile, x0:x0 + tile] += win
+    out = acc / np.maximum(wsum, 1e-8)
+    return out[:H, :W]
+
+
+def static_dims(session) -> Tuple[int | None, int | None, int | None]:
+    """``(batch, height, width)`` of the first input when fixed, else ``None``."""
+
+    shape = list(session.get_inputs()[0].shape)
+    dims = [d if isinstance(d, int) and d > 0 else None for d in shape]
+    if len(dims) < 4:
+        return dims[0] if dims else None, None, None
+    if dims[1] == 3:  # NCHW
+        return dims[0], dims[2], dims[3]
+    return dims[0], dims[1], dims[2]
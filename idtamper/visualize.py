@@ -1,3 +1,6 @@
+import io
+from pathlib import Path
+
 from PIL import Image, ImageOps
 import numpy as np
 
@@ -30,4 +33,56 @@ def overlay_on_image(pil_img, hm01, alpha=0.5):
     hm_img = Image.fromarray(hm_rgb).resize(base.size, Image.BILINEAR).convert("L")
     heat = ImageOps.colorize(hm_img, black="#00000000", white="#FF0000").convert("RGBA")
     heat.putalpha(int(alpha*255))
-    return Image.alpha_composite(base, heat)
\ No newline at end of file
+    return Image.alpha_composite(base, heat)
+# --- lazy artifacts: maps stored once as uint8 in maps.npz, PNGs rendered on request ---
+MAPS_FILE = "maps.npz"
+_IMAGE_KEY = "_image"
+
+def _to_u8(hm01):
+    return np.clip(np.asarray(hm01, dtype=np.float32) * 255.0, 0, 255).astype('uint8')
+
+def save_maps_npz(maps, fused, out_path, image_file=None):
+    """Store per-check and fused maps as ``heatmap_<name>`` / ``fused_heatmap`` uint8 arrays.
+
+    Returns the artifact dict (same names as the eager PNG layout) so the
+    report does not depend on whether PNGs exist yet.
+    """
+    arrays = {f"heatmap_{k}": _to_u8(v) for k, v in maps.items()}
+    if fused is not None:
+        arrays["fused_heatmap"] = _to_u8(fused)
+    if image_file:
+        arrays[_IMAGE_KEY] = np.array(str(image_file))
+    np.savez_compressed(out_path, **arrays)
+    artifacts = {k: f"{k}.png" for k in arrays if k != _IMAGE_KEY}
+    if fused is not None and image_file:
+        artifacts["overlay"] = "overlay.png"
+    return artifacts
+
+def artifact_available(run_dir, filename):
+    """True if ``filename`` exists in ``run_dir`` or can be rendered from its maps."""
+    run_dir = Path(run_dir)
+    return (run_dir / filename).is_file() or (filename.endswith(".png") and (run_dir / MAPS_FILE).is_file())
+
+def render_artifact(run_dir, filename, alpha=0.45):
+    """PNG bytes for a heatmap/overlay of a lazily stored run, or None."""
+    run_dir = Path(run_dir)
+    npz = run_dir / MAPS_FILE
+    if not filename.endswith(".png") or not npz.is_file():
+        return None
+    stem = filename[:-4]
+    with np.load(npz) as z:
+        if stem == "overlay":
+            if "fused_heatmap" not in z.files or _IMAGE_KEY not in z.files:
+                return None
+            src = run_dir / str(z[_IMAGE_KEY])
+            if not src.is_file():
+                return None
+            with Image.open(src) as im:
+                img = overlay_on_image(im.convert("RGB"), z["fused_heatmap"].astype(np.float32) / 255.0, alpha=alpha)
+        elif stem in z.files and stem != _IMAGE_KEY:
+            img = Image.fromarray(z[stem])
+        else:
+            return None
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
@@ -13,6 +13,10 @@ def main():
     ap.add_argument("--threshold", type=float, default=None)
     ap.add_argument("--check-thresholds", default=None)
     ap.add_argument("--params", default=None)
+    ap.add_argument("--artifacts", choices=["none", "maps", "full"], default="full",
+                    help="none: scores only; maps: heatmaps in memory; full: PNG/overlay/report.json")
+    ap.add_argument("--cascade", action="store_true",
+                    help="cheap checks first, skip the rest once the verdict cannot change")
     args = ap.parse_args()
 
     prof = load_profile(args.profile)
@@ -26,8 +30,10 @@ def main():
     if args.check_thresholds: cthr = json.loads(Path(args.check_thresholds).read_text())
     if args.params: params = json.loads(Path(args.params).read_text())
 
-    cfg = AnalyzerConfig(weights=weights, threshold=thr, check_params=params, check_thresholds=cthr)
+    cfg = AnalyzerConfig(weights=weights, threshold=thr, check_params=params, check_thresholds=cthr,
+                         artifacts=args.artifacts, cascade=args.cascade)
     rep = analyze_image(args.image, args.out, cfg)
+    rep.pop("maps", None)
     print(json.dumps(rep, ensure_ascii=False, indent=2))
 
 if __name__ == "__main__":
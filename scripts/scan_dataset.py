@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
-import argparse, json, os, csv
+import argparse, json, os, csv, sys
 from pathlib import Path
-from idtamper.pipeline import analyze_image, AnalyzerConfig
+from idtamper.execution import ParallelConfig
+from idtamper.pipeline import iter_analyze_images, AnalyzerConfig
 from idtamper.profiles import load_profile
 
 IMG_EXTS = {'.jpg','.jpeg','.png','.bmp','.tif','.tiff','.webp'}
@@ -22,6 +23,9 @@ def main():
     ap.add_argument("--check-thresholds", default=None)
     ap.add_argument("--params", default=None)
     ap.add_argument("--save-artifacts", action="store_true")
+    ap.add_argument("--workers", type=int, default=1, help="images analyzed in parallel (worker processes)")
+    ap.add_argument("--stage-cache", default=None,
+                    help="directory caching preprocessing and per-check results: reruns only recompute checks whose params changed")
     args = ap.parse_args()
 
     prof = load_profile(args.profile)
@@ -35,17 +39,33 @@ def main():
     if args.check_thresholds: cthr = json.loads(Path(args.check_thresholds).read_text())
     if args.params: params = json.loads(Path(args.params).read_text())
 
-    cfg = AnalyzerConfig(weights=weights, threshold=thr, check_params=params, check_thresholds=cthr)
+    cfg = AnalyzerConfig(weights=weights, threshold=thr, check_params=params, check_thresholds=cthr,
+                         artifacts="full" if args.save_artifacts else "none", stage_cache=args.stage_cache)
     in_root = Path(args.input); out_root = Path(args.out); out_root.mkdir(parents=True, exist_ok=True)
 
-    rows = []
-    for p in in_root.rglob("*"):
-        if p.is_file() and p.suffix.lower() in IMG_EXTS:
-            rel = p.relative_to(in_root)
-            out_dir = out_root/"items"/rel.parent/p.stem if args.save_artifacts else out_root/"items"
-            out_dir.mkdir(parents=True, exist_ok=True)
-            rep = analyze_image(str(p), str(out_dir), cfg)
-            rows.append({
+    def images():
+        for p in in_root.rglob("*"):
+            if p.is_file() and p.suffix.lower() in IMG_EXTS:
+                yield str(p)
+
+    def run_dir(path):
+        rel = Path(path).relative_to(in_root)
+        return str(out_root/"items"/rel.parent/rel.stem if args.save_artifacts else out_root/"items")
+
+    # rows are streamed to the CSV as images complete: memory stays flat on large folders
+    tot = {"n":0,"tp":0,"tn":0,"fp":0,"fn":0}
+    count = 0; errors = []
+    staged = {"hits": 0, "computed": 0}
+    f = None; w = None
+    pcfg = ParallelConfig(max_parallel_images=max(1, args.workers))
+    try:
+        for path, rep in iter_analyze_images(images(), str(out_root/"items"), cfg, pcfg, run_dir=run_dir):
+            rel = Path(path).relative_to(in_root)
+            if isinstance(rep, Exception):
+                errors.append({"path": str(rel), "error": f"{type(rep).__name__}: {rep}"})
+                print(f"error: {rel}: {rep}", file=sys.stderr)
+                continue
+            r = {
                 "path": str(rel),
                 "label": infer_label(rel),
                 "pred": "tampered" if rep["is_tampered"] else "genuine",
@@ -53,31 +73,31 @@ def main():
                 **{f"{k}_score": v["score"] for k,v in rep["per_check"].items()},
                 **{f"{k}_thr": v["threshold"] for k,v in rep["per_check"].items()},
                 **{f"{k}_flag": v["flag"] for k,v in rep["per_check"].items()},
-            })
+            }
+            if w is None:
+                f = (out_root/"dataset_report.csv").open("w", newline="", encoding="utf-8")
+                w = csv.DictWriter(f, fieldnames=list(r.keys())); w.writeheader()
+            w.writerow(r)
+            count += 1
+            for k, names in (rep.get("metrics", {}).get("stage_cache") or {}).items():
+                staged[k] += len(names)
+            if r["label"]:
+                tot["n"] += 1
+                if r["label"]=="tampered" and r["pred"]=="tampered": tot["tp"] += 1
+                elif r["label"]=="genuine" and r["pred"]=="genuine": tot["tn"] += 1
+                elif r["label"]=="genuine" and r["pred"]=="tampered": tot["fp"] += 1
+                elif r["label"]=="tampered" and r["pred"]=="genuine": tot["fn"] += 1
+    finally:
+        if f is not None: f.close()
 
-    # CSV
-    if rows:
-        cols = list(rows[0].keys())
-        with (out_root/"dataset_report.csv").open("w", newline="", encoding="utf-8") as f:
-            w = csv.DictWriter(f, fieldnames=cols); w.writeheader()
-            for r in rows: w.writerow(r)
-
-    # Summary
-    tot = {"n":0,"tp":0,"tn":0,"fp":0,"fn":0}
-    for r in rows:
-        if r["label"]:
-            tot["n"] += 1
-            if r["label"]=="tampered" and r["pred"]=="tampered": tot["tp"] += 1
-            elif r["label"]=="genuine" and r["pred"]=="genuine": tot["tn"] += 1
-            elif r["label"]=="genuine" and r["pred"]=="tampered": tot["fp"] += 1
-            elif r["label"]=="tampered" and r["pred"]=="genuine": tot["fn"] += 1
     prec = tot["tp"]/max(1,(tot["tp"]+tot["fp"]))
     rec  = tot["tp"]/max(1,(tot["tp"]+tot["fn"]))
     acc  = (tot["tp"]+tot["tn"])/max(1, tot["n"])
     f1   = 2*prec*rec/max(1e-9,(prec+rec)) if (prec+rec)>0 else 0.0
 
-    summary = {"count": len(rows), "confusion": tot, "precision": prec, "recall": rec, "accuracy": acc, "f1": f1,
+    summary = {"count": count, "errors": errors, "confusion": tot, "precision": prec, "recall": rec, "accuracy": acc, "f1": f1,
                "threshold": thr, "weights": weights}
+    if args.stage_cache: summary["stage_cache"] = staged
     (out_root/"summary.json").write_text(json.dumps(summary, indent=2))
     print(json.dumps({"csv": str(out_root/'dataset_report.csv'), "summary": str(out_root/'summary.json')}, indent=2))
 
@@ -0,0 +1,38 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+from idtamper.execution import BoundedExecutor, ParallelConfig, PoolSaturated
+from app import main
+
+
+def test_bounded_executor_rejects_when_full():
+    ex = BoundedExecutor(ParallelConfig(max_parallel_images=1, max_queue=1))
+    gate = threading.Event()
+    f1 = ex.submit(gate.wait)
+    f2 = ex.submit(gate.wait)
+    assert ex.in_flight == 1 and ex.queue_depth == 1
+    with pytest.raises(PoolSaturated):
+        ex.submit(gate.wait)
+    assert ex.rejected == 1
+    gate.set()
+    f1.result(); f2.result()
+    ex.shutdown()
+    assert ex.pending == 0
+
+
+def test_run_in_pool_sheds_load_with_retry_after(monkeypatch):
+    pool = BoundedExecutor(ParallelConfig(max_parallel_images=1, max_queue=0))
+    monkeypatch.setattr(main, "ANALYZE_POOL", pool)
+    gate = threading.Event()
+    busy = pool.submit(gate.wait)
+    with pytest.raises(HTTPException) as ei:
+        asyncio.run(main._run_in_pool(lambda: None))
+    assert ei.value.status_code == 503
+    assert ei.value.headers["Retry-After"] == str(main.RETRY_AFTER_S)
+    gate.set()
+    busy.result()
+    assert asyncio.run(main._run_in_pool(lambda x: x + 1, 1)) == 2
+    pool.shutdown()
@@ -0,0 +1,81 @@
+import concurrent.futures as cf
+import io
+import zipfile
+
+from fastapi.testclient import TestClient
+
+from idtamper.pipeline import AnalyzerConfig
+from app import main
+
+
+def test_batch_files_and_zip(monkeypatch):
+    monkeypatch.setattr(main, "_build_config", lambda *a: ({"checks": {}}, AnalyzerConfig()))
+    pool = cf.ThreadPoolExecutor(2)
+    monkeypatch.setattr(main, "_batch_pool", lambda: pool)
+
+    png = open("samples/sample1.png", "rb").read()
+    zbuf = io.BytesIO()
+    with zipfile.ZipFile(zbuf, "w") as zf:
+        zf.writestr("set/front.png", png)
+        zf.writestr("set/readme.txt", b"ignored")
+    files = [
+        ("files", ("front.png", png, "image/png")),
+        ("files", ("set.zip", zbuf.getvalue(), "application/zip")),
+    ]
+    r = TestClient(main.app).post("/v1/analyze/batch", files=files)
+    pool.shutdown()
+    assert r.status_code == 200, r.text
+    js = r.json()
+    assert [x["filename"] for x in js["reports"]] == ["front.png", "set/front.png"]
+    assert js["timing"]["n_images"] == 2
+    # same original name, distinct output directories
+    arts = [x["artifacts"].get("fused_heatmap", "") for x in js["reports"]]
+    assert all(a.startswith(f"/runs/{js['batch_id']}/") for a in arts)
+    assert arts[0] != arts[1]
+
+
+def _batch_client(monkeypatch):
+    monkeypatch.setattr(main, "_build_config", lambda *a: ({"checks": {}}, AnalyzerConfig(artifacts="none")))
+    pool = cf.ThreadPoolExecutor(1)
+    monkeypatch.setattr(main, "_batch_pool", lambda: pool)
+    return TestClient(main.app), pool
+
+
+def test_batch_reports_failed_images_individually(monkeypatch):
+    client, pool = _batch_client(monkeypatch)
+    png = open("samples/sample1.png", "rb").read()
+    files = [
+        ("files", ("good.png", png, "image/png")),
+        ("files", ("broken.png", b"not an image", "image/png")),
+    ]
+    r = client.post("/v1/analyze/batch", files=files)
+    pool.shutdown()
+    assert r.status_code == 200, r.text
+    good, bad = r.json()["reports"]
+    assert good["filename"] == "good.png" and "tamper_score" in good
+    assert bad["filename"] == "broken.png" and "error" in bad
+    assert r.json()["timing"]["n_errors"] == 1
+
+
+def test_batch_zip_limits_and_saturation(monkeypatch):
+    client, pool = _batch_client(monkeypatch)
+    zbuf = io.BytesIO()
+    with zipfile.ZipFile(zbuf, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("a.png", b"\0" * 4096)
+        zf.writestr("b.png", b"\0" * 4096)
+    files = [("files", ("set.zip", zbuf.getvalue(), "application/zip"))]
+
+    monkeypatch.setattr(main, "BATCH_MAX_FILES", 1)
+    assert client.post("/v1/analyze/batch", files=files).status_code == 413
+    monkeypatch.setattr(main, "BATCH_MAX_FILES", 10)
+    monkeypatch.setattr(main, "BATCH_MAX_FILE_BYTES", 1024)
+    assert client.post("/v1/analyze/batch", files=files).status_code == 413
+    monkeypatch.setattr(main, "BATCH_MAX_FILE_BYTES", 1 << 20)
+    monkeypatch.setattr(main, "BATCH_MAX_BYTES", 6000)
+    assert client.post("/v1/analyze/batch", files=files).status_code == 413
+
+    monkeypatch.setattr(main, "BATCH_MAX_BYTES", 1 << 20)
+    monkeypatch.setattr(main, "_BATCH_PENDING", main.BATCH_WORKERS + main.BATCH_QUEUE)
+    r = client.post("/v1/analyze/batch", files=files)
+    pool.shutdown()
+    assert r.status_code == 503 and r.headers["Retry-After"] == str(main.RETRY_AFTER_S)
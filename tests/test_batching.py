@@ -0,0 +1,77 @@
+import threading
+
+import numpy as np
+
+from idtamper import batching
+from idtamper.execution import ParallelConfig
+from idtamper.pipeline import AnalyzerConfig, analyze_images
+
+
+class _Arg:
+    def __init__(self, name, shape):
+        self.name, self.shape = name, shape
+
+
+class FakeSession:
+    """Channels-first model: y = 2 * mean over channels; records batch sizes."""
+
+    def __init__(self, batch_dim="N"):
+        self.batch_dim = batch_dim
+        self.calls = []
+
+    def get_inputs(self):
+        return [_Arg("x", [self.batch_dim, 3, 16, 16])]
+
+    def get_outputs(self):
+        return [_Arg("y", [self.batch_dim, 1, 16, 16])]
+
+    def run(self, names, feeds, run_options=None):
+        x = feeds["x"]
+        self.calls.append(x.shape[0])
+        return [x.mean(axis=1, keepdims=True) * 2]
+
+
+def _call_concurrently(sess, n):
+    outs = [None] * n
+    xs = [np.full((1, 3, 16, 16), i, dtype=np.float32) for i in range(n)]
+
+    def call(i):
+        outs[i] = sess.run(None, {"x": xs[i]})[0]
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+    return outs
+
+
+def test_micro_batcher_gathers_concurrent_calls_and_splits_outputs():
+    batching.clear()
+    model = FakeSession()
+    sess = batching.batched_session(model, max_batch=4, max_wait_ms=5000)
+    outs = _call_concurrently(sess, 4)
+    assert model.calls == [4]
+    for i, y in enumerate(outs):
+        assert y.shape == (1, 1, 16, 16) and np.allclose(y, 2 * i)
+
+    static = FakeSession(batch_dim=1)
+    outs = _call_concurrently(batching.batched_session(static, max_batch=4, max_wait_ms=5000), 3)
+    assert static.calls == [1, 1, 1] and np.allclose(outs[2], 4)
+
+
+def test_pipeline_batches_mantranet_across_images(tmp_path):
+    batching.clear()
+    imgs = ["samples/sample1.png", "samples/sample2.png", "samples/sample3.png"]
+    weights = {"mantranet": 1.0, "exif": 0.5}
+
+    ref_model = FakeSession()
+    cfg = AnalyzerConfig(weights=weights, artifacts="none", check_params={"mantranet": {"session": ref_model}})
+    ref = analyze_images(imgs, str(tmp_path), cfg, ParallelConfig(onnx_batch=1))
+    assert ref_model.calls == [1, 1, 1]
+
+    model = FakeSession()
+    cfg = AnalyzerConfig(weights=weights, artifacts="none", check_params={"mantranet": {"session": model}})
+    reps = analyze_images(imgs, str(tmp_path), cfg, ParallelConfig(onnx_batch=3, onnx_batch_wait_ms=5000))
+    assert model.calls == [3]
+    assert [r["per_check"]["mantranet"]["score"] for r in reps] == [r["per_check"]["mantranet"]["score"] for r in ref]
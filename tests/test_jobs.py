@@ -0,0 +1,47 @@
+import time
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+
+from idtamper.pipeline import AnalyzerConfig
+from app import main
+from app.jobs import JobQueue
+
+
+def test_job_queue_survives_restart(tmp_path):
+    db = tmp_path / "jobs.sqlite3"
+    q = JobQueue(db, lease_s=0.2, owner="a")
+    jid = q.submit({"profile": "x"})
+    assert q.claim()["id"] == jid
+    assert q.claim() is None
+    # another live process opening the queue does not steal the running job
+    q2 = JobQueue(db, lease_s=0.2, owner="b")
+    assert q2.get(jid)["status"] == "running"
+    assert q2.claim() is None
+    # once the owner stops heartbeating the lease expires and the job is reclaimed
+    time.sleep(0.3)
+    assert q2.claim()["payload"] == {"profile": "x"}
+    assert q2.active_ids() == {jid}
+
+
+def test_submit_and_poll_job(monkeypatch, tmp_path):
+    monkeypatch.setattr(main, "JOBS", JobQueue(tmp_path / "jobs.sqlite3"))
+    monkeypatch.setattr(main, "_build_config", lambda *a: ({"checks": {}}, AnalyzerConfig()))
+
+    def fake_analyze(image_path, out_dir, cfg):
+        assert Path(image_path).exists()
+        return {"per_check": {}, "threshold": 0.5, "is_tampered": False, "artifacts": {}}
+
+    monkeypatch.setattr(main, "analyze_image", fake_analyze)
+    client = TestClient(main.app)
+    with open("samples/sample1.png", "rb") as f:
+        r = client.post("/v1/jobs", files={"file": ("s1.png", f, "image/png")})
+    assert r.status_code == 202
+    jid = r.json()["job_id"]
+    assert client.get(f"/v1/jobs/{jid}").json()["status"] == "queued"
+
+    main._process_job(main.JOBS.claim())
+    js = client.get(f"/v1/jobs/{jid}").json()
+    assert js["status"] == "done"
+    assert js["report"]["run_id"] == jid
+    assert client.get("/v1/jobs/unknown").status_code == 404
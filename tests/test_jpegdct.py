@@ -0,0 +1,82 @@
+import io
+
+import numpy as np
+from PIL import Image, ImageFilter
+
+from idtamper import jpegdct
+from idtamper.checks import blockiness, jpegghost
+from idtamper.preproc import PreprocOptions, SourceImage, build_preproc_cache
+
+
+def _base(h=512, w=640):
+    rng = np.random.RandomState(0)
+    im = Image.fromarray((rng.rand(h // 8, w // 8, 3) * 255).astype(np.uint8))
+    im = im.resize((w, h), Image.BICUBIC).filter(ImageFilter.GaussianBlur(1))
+    return np.clip(np.asarray(im) + rng.randn(h, w, 3) * 6, 0, 255).astype(np.uint8)
+
+
+def _jpeg(rgb, q):
+    buf = io.BytesIO()
+    Image.fromarray(rgb).save(buf, "JPEG", quality=q)
+    return buf.getvalue()
+
+
+def _decode(data):
+    return np.asarray(Image.open(io.BytesIO(data)).convert("RGB"))
+
+
+def _cache(data):
+    return build_preproc_cache(SourceImage(data), PreprocOptions())
+
+
+def test_quality_from_header_tables():
+    for q in (50, 83, 97):
+        assert jpegdct.estimate_quality(jpegdct.ijg_table(q)) == (q, True)
+    tables = jpegdct.quant_tables(Image.open(io.BytesIO(_jpeg(_base(64, 64), 71))).quantization)
+    assert jpegdct.estimate_quality(tables[0]) == (71, True)
+    assert jpegdct.quant_tables(None) == {}
+
+
+def test_double_quantization_is_detected_and_localized():
+    base = _base()
+    table = jpegdct.ijg_table(90)
+
+    def dq(data):
+        return jpegdct.dq_analysis(jpegdct.block_dct(jpegdct.luma(_decode(data))), table)
+
+    single = dq(_jpeg(base, 90))
+    double = dq(_jpeg(_decode(_jpeg(base, 60)), 90))
+    assert single.strength < 0.3
+    assert double.strength > 0.8 and double.primary_quality == 60
+
+    pasted = _decode(_jpeg(base, 60)).copy()
+    pasted[128:384, 192:448] = base[:256, :256]
+    res = dq(_jpeg(pasted, 90))
+    assert res.map[16:48, 24:56].mean() > 3 * res.map[:12].mean()
+
+
+def test_shifted_grid_is_mapped():
+    base = _base()
+    img = _decode(_jpeg(base, 50)).copy()
+    other = _decode(_jpeg(np.ascontiguousarray(base[:, ::-1]), 50))
+    img[131:387, 197:453] = other[:256, :256]  # pasted off the 8x8 grid
+    res = jpegdct.grid_alignment(jpegdct.luma(_decode(_jpeg(img, 90))))
+    assert res.offset == (0, 0)
+    assert res.map[2:6, 3:7].mean() > 0.3 and res.map[:2].max() == 0.0 and res.map[7:].max() == 0.0
+    clean = jpegdct.grid_alignment(jpegdct.luma(_decode(_jpeg(base, 90))))
+    assert clean.map.mean() < 0.05
+
+
+def test_checks_dct_mode_skips_recompression_and_falls_back():
+    base = _base()
+    cache = _cache(_jpeg(_decode(_jpeg(base, 60)), 90))
+    res = jpegghost.run(cache, {"mode": "dct"})
+    assert res["meta"]["primary_quality"] == 60 and res["meta"]["quality"] == 90
+    assert not any(k.startswith("jpeg:") for k in cache.computed())
+    assert blockiness.run(cache, {"mode": "dct"})["meta"]["grid_offset"] == [0, 0]
+
+    buf = io.BytesIO()
+    Image.fromarray(base).save(buf, "PNG")
+    png = _cache(buf.getvalue())
+    for check in (jpegghost, blockiness):
+        assert "fallback_reason" in check.run(png, {"mode": "dct"})["meta"]
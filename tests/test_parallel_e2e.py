@@ -40,3 +40,71 @@ def test_parallel_stability(tmp_path):
                 if s0 is None and s1 is None:
                     continue
                 assert s0 == pytest.approx(s1, abs=1e-6)
+
+
+def test_cpu_budget_is_shared_and_caps_concurrency():
+    import threading
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    from idtamper.execution import CpuBudget, process_cpu_budget, run_dag
+
+    assert process_cpu_budget(ParallelConfig(cpu_budget=2)) is process_cpu_budget(ParallelConfig(cpu_budget=2))
+
+    budget = CpuBudget(2)
+    lock = threading.Lock()
+    state = {"now": 0, "peak": 0}
+
+    def work(_deps):
+        with budget.hold():
+            with lock:
+                state["now"] += 1
+                state["peak"] = max(state["peak"], state["now"])
+            time.sleep(0.02)
+            with lock:
+                state["now"] -= 1
+        return 1
+
+    nodes = {f"n{i}": (work, ()) for i in range(6)}
+    try:
+        # a separate, larger executor: only the tokens bound concurrency
+        with ThreadPoolExecutor(max_workers=6) as ex:
+            assert sum(run_dag(nodes, executor=ex).values()) == 6
+    finally:
+        budget.executor.shutdown()
+    assert state["peak"] <= 2
+    assert budget.in_use == 0
+
+
+def test_pipeline_checks_stay_within_cpu_budget(tmp_path):
+    import threading
+    import time
+    from idtamper.pipeline import analyze_image
+    from idtamper.registry import COST_LIGHT, CheckSpec, register_check, unregister_check
+
+    lock = threading.Lock()
+    state = {"now": 0, "peak": 0}
+
+    def sleeper(_cache, params=None):
+        with lock:
+            state["now"] += 1
+            state["peak"] = max(state["peak"], state["now"])
+        time.sleep(0.05)
+        with lock:
+            state["now"] -= 1
+        return {"score": 0.0, "map": None, "meta": {}}
+
+    names = [f"sleep{i}" for i in range(5)]
+    for n in names:
+        register_check(CheckSpec(n, sleeper, cost=COST_LIGHT))
+    try:
+        rep = analyze_image(
+            "samples/sample1.png",
+            str(tmp_path),
+            AnalyzerConfig(weights={n: 1.0 for n in names}, artifacts="none"),
+            ParallelConfig(cpu_budget=2),
+        )
+    finally:
+        for n in names:
+            unregister_check(n)
+    assert all(rep["per_check"][n]["score"] == 0.0 for n in names)
+    assert state["peak"] == 2
@@ -11,3 +11,153 @@ def test_analyze_image(tmp_path):
     assert rp.exists()
     data = json.loads(rp.read_text())
     assert data["image"] == "sample1.png"
+
+
+def test_analyze_image_bytes_in_memory(tmp_path, monkeypatch):
+    from idtamper.pipeline import analyze_image_bytes
+
+    data = Path("samples/sample1.png").read_bytes()
+    monkeypatch.chdir(tmp_path)
+    rep = analyze_image_bytes(data, AnalyzerConfig(), image_name="upload.png")
+    assert rep["image"] == "upload.png"
+    assert rep["artifacts"] == {}
+    assert list(tmp_path.iterdir()) == []
+
+    ref = analyze_image(str(Path(__file__).resolve().parent.parent / "samples/sample1.png"), str(tmp_path / "ref"), AnalyzerConfig())
+    assert rep["tamper_score"] == ref["tamper_score"]
+
+
+def test_artifact_policies(tmp_path):
+    none_dir = tmp_path / "none"
+    rep = analyze_image("samples/sample1.png", str(none_dir), AnalyzerConfig(artifacts="none"))
+    assert rep["artifacts"] == {} and "maps" not in rep
+    assert not none_dir.exists()
+
+    rep = analyze_image("samples/sample1.png", str(tmp_path / "maps"), AnalyzerConfig(artifacts="maps"))
+    assert rep["artifacts"] == {}
+    assert rep["maps"]["fused"] is not None and "ela95" in rep["maps"]["per_check"]
+
+    full = analyze_image("samples/sample1.png", str(tmp_path / "full"), AnalyzerConfig())
+    assert full["tamper_score"] == rep["tamper_score"]
+    assert (tmp_path / "full" / "overlay.png").exists()
+
+
+def test_lazy_heatmaps_render_on_request(tmp_path):
+    import io
+    from PIL import Image
+    from idtamper.visualize import render_artifact
+
+    rep = analyze_image("samples/sample1.png", str(tmp_path), AnalyzerConfig(heatmap_format="npz"))
+    assert (tmp_path / "maps.npz").exists()
+    assert not (tmp_path / "overlay.png").exists()
+    assert rep["artifacts"]["overlay"] == "overlay.png"
+    for name in rep["artifacts"].values():
+        png = render_artifact(tmp_path, name)
+        assert png is not None and Image.open(io.BytesIO(png)).size
+    ov = Image.open(io.BytesIO(render_artifact(tmp_path, "overlay.png")))
+    assert ov.size == Image.open("samples/sample1.png").size
+    assert render_artifact(tmp_path, "heatmap_nope.png") is None
+
+
+def test_cascade_skips_checks_once_verdict_is_fixed(tmp_path):
+    # exif dominates the fused score: after the cheap stage it fixes the verdict
+    weights = {"exif": 1.0, "ela95": 0.001, "noiseprintpp": 0.001, "mantranet": 0.001}
+    rep = analyze_image(
+        "samples/sample1.png", str(tmp_path), AnalyzerConfig(weights=weights, threshold=0.99, artifacts="none", cascade=True)
+    )
+    skipped = rep["cascade"]["skipped"]
+    assert "mantranet" in skipped and "noiseprintpp" in skipped
+    assert "exif" not in skipped and rep["per_check"]["exif"]["score"] is not None
+    assert rep["per_check"]["mantranet"]["details"]["skipped"] == skipped["mantranet"]
+    full = analyze_image("samples/sample1.png", str(tmp_path), AnalyzerConfig(weights=weights, threshold=0.99, artifacts="none"))
+    assert full["is_tampered"] == rep["is_tampered"]
+
+
+def test_plan_skips_zero_weight_and_disabled_checks(tmp_path):
+    weights = {"ela95": 0.5, "exif": 0.5, "copy_move": 0.0, "splicing": 0.2}
+    rep = analyze_image(
+        "samples/sample1.png",
+        str(tmp_path),
+        AnalyzerConfig(weights=weights, artifacts="none", disabled_checks=["splicing"]),
+    )
+    pc = rep["per_check"]
+    assert pc["copy_move"]["score"] is None and pc["copy_move"]["details"]["skipped"] == "zero weight"
+    assert pc["splicing"]["details"]["skipped"] == "disabled in profile"
+    assert pc["ela95"]["score"] is not None
+    assert {m["name"] for m in rep["metrics"]["checks"]} == {"ela95", "exif"}
+
+    forced = analyze_image(
+        "samples/sample1.png", str(tmp_path), AnalyzerConfig(weights=weights, artifacts="none", disabled_checks=["splicing"], force_checks=["copy_move"]),
+    )
+    assert "skipped" not in forced["per_check"]["copy_move"]["details"]
+    assert forced["tamper_score"] == rep["tamper_score"]
+
+
+def test_staged_batch_writes_on_io_thread(tmp_path, monkeypatch):
+    import threading
+    from idtamper import pipeline
+    from idtamper.execution import ParallelConfig
+
+    writers = []
+    real = pipeline._write_artifacts
+
+    def _spy(*args):
+        writers.append(threading.current_thread().name)
+        return real(*args)
+
+    monkeypatch.setattr(pipeline, "_write_artifacts", _spy)
+    imgs = ["samples/sample1.png", "samples/sample2.png", "samples/sample3.png"]
+    reps = pipeline.analyze_images(imgs, str(tmp_path), AnalyzerConfig(), ParallelConfig(prefetch=2, io_workers=1))
+    assert [r["image"] for r in reps] == ["sample1.png", "sample2.png", "sample3.png"]
+    assert all(name.startswith("idtamper-write") for name in writers) and len(writers) == 3
+    for stem in ("sample1", "sample2", "sample3"):
+        assert (tmp_path / stem / "report.json").exists()
+    ref = analyze_image("samples/sample2.png", str(tmp_path / "ref"), AnalyzerConfig())
+    assert reps[1]["tamper_score"] == ref["tamper_score"]
+
+
+def test_iter_analyze_images_streams_and_reports_failures(tmp_path):
+    import concurrent.futures as cf
+    import pytest
+    from idtamper.pipeline import analyze_images, iter_analyze_images
+
+    pulled = []
+
+    def paths():
+        for p in ["samples/sample1.png", str(tmp_path / "missing.png"), "samples/sample2.png"]:
+            pulled.append(p)
+            yield p
+
+    cfg = AnalyzerConfig(artifacts="none")
+    with cf.ThreadPoolExecutor(max_workers=1) as ex:
+        it = iter_analyze_images(paths(), str(tmp_path), cfg, executor=ex, window=1)
+        first = next(it)
+        assert len(pulled) == 1 and first[0] == "samples/sample1.png"
+        rest = dict(it)
+    assert isinstance(rest[str(tmp_path / "missing.png")], OSError)
+    assert rest["samples/sample2.png"]["image"] == "sample2.png"
+
+    out = dict(iter_analyze_images(paths(), str(tmp_path), cfg))
+    assert isinstance(out[str(tmp_path / "missing.png")], OSError) and "tamper_score" in out["samples/sample2.png"]
+    with pytest.raises(OSError):
+        analyze_images(["samples/sample1.png", str(tmp_path / "missing.png")], str(tmp_path), cfg)
+
+
+def test_large_jpeg_skips_full_decode_without_native_checks(tmp_path, monkeypatch):
+    import numpy as np
+    from PIL import Image
+    from idtamper.preproc import SourceImage
+
+    rng = np.random.RandomState(0)
+    small = (rng.rand(150, 200, 3) * 255).astype(np.uint8)
+    src = tmp_path / "big.jpg"
+    Image.fromarray(small).resize((3200, 2400), Image.BILINEAR).save(src, "JPEG", quality=90)
+
+    full_decodes = []
+    orig = SourceImage.full.fget
+    monkeypatch.setattr(SourceImage, "full", property(lambda self: full_decodes.append(1) or orig(self)))
+    cfg = AnalyzerConfig(weights={"ela95": 0.5, "exif": 0.5})
+    rep = analyze_image(str(src), str(tmp_path / "out"), cfg)
+    assert full_decodes == []
+    assert rep["metrics"]["image"]["width"] == 3200
+    assert Image.open(tmp_path / "out" / "overlay.png").size == (1600, 1200)
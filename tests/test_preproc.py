@@ -0,0 +1,92 @@
+import threading
+
+import numpy as np
+from PIL import Image
+
+from idtamper.checks import blockiness, copymove, ela, jpegghost, noise
+from idtamper.preproc import PreprocCache, PreprocOptions, SourceImage, build_preproc_cache
+
+
+def _image(h=300, w=400):
+    rng = np.random.RandomState(0)
+    return (rng.rand(h, w, 3) * 255).astype(np.uint8)
+
+
+def test_planes_are_built_on_first_access_only():
+    cache = build_preproc_cache(_image(), PreprocOptions(max_side=200))
+    assert cache.img.shape == (150, 200, 3)
+    assert "gray" not in cache.computed() and "pyramid" not in cache.computed()
+
+    pil = Image.fromarray(cache.img)
+    assert np.array_equal(cache.gray, np.asarray(pil.convert("L")))
+    assert np.array_equal(cache.ycbcr, np.asarray(pil.convert("YCbCr")))
+    assert np.allclose(cache.gray01, cache.gray.astype(np.float32) / 255.0)
+    assert cache.pyramid[0] is cache.gray and min(cache.pyramid[-1].shape) <= 32
+    assert cache.computed() == ["gray", "gray01", "pil", "pyramid", "ycbcr"]
+    assert "jpeg_q90_bytes" not in cache.computed()
+
+
+def test_concurrent_readers_share_one_computation():
+    cache = PreprocCache(img=_image(64, 64))
+    calls = []
+    barrier = threading.Barrier(8)
+
+    def build():
+        calls.append(1)
+        return object()
+
+    def read(out):
+        barrier.wait()
+        out.append(cache.memo("plane", build))
+
+    got = []
+    threads = [threading.Thread(target=read, args=(got,)) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1 and len({id(v) for v in got}) == 1
+
+
+def test_checks_match_on_cache_and_pil():
+    cache = build_preproc_cache(_image(), PreprocOptions())
+    for check in (blockiness, copymove, noise):
+        a = check.run(cache)
+        b = check.run(cache.pil)
+        assert abs(a["score"] - b["score"]) < 1e-5, check.__name__
+    assert cache.computed() == ["gray", "gray01", "pil"]
+
+
+def test_recompression_is_shared_between_ela_and_ghosts():
+    cache = build_preproc_cache(_image(120, 160), PreprocOptions())
+    ela.run(cache, {"quality": 95})
+    jpegghost.run(cache, {"qualities": [75, 85, 95]})
+    assert [k for k in cache.computed() if k.startswith("jpeg:")] == ["jpeg:75", "jpeg:85", "jpeg:95"]
+
+    r95 = cache.recompressed(95)
+    assert r95 is cache.recompressed(95) and not r95.diff.flags.writeable
+    expected = np.maximum.reduce([cache.recompressed(q).diff for q in (75, 85, 95)])
+    assert np.array_equal(cache.ghost_map([75, 85, 95]), expected)
+    # the PIL path computes the same values on a private cache
+    assert jpegghost.run(cache.pil)["score"] == jpegghost.run(cache)["score"]
+
+
+def _jpeg(path, w=3200, h=2400):
+    rng = np.random.RandomState(1)
+    small = (rng.rand(h // 16, w // 16, 3) * 255).astype(np.uint8)
+    Image.fromarray(small).resize((w, h), Image.BILINEAR).save(path, "JPEG", quality=90)
+    return path
+
+
+def test_large_jpeg_is_decoded_at_reduced_dct_scale(tmp_path):
+    source = SourceImage(str(_jpeg(tmp_path / "big.jpg")))
+    assert source.size == (3200, 2400) and source.computed() == []
+
+    cache = build_preproc_cache(source, PreprocOptions(max_side=1600))
+    assert cache.img.shape == (1200, 1600, 3)
+    assert source.reduced(1600).size == (1600, 1200)
+    assert "full" not in source.computed()
+    # native resolution only on request
+    assert cache.native.size == (3200, 2400) and "full" in source.computed()
+    ref = np.asarray(source.full.resize((1600, 1200), Image.BILINEAR), dtype=np.float32)
+    assert np.abs(cache.img.astype(np.float32) - ref).mean() < 3.0
@@ -13,3 +13,51 @@ def test_load_profile_from_path(tmp_path):
     p.write_text(json.dumps(data))
     prof = load_profile(str(p))
     assert prof["threshold"] == 0.5
+
+
+def test_compiled_profile_cached_until_mtime_changes(tmp_path):
+    import os
+    import pytest
+    from idtamper.profiles import get_compiled_profile, ModelNotFoundError
+
+    model = tmp_path / "m.onnx"
+    model.write_bytes(b"x")
+    p = tmp_path / "prof.json"
+    p.write_text(json.dumps({"checks": {"mantranet": {"enabled": True, "weight": 0.5, "threshold": 0.4}}}))
+    reg = {"mantranet": "m.onnx"}
+
+    c1 = get_compiled_profile(str(p), reg, tmp_path)
+    assert c1.model_paths == {"mantranet": str(model)}
+    assert c1.weights == {"mantranet": 0.5} and c1.thresholds == {"mantranet": 0.4}
+    assert get_compiled_profile(str(p), reg, tmp_path) is c1
+    assert c1.merged_params({"mantranet": {"top_percent": 2.0}})["mantranet"]["model_path"] == str(model)
+    assert "top_percent" not in c1.params["mantranet"]
+
+    p.write_text(json.dumps({"checks": {"mantranet": {"enabled": True, "weight": 0.7}}}))
+    os.utime(p, ns=(c1.mtime_ns + 10**9, c1.mtime_ns + 10**9))
+    c2 = get_compiled_profile(str(p), reg, tmp_path)
+    assert c2 is not c1 and c2.weights == {"mantranet": 0.7}
+
+    with pytest.raises(ModelNotFoundError):
+        get_compiled_profile(str(p), {"mantranet": "missing.onnx"}, tmp_path)
+
+
+def test_compile_maps_check_aliases_and_rejects_unknown(tmp_path):
+    import pytest
+    from idtamper.profiles import UnknownCheckError, compile_profile
+
+    p = tmp_path / "prof.json"
+    p.write_text(json.dumps({"checks": {
+        "ela": {"weight": 0.2, "threshold": 0.6},
+        "jpeg_ghost": {"enabled": True, "weight": 0.2},
+        "blockiness": {"enabled": False, "weight": 0.1},
+    }}))
+    comp = compile_profile(str(p))
+    assert comp.weights == {"ela95": 0.2, "jpeg_ghosts": 0.2, "jpeg_blockiness": 0.1}
+    assert comp.thresholds["ela95"] == 0.6
+    # missing "enabled" means enabled, everywhere
+    assert comp.enabled_checks == ["ela95", "jpeg_ghosts"] and comp.disabled_checks == ["jpeg_blockiness"]
+
+    p.write_text(json.dumps({"checks": {"no_such_check": {"weight": 1.0}}}))
+    with pytest.raises(UnknownCheckError):
+        compile_profile(str(p))
@@ -0,0 +1,45 @@
+import threading
+
+import pytest
+
+from idtamper.execution import ParallelConfig, run_dag
+from idtamper.pipeline import AnalyzerConfig, analyze_image
+from idtamper.registry import CheckSpec, register_check, unregister_check
+
+
+def test_run_dag_respects_dependencies_and_overlaps():
+    # both roots must be running at the same time to pass the barrier
+    barrier = threading.Barrier(2, timeout=5)
+
+    def root(value):
+        def fn(_deps):
+            barrier.wait()
+            return value
+        return fn
+
+    nodes = {
+        "a": (root(1), ()),
+        "b": (root(2), ()),
+        "c": (lambda d: d["a"] + d["b"], ("a", "b")),
+    }
+    assert run_dag(nodes)["c"] == 3
+
+    seq = {"a": (lambda d: 1, ()), "c": (lambda d: d["a"] + 1, ("a",))}
+    assert run_dag(seq, parallel=False) == {"a": 1, "c": 2}
+    with pytest.raises(ValueError):
+        run_dag({"x": (lambda d: 0, ("y",)), "y": (lambda d: 0, ("x",))}, parallel=False)
+
+
+def test_registered_check_runs_in_pipeline(tmp_path):
+    def _run(cache, params=None):
+        return {"score": float(cache.gray.mean() > -1), "map": None, "meta": {"ok": True}}
+
+    register_check(CheckSpec("always_one", _run, after=("ela95",)))
+    try:
+        rep = analyze_image(
+            "samples/sample1.png", str(tmp_path), AnalyzerConfig(weights={"always_one": 1.0, "ela95": 0.5}, artifacts="none"), ParallelConfig()
+        )
+    finally:
+        unregister_check("always_one")
+    assert rep["per_check"]["always_one"]["score"] == 1.0
+    assert "ela95" in rep["per_check"]
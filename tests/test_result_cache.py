@@ -0,0 +1,35 @@
+from pathlib import Path
+
+from idtamper.cache import ResultCache, cache_key, config_digest, image_digest
+from idtamper.pipeline import AnalyzerConfig, analyze_images
+
+
+def test_cache_tiers_and_lru(tmp_path):
+    c = ResultCache(max_entries=1, disk_dir=str(tmp_path / "cache"))
+    c.put("a", {"tamper_score": 0.1, "artifacts": {"overlay": "overlay.png"}})
+    c.put("b", {"tamper_score": 0.2, "artifacts": {}})
+    assert c.get("b")["cache"]["tier"] == "memory"
+    # "a" was evicted from memory but is still on disk
+    assert c.get("a")["tamper_score"] == 0.1
+    assert c.stats["disk_hits"] == 1
+    # artifacts requested but the run directory is unknown -> miss
+    assert c.get("a", with_artifacts=True) is None
+    assert ResultCache(max_entries=0, disk_dir=str(tmp_path / "cache")).get("b")["tamper_score"] == 0.2
+
+
+def test_config_digest_tracks_params():
+    d1 = config_digest(AnalyzerConfig(check_params={"ela95": {"quality": 95}}))
+    d2 = config_digest(AnalyzerConfig(check_params={"ela95": {"quality": 90}}))
+    assert d1 != d2
+    assert cache_key(image_digest(b"x"), d1) != cache_key(image_digest(b"x"), d2)
+
+
+def test_analyze_images_consults_cache(tmp_path):
+    cache = ResultCache()
+    img = str(Path("samples/sample1.png"))
+    r1 = analyze_images([img], str(tmp_path / "a"), AnalyzerConfig(), cache=cache)[0]
+    r2 = analyze_images([img], str(tmp_path / "b"), AnalyzerConfig(), cache=cache)[0]
+    assert cache.stats == {"memory_hits": 1, "disk_hits": 0, "misses": 1}
+    assert r2["tamper_score"] == r1["tamper_score"]
+    assert Path(r2["artifacts"]["overlay"]) == (tmp_path / "a" / "sample1" / "overlay.png").resolve()
+    assert not (tmp_path / "b" / "sample1").exists()
@@ -0,0 +1,49 @@
+import time
+
+from app.retention import RunRetention
+
+
+def _make_run(root, name, size=1000):
+    d = root / name
+    d.mkdir(parents=True)
+    (d / "report.json").write_text("{}")
+    (d / "heatmap_ela95.png").write_bytes(b"x" * size)
+    return d
+
+
+def test_budget_evicts_oldest_first(tmp_path):
+    runs = tmp_path / "runs"
+    runs.mkdir()
+    ret = RunRetention(runs, tmp_path / "idx.sqlite3", max_bytes=2500)
+    for i in range(3):
+        ret.register(_make_run(runs, f"r{i}"))
+    assert ret.usage()["runs"] == 3
+    freed = ret.sweep()
+    assert freed["evicted"] == 1
+    assert not (runs / "r0").exists() and (runs / "r2").exists()
+    assert ret.usage()["bytes"] <= 2500
+
+
+def test_strip_keeps_report_then_max_age_deletes(tmp_path):
+    runs = tmp_path / "runs"
+    runs.mkdir()
+    ret = RunRetention(runs, tmp_path / "idx.sqlite3", max_age_s=100, strip_after_s=10)
+    d = _make_run(runs, "r0")
+    ret.register(d)
+    ret.sweep(now=time.time() + 20)
+    assert (d / "report.json").exists() and not (d / "heatmap_ela95.png").exists()
+    ret.sweep(now=time.time() + 200)
+    assert not d.exists() and ret.usage()["runs"] == 0
+
+
+def test_rebuild_indexes_existing_runs(tmp_path):
+    runs = tmp_path / "runs"
+    _make_run(runs, "old")
+    _make_run(runs, "pending-job")
+    ret = RunRetention(runs, tmp_path / "idx.sqlite3", journal_mode="DELETE")
+    # no scan at construction: the sweeper thread rebuilds the index
+    assert ret.usage()["runs"] == 0 and ret.needs_rebuild()
+    assert ret.rebuild(exclude={"pending-job"}) == 1
+    assert ret.usage()["runs"] == 1
+    ret.register(tmp_path / "elsewhere")
+    assert ret.usage()["runs"] == 1
@@ -0,0 +1,40 @@
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+
+from idtamper import sessions
+from idtamper.execution import ParallelConfig, onnx_threads
+from app import main
+
+MODEL = Path(__file__).resolve().parent.parent / "models" / "noiseprint_pp.onnx"
+
+
+def test_registry_reuses_session_per_options():
+    sessions.clear()
+    s1 = sessions.get_session(str(MODEL))
+    s2 = sessions.get_session(str(MODEL), ParallelConfig())
+    s3 = sessions.get_session(str(MODEL), ParallelConfig(onnx_intra_threads=onnx_threads(ParallelConfig()) + 1))
+    assert s1 is s2
+    assert s3 is not s1
+    assert sessions.is_loaded(str(MODEL))
+    loaded = sessions.preload({"noiseprintpp": str(MODEL), "mantranet": "missing.onnx"})
+    assert loaded["noiseprintpp"] is s1 and loaded["mantranet"] is None
+
+
+def test_healthz_reflects_warmup_state(monkeypatch):
+    client = TestClient(main.app)
+    monkeypatch.setitem(main._WARMUP, "state", "warming")
+    assert client.get("/healthz").status_code == 503
+    monkeypatch.setitem(main._WARMUP, "state", "ready")
+    assert client.get("/healthz").json() == {"status": "ok"}
+
+
+def test_warmup_marks_not_ready_before_thread_runs(monkeypatch):
+    started = []
+    monkeypatch.setattr(main.threading, "Thread", lambda *a, **k: type("T", (), {"start": lambda self: started.append(1)})())
+    monkeypatch.setitem(main._WARMUP, "state", "idle")
+    monkeypatch.setattr(main, "_compiled", lambda name: None)
+    monkeypatch.delenv("IDS_WARMUP", raising=False)
+    main._start_warmup()
+    assert started and main._WARMUP["state"] == "warming"
+    assert TestClient(main.app).get("/healthz").status_code == 503
@@ -0,0 +1,37 @@
+import os
+
+import numpy as np
+import pytest
+
+from idtamper import shm
+from idtamper.execution import ParallelConfig
+from idtamper.pipeline import AnalyzerConfig, iter_analyze_arrays
+
+
+def _segments():
+    return {n for n in os.listdir("/dev/shm") if n.startswith("psm_")} if os.path.isdir("/dev/shm") else set()
+
+
+def test_shared_block_round_trip_and_unlink():
+    a = np.arange(12, dtype=np.float32).reshape(3, 4)
+    b = np.ones((5,), dtype=np.uint8)
+    block = shm.share({"a": a, "b": b})
+    with shm.open_arrays(block, unlink=True) as arrays:
+        assert np.array_equal(arrays["a"], a) and np.array_equal(arrays["b"], b)
+    with pytest.raises(FileNotFoundError):
+        shm.open_arrays(block).__enter__()
+
+
+def test_arrays_reach_process_workers_through_shared_memory(tmp_path):
+    rng = np.random.RandomState(3)
+    images = [(f"img{i}.png", (rng.rand(96, 128, 3) * 255).astype(np.uint8)) for i in range(3)]
+    before = _segments()
+    cfg = AnalyzerConfig(heatmap_format="npz")
+    pooled = dict(iter_analyze_arrays(images, str(tmp_path / "pool"), cfg, ParallelConfig(max_parallel_images=2)))
+    local = dict(iter_analyze_arrays(images, str(tmp_path / "local"), cfg))
+    for name, _ in images:
+        assert not isinstance(pooled[name], Exception), pooled[name]
+        assert pooled[name]["tamper_score"] == pytest.approx(local[name]["tamper_score"])
+        assert pooled[name]["artifacts"] == local[name]["artifacts"]
+        assert (tmp_path / "pool" / name[:-4] / "maps.npz").exists()
+    assert _segments() <= before
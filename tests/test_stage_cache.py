@@ -0,0 +1,57 @@
+import numpy as np
+from PIL import Image
+
+from idtamper.cache import StageCache, stage_cache
+from idtamper.pipeline import AnalyzerConfig, _preproc_input, analyze_images
+from idtamper.preproc import SourceImage
+
+
+def _jpeg(path, w=320, h=240):
+    rng = np.random.RandomState(0)
+    Image.fromarray((rng.rand(h, w, 3) * 255).astype(np.uint8)).save(path, "JPEG", quality=85)
+    return str(path)
+
+
+def _run(img, tmp_path, **params):
+    cfg = AnalyzerConfig(artifacts="none", check_params=params, stage_cache=str(tmp_path / "stages"))
+    return analyze_images([img], str(tmp_path / "out"), cfg)[0]
+
+
+def test_results_roundtrip_exactly_and_failures_are_not_stored(tmp_path):
+    c = StageCache(str(tmp_path))
+    hm = np.random.RandomState(0).rand(12, 16).astype(np.float32)
+    assert c.put_result("ab" * 32, {"name": "x", "score": 0.25, "map": hm, "meta": {"q": [75, 85]}})
+    res = c.get_result("ab" * 32)
+    assert res["score"] == 0.25 and res["meta"] == {"q": [75, 85]}
+    assert res["map"].dtype == np.float32 and np.array_equal(res["map"], hm)
+    assert not c.put_result("cd" * 32, {"name": "x", "score": None, "map": None, "meta": {"error": "no model"}})
+    assert c.get_result("cd" * 32) is None and c.stats == {"hits": 1, "misses": 1, "writes": 1}
+
+
+def test_rerun_recomputes_only_checks_whose_params_changed(tmp_path):
+    img = _jpeg(tmp_path / "a.jpg")
+    cold = _run(img, tmp_path)
+    # errors (e.g. an ONNX model that fails to load) are never stored
+    failed = {k for k, v in cold["per_check"].items() if "error" in v["details"]}
+    assert set(cold["metrics"]["stage_cache"]["hits"]) == set()
+
+    warm = _run(img, tmp_path)
+    assert set(warm["metrics"]["stage_cache"]["computed"]) == failed
+    assert warm["tamper_score"] == cold["tamper_score"] and warm["confidence"] == cold["confidence"]
+    assert warm["per_check"] == cold["per_check"]
+
+    changed = _run(img, tmp_path, ela95={"quality": 90})
+    assert set(changed["metrics"]["stage_cache"]["computed"]) == failed | {"ela95"}
+    assert changed["per_check"]["ela95"]["details"]["quality"] == 90
+
+
+def test_preproc_plane_is_read_back_instead_of_decoded(tmp_path):
+    img = _jpeg(tmp_path / "a.jpg", 2400, 1800)
+    stage = stage_cache(str(tmp_path / "stages"))
+    first = _preproc_input(SourceImage(img), stage)
+
+    source = SourceImage(img)
+    again = _preproc_input(source, stage)
+    assert np.array_equal(again.img, first.img) and again.img.shape == (1200, 1600, 3)
+    assert not any(k == "full" or k.startswith("reduced:") for k in source.computed())
+    assert again.native.size == (2400, 1800)
@@ -0,0 +1,29 @@
+from prometheus_client import REGISTRY
+
+from app.telemetry import observe_report
+
+
+def _val(name, labels=None):
+    return REGISTRY.get_sample_value(name, labels or {}) or 0.0
+
+
+def test_observe_report_bounds_labels_and_counts_errors():
+    before_ela = _val("idshield_check_duration_seconds_count", {"check": "ela95"})
+    before_other = _val("idshield_check_duration_seconds_count", {"check": "other"})
+    before_err = _val("idshield_check_errors_total", {"check": "exif"})
+    before_mp = _val("idshield_image_megapixels_count")
+    rep = {
+        "per_check": {"exif": {"score": None, "details": {"error": "boom"}}, "ela95": {"score": 0.1, "details": {}}},
+        "metrics": {
+            "total_ms": 12.0,
+            "artifacts_ms": 3.0,
+            "image": {"width": 100, "height": 50, "megapixels": 0.005},
+            "checks": [{"name": "ela95", "ms": 4.0}, {"name": "user-supplied-xyz", "ms": 1.0}],
+        },
+    }
+    observe_report(rep, image_bytes=1234)
+    assert _val("idshield_check_duration_seconds_count", {"check": "ela95"}) == before_ela + 1
+    assert _val("idshield_check_duration_seconds_count", {"check": "other"}) == before_other + 1
+    assert _val("idshield_check_errors_total", {"check": "exif"}) == before_err + 1
+    assert _val("idshield_image_megapixels_count") == before_mp + 1
+    assert REGISTRY.get_sample_value("idshield_check_duration_seconds_count", {"check": "user-supplied-xyz"}) is None
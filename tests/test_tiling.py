@@ -0,0 +1,65 @@
+from pathlib import Path
+
+import numpy as np
+import onnxruntime as ort
+from PIL import Image
+
+from idtamper.checks import noiseprintpp
+from idtamper.tiling import TileOptions, fit_to_memory, run_tiled
+
+MODEL = Path(__file__).resolve().parent.parent / "models" / "noiseprint_pp.onnx"
+
+
+class _Arg:
+    def __init__(self, name, shape):
+        self.name, self.shape = name, shape
+
+
+class MeanModel:
+    def __init__(self):
+        self.batches = []
+
+    def get_inputs(self):
+        return [_Arg("x", ["N", 3, "H", "W"])]
+
+    def run(self, names, feeds):
+        x = feeds["x"]
+        self.batches.append(x.shape)
+        return [x.mean(axis=1, keepdims=True)]
+
+
+def test_run_tiled_stitches_exactly_and_respects_memory_cap():
+    rng = np.random.RandomState(0)
+    x = rng.rand(3, 150, 230).astype(np.float32)
+    model = MeanModel()
+    out = run_tiled(model, x, TileOptions(tile=64, overlap=16, batch=4, max_mem_mb=0))
+    assert out.shape == (150, 230) and np.allclose(out, x.mean(axis=0), atol=1e-5)
+    assert all(b[0] <= 4 and b[2:] == (64, 64) for b in model.batches)
+
+    # 64*64 px * 1 KiB = 4 MiB per tile: a 9 MiB cap allows two tiles per run
+    assert fit_to_memory(TileOptions(tile=64, batch=8, max_mem_mb=9, bytes_per_px=1024)) == (64, 2)
+    assert fit_to_memory(TileOptions(tile=512, batch=4, max_mem_mb=64, bytes_per_px=1024)) == (256, 1)
+    small = MeanModel()
+    out = run_tiled(small, x[:, :40, :50], TileOptions(tile=64, overlap=16))
+    assert out.shape == (40, 50) and np.allclose(out, x[:, :40, :50].mean(axis=0), atol=1e-5)
+
+
+def test_noiseprintpp_tiled_matches_full_resolution():
+    sess = ort.InferenceSession(str(MODEL), providers=["CPUExecutionProvider"])
+    rng = np.random.RandomState(1)
+    img = Image.fromarray((rng.rand(200, 300, 3) * 255).astype("uint8"))
+    full = noiseprintpp.run(img, params={"session": sess, "tile": 0})
+    tiled = noiseprintpp.run(img, params={"session": sess, "tile": 128, "tile_overlap": 32, "tile_batch": 2})
+    assert tiled["meta"]["tiled"] == {"tile": 128, "overlap": 32}
+    assert tiled["map"].shape == full["map"].shape
+    assert np.corrcoef(tiled["map"].ravel(), full["map"].ravel())[0, 1] > 0.9
+
+
+def test_mantranet_tiled_keeps_native_resolution():
+    from idtamper.checks import mantranet
+
+    model = MeanModel()
+    img = Image.fromarray((np.random.RandomState(2).rand(100, 140, 3) * 255).astype("uint8"))
+    res = mantranet.run(img, params={"session": model, "input_size": [64, 64], "tiled": True, "tile_overlap": 8})
+    assert res["map"].shape == (100, 140) and res["meta"]["tiled"]
+    assert all(b[2:] == (64, 64) for b in model.batches)